@@ -5,30 +5,157 @@ This module provides the application factory pattern for creating Flask app inst
 Routes are organized in separate blueprint modules in the routes package.
 """
 
+from typing import Optional
 from flask import Flask
-from database import init_database, add_sample_data
+from database import init_database, add_sample_data, configure_book_cache, configure_storage
 from routes import register_blueprints
+from cli import register_commands
+from services.search_index import build_search_index
+from services.search_cache import configure_search_cache
+from services.payment_queue import configure_payment_queue, resume_payment_jobs
+from services.resilient_gateway import configure_payment_gateway
+from services.idempotency import configure_idempotency_store
+from services.payment_status import configure_payment_status_cache
+from instrumentation import configure_instrumentation
+from profiling import configure_profiler
+from http_cache import configure_response_cache
 
+# Default settings, overridable through create_app(config)
+DEFAULT_CONFIG = {
+    # Serve title/author searches from an in-memory n-gram index built at startup
+    'SEARCH_INDEX_IN_MEMORY': False,
+    # Search results cached until the catalog changes: distinct searches kept, and
+    # an estimated memory budget for them in bytes (SEARCH_CACHE_SIZE 0 disables it)
+    'SEARCH_CACHE_SIZE': 1024,
+    'SEARCH_CACHE_MAX_BYTES': 16 * 1024 * 1024,
+    # Book rows kept in the in-process get_book_by_id / get_book_by_isbn cache (0 disables it)
+    'BOOK_CACHE_SIZE': 2048,
+    # SQLite storage settings (see database.configure_storage)
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_BUSY_TIMEOUT_MS': 5000,
+    'SQLITE_MMAP_SIZE': 268435456,
+    'SQLITE_CACHE_SIZE_KB': 20000,
+    # Serialize this process's writes through a single writer connection
+    'SQLITE_WRITE_QUEUE': True,
+    # Upgrade older database schemas at startup; when off, run `flask migrate-db` instead
+    'SCHEMA_AUTO_MIGRATE': True,
+    # Maximum queued late fee payments talking to the gateway at once
+    'PAYMENT_QUEUE_CONCURRENCY': 20,
+    # Payment gateway deadline (seconds per attempt) and retries after the first attempt
+    'PAYMENT_GATEWAY_TIMEOUT': 2.0,
+    'PAYMENT_GATEWAY_MAX_RETRIES': 2,
+    # Gateway error rate that opens the circuit, and seconds before it is retried
+    'PAYMENT_GATEWAY_FAILURE_THRESHOLD': 0.5,
+    'PAYMENT_GATEWAY_RESET_TIMEOUT': 30.0,
+    # How long payment idempotency keys are honoured, and how many are cached in memory
+    'IDEMPOTENCY_RETENTION_HOURS': 24,
+    'IDEMPOTENCY_CACHE_SIZE': 1024,
+    # Seconds before a key whose request never finished (e.g. a crash) can be used again
+    'IDEMPOTENCY_CLAIM_LEASE_SECONDS': 300,
+    # Seconds a non-completed payment status is cached, cache size, and bulk lookup threads
+    'PAYMENT_STATUS_TTL': 30.0,
+    'PAYMENT_STATUS_CACHE_SIZE': 4096,
+    'PAYMENT_STATUS_WORKERS': 8,
+    # Record database helper and gateway call metrics (served at /metrics)
+    'METRICS_ENABLED': True,
+    # Add per-request X-DB-* / X-Gateway-* headers outside debug mode too
+    'METRICS_DEBUG_HEADERS': False,
+    # Profile requests with cProfile and keep the profiles of those slower than the
+    # threshold (listed at /admin/profiles); the sample rate bounds the overhead
+    'PROFILE_SLOW_REQUESTS': False,
+    'PROFILE_THRESHOLD_MS': 500,
+    'PROFILE_SAMPLE_RATE': 1.0,
+    'PROFILE_DIR': None,           # Defaults to library-profiles in the temp directory
+    'PROFILE_MAX_FILES': 50,
+    # Rendered /catalog, /search and /api/search responses kept per catalog version
+    # (0 disables the cache; ETags and 304 Not Modified still apply)
+    'RESPONSE_CACHE_SIZE': 256,
+}
 
-def create_app():
+
+def create_app(config: Optional[dict] = None):
     """
     Application factory function to create and configure Flask app.
     
+    Args:
+        config: Optional settings overriding DEFAULT_CONFIG
+    
     Returns:
         Flask: Configured Flask application instance
     """
     app = Flask(__name__)
     app.secret_key = "super secret key"
+    app.config.update(DEFAULT_CONFIG)
+    if config:
+        app.config.update(config)
+    
+    # Database helper and gateway call metrics (reset for each app)
+    configure_instrumentation(app.config['METRICS_ENABLED'])
+    
+    # Slow request profiling (off unless PROFILE_SLOW_REQUESTS is set)
+    configure_profiler(
+        enabled=app.config['PROFILE_SLOW_REQUESTS'],
+        threshold_ms=app.config['PROFILE_THRESHOLD_MS'],
+        sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+        directory=app.config['PROFILE_DIR'],
+        max_profiles=app.config['PROFILE_MAX_FILES']
+    )
     
     # Initialize the database
-    init_database()
+    configure_storage(
+        journal_mode=app.config['SQLITE_JOURNAL_MODE'],
+        synchronous=app.config['SQLITE_SYNCHRONOUS'],
+        busy_timeout_ms=app.config['SQLITE_BUSY_TIMEOUT_MS'],
+        mmap_size=app.config['SQLITE_MMAP_SIZE'],
+        cache_size_kb=app.config['SQLITE_CACHE_SIZE_KB'],
+        write_queue=app.config['SQLITE_WRITE_QUEUE']
+    )
+    configure_book_cache(app.config['BOOK_CACHE_SIZE'])
+    configure_response_cache(app.config['RESPONSE_CACHE_SIZE'])
+    configure_search_cache(app.config['SEARCH_CACHE_SIZE'], app.config['SEARCH_CACHE_MAX_BYTES'])
+    init_database(migrate=app.config['SCHEMA_AUTO_MIGRATE'])
     
     # Add sample data for testing and demonstration
     add_sample_data()
     
+    # Build the in-memory search index if enabled
+    if app.config['SEARCH_INDEX_IN_MEMORY']:
+        build_search_index()
+    
+    # Wrap the payment gateway in deadlines, retries and a circuit breaker
+    configure_payment_gateway(
+        timeout=app.config['PAYMENT_GATEWAY_TIMEOUT'],
+        max_retries=app.config['PAYMENT_GATEWAY_MAX_RETRIES'],
+        failure_threshold=app.config['PAYMENT_GATEWAY_FAILURE_THRESHOLD'],
+        reset_timeout=app.config['PAYMENT_GATEWAY_RESET_TIMEOUT']
+    )
+    
+    # Stored results for payment requests carrying idempotency keys
+    configure_idempotency_store(
+        retention_hours=app.config['IDEMPOTENCY_RETENTION_HOURS'],
+        cache_size=app.config['IDEMPOTENCY_CACHE_SIZE'],
+        claim_lease_seconds=app.config['IDEMPOTENCY_CLAIM_LEASE_SECONDS']
+    )
+    
+    # Cache for payment status lookups
+    configure_payment_status_cache(
+        ttl=app.config['PAYMENT_STATUS_TTL'],
+        maxsize=app.config['PAYMENT_STATUS_CACHE_SIZE'],
+        max_workers=app.config['PAYMENT_STATUS_WORKERS']
+    )
+    
+    # Set up the asynchronous payment queue (its thread starts on first use, or
+    # now if an earlier run left jobs unfinished)
+    configure_payment_queue(max_concurrency=app.config['PAYMENT_QUEUE_CONCURRENCY'])
+    resume_payment_jobs()
+    
     # Register all route blueprints
     register_blueprints(app)
     
+    # Register maintenance CLI commands
+    register_commands(app)
+    
     return app
 
 
@@ -0,0 +1,288 @@
+"""
+Benchmark Suite - Throughput and latency for the service layer and HTTP routes
+
+Seeds a synthetic library database, times the core service functions and
+the Flask routes (through the test client), and writes the results as JSON
+so runs from different commits can be compared.
+
+Usage:
+    python -m benchmarks.run_benchmarks --books 50000 --patrons 2000 --loans 100000 --output bench.json
+    python -m benchmarks.run_benchmarks --compare baseline.json --output bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+import database
+from http_cache import configure_response_cache
+from services.search_cache import configure_search_cache
+from services.library_service import (
+    add_book_to_catalog, borrow_book_by_patron, return_book_by_patron,
+    search_books_in_catalog, get_patron_status_report
+)
+
+WORDS = [
+    'river', 'night', 'garden', 'silent', 'empire', 'winter', 'shadow', 'golden', 'last', 'house',
+    'ocean', 'stone', 'fire', 'glass', 'secret', 'city', 'war', 'light', 'road', 'storm',
+]
+NAMES = [
+    'Smith', 'Garcia', 'Chen', 'Okafor', 'Novak', 'Singh', 'Rossi', 'Tanaka', 'Dubois', 'Larsen',
+    'Maria', 'James', 'Aiko', 'Omar', 'Elena', 'Kwame', 'Priya', 'Lukas', 'Sofia', 'Noah',
+]
+
+
+def seed_database(books: int, patrons: int, loans: int, seed: int = 327):
+    """
+    Fill the current DATABASE with a synthetic catalog and loan history.
+
+    Most loans are already returned; each patron also has up to three open
+    loans, some of them overdue. Availability is kept consistent with the
+    open loans.
+    """
+    rng = random.Random(seed)
+    database.init_database()
+    conn = database.get_db_connection(write=True)
+    try:
+        catalog = []
+        for i in range(books):
+            title = ' '.join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(1, 4)))
+            author = f'{rng.choice(NAMES)} {rng.choice(NAMES)}'
+            copies = rng.randint(1, 5)
+            catalog.append((title, author, f'{9000000000000 + i}', copies, copies))
+        conn.executemany('''
+            INSERT INTO books (title, author, isbn, total_copies, available_copies)
+            VALUES (?, ?, ?, ?, ?)
+        ''', catalog)
+
+        book_ids = [row[0] for row in conn.execute('SELECT id FROM books')]
+        patron_ids = [f'{100000 + i}' for i in range(patrons)]
+        now = datetime.now()
+
+        history = []
+        for _ in range(loans):
+            borrow_date = now - timedelta(days=rng.randint(30, 720))
+            due_date = borrow_date + timedelta(days=14)
+            return_date = borrow_date + timedelta(days=rng.randint(1, 30))
+            history.append((rng.choice(patron_ids), rng.choice(book_ids), database.to_epoch(borrow_date),
+                            database.to_epoch(due_date), database.to_epoch(return_date)))
+        conn.executemany('''
+            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date)
+            VALUES (?, ?, ?, ?, ?)
+        ''', history)
+
+        open_loans = []
+        for patron_id in patron_ids:
+            for book_id in rng.sample(book_ids, min(len(book_ids), rng.randint(0, 3))):
+                borrow_date = now - timedelta(days=rng.randint(0, 40))
+                open_loans.append((patron_id, book_id, database.to_epoch(borrow_date),
+                                   database.to_epoch(borrow_date + timedelta(days=14))))
+        for patron_id, book_id, borrow_date, due_date in open_loans:
+            reserved = conn.execute(
+                'UPDATE books SET available_copies = available_copies - 1 WHERE id = ? AND available_copies > 0',
+                (book_id,)
+            ).rowcount
+            if reserved:
+                conn.execute('''
+                    INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
+                    VALUES (?, ?, ?, ?)
+                ''', (patron_id, book_id, borrow_date, due_date))
+
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def measure(fn: Callable[[int], object], iterations: int) -> Dict:
+    """
+    Call fn(i) for i in range(iterations) and summarize the latencies.
+
+    Returns:
+        dict: {'iterations', 'throughput_ops', 'mean_ms', 'p50_ms', 'p99_ms', 'max_ms'}
+    """
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        fn(i)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'throughput_ops': round(iterations / elapsed, 1) if elapsed else None,
+        'mean_ms': round(sum(latencies) / len(latencies), 4),
+        'p50_ms': round(_percentile(latencies, 0.50), 4),
+        'p99_ms': round(_percentile(latencies, 0.99), 4),
+        'max_ms': round(latencies[-1], 4),
+    }
+
+
+def run_service_benchmarks(iterations: int, patrons: int, seed: int = 327) -> Dict[str, Dict]:
+    """
+    Time the service layer functions against the seeded database.
+    The search terms repeat, so the search cache is off to time actual searches.
+    """
+    rng = random.Random(seed)
+    configure_search_cache(0)
+    patron_ids = [f'{100000 + i}' for i in range(patrons)]
+    terms = [(word, 'title') for word in WORDS] + [(name.lower(), 'author') for name in NAMES]
+
+    # Dedicated patrons with no loans, each borrowing a copy that is still on
+    # the shelf, so borrows hit the success path (while iterations does not
+    # exceed the available copies)
+    copies = [book['id'] for book in database.get_all_books() for _ in range(book['available_copies'])]
+    rng.shuffle(copies)
+    loans = [(f'{900000 + i}', copies[i % len(copies)]) for i in range(iterations)]
+
+    results = {}
+    results['add_book_to_catalog'] = measure(
+        lambda i: add_book_to_catalog(f'Benchmark Book {i}', 'Bench Author', f'{8000000000000 + i}', 2),
+        iterations)
+    results['borrow_book_by_patron'] = measure(lambda i: borrow_book_by_patron(*loans[i]), iterations)
+    results['return_book_by_patron'] = measure(lambda i: return_book_by_patron(*loans[i]), iterations)
+    results['search_books_in_catalog'] = measure(
+        lambda i: search_books_in_catalog(*terms[i % len(terms)]), iterations)
+    results['get_patron_status_report'] = measure(
+        lambda i: get_patron_status_report(patron_ids[i % len(patron_ids)]), iterations)
+    return results
+
+def run_route_benchmarks(iterations: int, patrons: int) -> Dict[str, Dict]:
+    """
+    Time the Flask routes through the test client. The catalog does not
+    change between requests, so the response and search caches are off to
+    time the work behind each route rather than cache hits.
+    """
+    from app import create_app
+
+    client = create_app({'RESPONSE_CACHE_SIZE': 0, 'SEARCH_CACHE_SIZE': 0}).test_client()
+    patron_ids = [f'{100000 + i}' for i in range(patrons)]
+    book_ids = [book['id'] for book in database.get_books_page(100)]
+
+    def get(url_for_iteration):
+        def request(i):
+            response = client.get(url_for_iteration(i))
+            if response.status_code >= 500:
+                raise RuntimeError(f'{response.status_code} from {url_for_iteration(i)}')
+        return request
+
+    return {
+        'GET /catalog': measure(get(lambda i: '/catalog'), iterations),
+        'GET /api/books': measure(get(lambda i: '/api/books'), iterations),
+        'GET /search': measure(get(lambda i: f'/search?q={WORDS[i % len(WORDS)]}&type=title'), iterations),
+        'GET /api/search': measure(
+            get(lambda i: f'/api/search?q={NAMES[i % len(NAMES)].lower()}&type=author'), iterations),
+        'GET /api/late_fee': measure(
+            get(lambda i: f'/api/late_fee/{patron_ids[i % len(patron_ids)]}/{book_ids[i % len(book_ids)]}'),
+            iterations),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(books: int = 10000, patrons: int = 500, loans: int = 20000,
+                   iterations: int = 200, seed: int = 327, routes: bool = True) -> Dict:
+    """
+    Seed a temporary database and run the whole suite against it.
+    DATABASE is restored afterwards.
+
+    Returns:
+        dict: {'meta': Dict, 'results': Dict[str, Dict]}
+    """
+    original_database = database.DATABASE
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    try:
+        database.DATABASE = db_path
+        seed_database(books, patrons, loans, seed)
+        results = run_service_benchmarks(iterations, patrons, seed)
+        if routes:
+            results.update(run_route_benchmarks(iterations, patrons))
+    finally:
+        configure_search_cache()
+        configure_response_cache()
+        database.close_connection_pool()
+        database.DATABASE = original_database
+        os.close(db_fd)
+        os.remove(db_path)
+
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'books': books,
+            'patrons': patrons,
+            'loans': loans,
+            'iterations': iterations,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+def compare(baseline: Dict, current: Dict) -> List[str]:
+    """One line per benchmark with the p50/p99 change relative to the baseline."""
+    lines = []
+    for name, result in current['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            lines.append(f'{name:32} (new)')
+            continue
+        changes = []
+        for key in ('p50_ms', 'p99_ms'):
+            ratio = result[key] / base[key] if base[key] else float('inf')
+            changes.append(f'{key[:3]} {base[key]:.3f} -> {result[key]:.3f} ms ({ratio:.2f}x)')
+        lines.append(f'{name:32} ' + '  '.join(changes))
+    return lines
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--books', type=int, default=10000, help='catalog size')
+    parser.add_argument('--patrons', type=int, default=500, help='number of patrons')
+    parser.add_argument('--loans', type=int, default=20000, help='returned loans in the history')
+    parser.add_argument('--iterations', type=int, default=200, help='calls per benchmark')
+    parser.add_argument('--seed', type=int, default=327, help='random seed for the synthetic data')
+    parser.add_argument('--no-routes', action='store_true', help='skip the Flask route benchmarks')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to compare against')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.books, args.patrons, args.loans, args.iterations, args.seed,
+                            routes=not args.no_routes)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print('\n'.join(compare(baseline, report)))
+    else:
+        for name, result in report['results'].items():
+            print(f"{name:32} {result['throughput_ops']:>10} ops/s  "
+                  f"p50 {result['p50_ms']:.3f} ms  p99 {result['p99_ms']:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Cache Module - Thread-safe in-memory LRU cache shared by the app's caching layers
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """
+    Least-recently-used cache holding at most maxsize entries, and with
+    max_bytes set, entries whose sizeof() estimates add up to at most
+    max_bytes (a value larger than that on its own is not cached).
+    Counts hits and misses for the lookups made through get().
+    """
+
+    def __init__(self, maxsize: int = 1024, max_bytes: Optional[int] = None,
+                 sizeof: Optional[Callable[[Any], int]] = None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._data: 'OrderedDict[Hashable, Any]' = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """The cached value for key (marking it most recently used), or default."""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        """Cache value under key, evicting least recently used entries while over a limit."""
+        if self.maxsize <= 0:
+            return
+        size = 0
+        if self.max_bytes is not None:
+            size = self.sizeof(value) if self.sizeof else sys.getsizeof(value)
+            if size > self.max_bytes:
+                self.pop(key)
+                return
+        with self._lock:
+            self.bytes += size - self._sizes.pop(key, 0)
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if size:
+                self._sizes[key] = size
+            while len(self._data) > self.maxsize or (self.max_bytes is not None and self.bytes > self.max_bytes):
+                oldest, _ = self._data.popitem(last=False)
+                self.bytes -= self._sizes.pop(oldest, 0)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove key and return its value, or default if not cached."""
+        with self._lock:
+            self.bytes -= self._sizes.pop(key, 0)
+            return self._data.pop(key, default)
+
+    def clear(self):
+        """Remove every entry. Hit and miss counters are kept."""
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.bytes = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict:
+        """{'size', 'maxsize', 'hits', 'misses', 'hit_ratio'}, plus 'bytes' and 'max_bytes' with a byte budget"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            }
+            if self.max_bytes is not None:
+                stats.update(bytes=self.bytes, max_bytes=self.max_bytes)
+            return stats
@@ -0,0 +1,123 @@
+"""
+CLI Commands - Maintenance commands for the Library Management System
+
+Run with the Flask CLI, e.g. `flask --app app audit-queries`.
+"""
+
+import json
+import os
+import click
+from database import (
+    audit_query_plans, get_schema_version, migrate_timestamps, BULK_INSERT_BATCH_SIZE, MIGRATION_BATCH_SIZE
+)
+from services.import_service import import_books, IMPORT_FORMATS
+from services.idempotency import get_idempotency_store
+from services.billing_service import (
+    start_billing_run, run_nightly_billing, BILLING_CONCURRENCY, BILLING_RATE_LIMIT
+)
+
+
+@click.command('audit-queries')
+def audit_queries_command():
+    """Run EXPLAIN QUERY PLAN on the database queries and flag table scans."""
+    results = audit_query_plans()
+    flagged = 0
+    for result in results:
+        status = 'SCAN' if result['scans'] else 'ok'
+        click.echo(f"[{status}] {result['query']}")
+        for detail in result['plan']:
+            click.echo(f"    {detail}")
+        flagged += bool(result['scans'])
+
+    if flagged:
+        click.echo(f"{flagged} quer{'y' if flagged == 1 else 'ies'} scan a whole table or index.")
+        raise SystemExit(1)
+    click.echo("No table scans found.")
+
+
+@click.command('import-books')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(IMPORT_FORMATS),
+              help='File format (default: from the file extension).')
+@click.option('--batch-size', default=BULK_INSERT_BATCH_SIZE, show_default=True,
+              help='Rows per executemany batch.')
+@click.option('--errors', 'errors_path', type=click.Path(dir_okay=False),
+              help='Write the per-row error report to this JSON file.')
+def import_books_command(path, file_format, batch_size, errors_path):
+    """Bulk import books from a CSV or JSONL file."""
+    if file_format is None:
+        file_format = 'jsonl' if os.path.splitext(path)[1].lower() in ('.jsonl', '.ndjson') else 'csv'
+
+    with open(path, newline='', encoding='utf-8') as stream:
+        result = import_books(stream, file_format, batch_size)
+
+    click.echo(result['message'])
+    if errors_path:
+        with open(errors_path, 'w') as f:
+            json.dump(result['errors'], f, indent=2)
+    else:
+        for error in result['errors']:
+            click.echo(f"  row {error['row']} ({error['isbn'] or '-'}): {error['message']}")
+
+    if not result['success']:
+        raise SystemExit(1)
+
+
+@click.command('purge-idempotency-keys')
+def purge_idempotency_keys_command():
+    """Delete payment idempotency keys older than the retention window."""
+    deleted = get_idempotency_store().purge_expired()
+    if deleted is None:
+        click.echo("Database error occurred while purging idempotency keys.")
+        raise SystemExit(1)
+    click.echo(f"Deleted {deleted} expired idempotency key(s).")
+
+
+@click.command('bill-late-fees')
+@click.option('--concurrency', default=BILLING_CONCURRENCY, show_default=True,
+              help='Patrons charged at once.')
+@click.option('--rate-limit', default=BILLING_RATE_LIMIT, show_default=True,
+              help='Maximum gateway charges per second (0 for no limit).')
+@click.option('--resume', 'resume_run_id', help='Resume an interrupted billing run by ID.')
+def bill_late_fees_command(concurrency, rate_limit, resume_run_id):
+    """Charge every patron with overdue loans for their late fees."""
+    if resume_run_id is None:
+        resume_run_id, error = start_billing_run()
+        if error:
+            click.echo(error)
+            raise SystemExit(1)
+        click.echo(f"Started billing run {resume_run_id}.")
+
+    try:
+        result = run_nightly_billing(concurrency, rate_limit, resume_run_id)
+    except KeyboardInterrupt:
+        click.echo(f"Interrupted. Resume with --resume {resume_run_id}")
+        raise SystemExit(130)
+
+    click.echo(result['message'])
+    if not result['success'] or result['failed']:
+        raise SystemExit(1)
+
+
+@click.command('migrate-db')
+@click.option('--batch-size', default=MIGRATION_BATCH_SIZE, show_default=True,
+              help='Rows copied per transaction.')
+def migrate_db_command(batch_size):
+    """Upgrade the database schema while the app keeps serving requests."""
+    click.echo(f"Schema version {get_schema_version()}.")
+    migrated = migrate_timestamps(
+        batch_size, progress=lambda copied, total: click.echo(f"  {copied}/{total} borrow records copied")
+    )
+    if migrated is None:
+        click.echo("Database error occurred during the migration; run it again to resume.")
+        raise SystemExit(1)
+    click.echo(f"Migrated {migrated} borrow record(s). Schema version {get_schema_version()}.")
+
+
+def register_commands(app):
+    """Register all CLI commands with the Flask app."""
+    app.cli.add_command(audit_queries_command)
+    app.cli.add_command(import_books_command)
+    app.cli.add_command(purge_idempotency_keys_command)
+    app.cli.add_command(bill_late_fees_command)
+    app.cli.add_command(migrate_db_command)
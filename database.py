@@ -3,228 +3,1793 @@ Database module for Library Management System
 Handles all database operations and connections
 """
 
+import calendar
 import sqlite3
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from cache import LRUCache
+from instrumentation import instrumented, record_cache_hit
 
 # Database configuration
 DATABASE = 'library.db'
 
-def get_db_connection():
-    """Get a database connection."""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row  # This enables column access by name
-    return conn
+BULK_INSERT_BATCH_SIZE = 5000
+
+BOOK_CACHE_SIZE = 2048  # Book rows kept by the get_book_by_id / get_book_by_isbn cache (0 disables it)
+
+# Schema versions, kept in PRAGMA user_version:
+#   0 - borrow_records dates stored as ISO-8601 text
+#   2 - borrow_records dates stored as INTEGER seconds since the epoch
+# Version 0 databases are upgraded in place by migrate_timestamps().
+SCHEMA_VERSION = 2
+EPOCH_TIMESTAMPS_VERSION = 2
+MIGRATION_BATCH_SIZE = 5000  # Rows copied per transaction by migrate_timestamps()
+
+EXPORT_FETCH_SIZE = 500  # Rows fetched at a time by the streaming iter_* helpers
+
+# Connection pool configuration
+POOL_SIZE = 5  # Maximum number of idle connections kept open per database
+CONNECTION_PRAGMAS = {
+    'temp_store': 'MEMORY',
+    # WAL lets readers run alongside the writer; NORMAL only syncs at checkpoints in WAL mode
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,        # ms to wait for another process's write lock
+    'mmap_size': 268435456,      # 256 MiB of the file read through memory mapping
+    'cache_size': -20000,        # Page cache per connection, in KiB when negative
+}
+WRITE_QUEUE = True  # Serialize this process's writes through a single writer connection
+
+
+class PooledConnection:
+    """
+    Wrapper around a pooled sqlite3 connection.
+    Behaves like the underlying connection, but close() hands it back to the pool.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', conn: sqlite3.Connection):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError('Cannot operate on a closed connection.')
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._conn.__exit__(exc_type, exc_value, traceback)
+
+    def close(self):
+        """Return the connection to the pool instead of closing it."""
+        if self._conn is not None:
+            self._pool.release(self._conn)
+            self._conn = None
+
+
+class ConnectionPool:
+    """
+    Pool of SQLite connections for a single database file.
+
+    Connections are created lazily, have CONNECTION_PRAGMAS applied once when
+    opened, and are health-checked before being handed out again. At most
+    `size` idle connections are kept; extra connections are closed on release.
+    """
+
+    def __init__(self, database: str, size: int = POOL_SIZE, pragmas: Optional[Dict] = None,
+                 write_queue: bool = False):
+        self.database = database
+        self.size = size
+        self.pragmas = dict(CONNECTION_PRAGMAS if pragmas is None else pragmas)
+        self._idle: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.writer = WriteQueue(self) if write_queue else None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.database, check_same_thread=False)
+        conn.row_factory = sqlite3.Row  # This enables column access by name
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    @staticmethod
+    def _is_healthy(conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self) -> PooledConnection:
+        """Take an idle connection from the pool, or open a new one."""
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                return PooledConnection(self, self._connect())
+            if self._is_healthy(conn):
+                return PooledConnection(self, conn)
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def release(self, conn: sqlite3.Connection):
+        """Return a connection to the pool, discarding any uncommitted work."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            return
+        with self._lock:
+            if not self._closed and len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def acquire_writer(self) -> PooledConnection:
+        """Take the writer connection (waiting in line for it), or any connection without a write queue."""
+        if self.writer is None:
+            return self.acquire()
+        return self.writer.acquire()
+
+    def idle_count(self) -> int:
+        """Number of idle connections currently held by the pool."""
+        with self._lock:
+            return len(self._idle)
+
+    def close(self):
+        """Close all idle connections. Connections still in use are closed on release."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._closed = True
+        for conn in idle:
+            conn.close()
+        if self.writer is not None:
+            self.writer.close()
+
+
+class WriteQueue:
+    """
+    Single writer connection handed to one caller at a time, in arrival order.
+
+    Writers in this process wait in line here instead of contending for
+    SQLite's write lock (and failing with 'database is locked'); in WAL mode
+    readers on the pool's other connections are not blocked meanwhile. A
+    thread must release the writer before asking for it again.
+    """
+
+    def __init__(self, pool: ConnectionPool):
+        self._pool = pool
+        self._conn: Optional[sqlite3.Connection] = None
+        self._owner: Optional[int] = None
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def acquire(self) -> PooledConnection:
+        me = threading.get_ident()
+        with self._lock:
+            if self._owner == me:
+                raise RuntimeError('This thread already holds the writer connection.')
+            if self._owner is None and not self._waiters:
+                self._owner = me
+                turn = None
+            else:
+                turn = threading.Event()
+                self._waiters.append((me, turn))
+        if turn is not None and not turn.wait(self._timeout()):
+            with self._lock:
+                # The turn may have been handed over just as the wait timed out
+                if not turn.is_set():
+                    self._waiters.remove((me, turn))
+                    raise sqlite3.OperationalError('database is locked (timed out waiting for the writer connection)')
+
+        # Only the owner touches the connection from here on
+        try:
+            if self._conn is None or not ConnectionPool._is_healthy(self._conn):
+                self._conn = None
+                self._conn = self._pool._connect()
+        except BaseException:
+            with self._lock:
+                self._hand_off()
+            raise
+        return PooledConnection(self, self._conn)
+
+    def _timeout(self) -> float:
+        """Seconds to wait in line for the writer: the busy_timeout SQLite would wait for its lock."""
+        return max(int(self._pool.pragmas.get('busy_timeout', 5000)), 0) / 1000
+
+    def _hand_off(self):
+        """Pass ownership to the next caller in line, if any. Call with _lock held."""
+        if self._waiters:
+            self._owner, turn = self._waiters.popleft()
+            turn.set()
+        else:
+            self._owner = None
+
+    def release(self, conn: sqlite3.Connection):
+        """Hand the writer connection to the next caller in line, discarding uncommitted work."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            self._conn = None
+        with self._lock:
+            if self._closed and self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._hand_off()
+
+    def close(self):
+        """Close the writer connection once it is no longer in use."""
+        with self._lock:
+            self._closed = True
+            if self._owner is None and self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+def get_connection_pool() -> ConnectionPool:
+    """Get the connection pool for the current DATABASE, replacing it if DATABASE changed."""
+    global _pool
+    pool = _pool
+    if pool is None or pool.database != DATABASE:
+        with _pool_lock:
+            if _pool is None or _pool.database != DATABASE:
+                if _pool is not None:
+                    _pool.close()
+                _pool = ConnectionPool(DATABASE, POOL_SIZE, write_queue=WRITE_QUEUE)
+            pool = _pool
+    return pool
+
+def close_connection_pool():
+    """Close the active connection pool, e.g. on shutdown or before deleting the database file."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+    # The file may be deleted and its path reused, so cached rows must go too
+    _book_cache.clear()
+
+def get_db_connection(write: bool = False):
+    """
+    Get a pooled database connection. Calling close() returns it to the pool.
+    Pass write=True for connections that will modify the database; they queue
+    for the single writer connection (see WriteQueue).
+    """
+    pool = get_connection_pool()
+    return pool.acquire_writer() if write else pool.acquire()
+
+def configure_storage(journal_mode: str = 'WAL', synchronous: str = 'NORMAL', busy_timeout_ms: int = 5000,
+                      mmap_size: int = 268435456, cache_size_kb: int = 20000, write_queue: bool = True):
+    """
+    Set the SQLite pragmas applied to new connections and whether writes go
+    through the write queue. The current pool is closed so the settings
+    apply to every connection opened from now on.
+    """
+    global WRITE_QUEUE
+    CONNECTION_PRAGMAS.update({
+        'journal_mode': journal_mode,
+        'synchronous': synchronous,
+        'busy_timeout': int(busy_timeout_ms),
+        'mmap_size': int(mmap_size),
+        'cache_size': -int(cache_size_kb),
+    })
+    WRITE_QUEUE = write_queue
+    close_connection_pool()
+
+
+class BookCache:
+    """
+    Read-through LRU cache of book rows by ID, and of ISBN -> ID (a book's
+    ISBN never changes). Tied to the current DATABASE and emptied when it
+    changes. Writers that change a book row call invalidate() after
+    committing; a generation counter keeps a read that raced with such a
+    write from caching the old row. The cache is per process, so writes made
+    by other processes are not seen until the row is evicted.
+    """
+
+    def __init__(self, size: int = BOOK_CACHE_SIZE):
+        self.rows = LRUCache(size)
+        self.isbn_ids = LRUCache(size)
+        self.database = DATABASE
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _check_database(self):
+        if self.database != DATABASE:
+            self.clear()
+            self.database = DATABASE
+
+    @property
+    def generation(self) -> int:
+        """Take before reading a row from the database and pass to put()."""
+        return self._generation
+
+    def get(self, book_id: int) -> Optional[Dict]:
+        self._check_database()
+        book = self.rows.get(book_id)
+        return dict(book) if book is not None else None
+
+    def get_id(self, isbn: str) -> Optional[int]:
+        self._check_database()
+        return self.isbn_ids.get(isbn)
 
-def init_database():
-    """Initialize the database with required tables."""
+    def put(self, book: Dict, generation: int):
+        """Cache a row read at the given generation, unless a write happened since."""
+        with self._lock:
+            if generation != self._generation or self.database != DATABASE:
+                return
+            self.rows.put(book['id'], dict(book))
+            self.isbn_ids.put(book['isbn'], book['id'])
+
+    def invalidate(self, book_id: int):
+        """Drop a book's row after it was changed."""
+        with self._lock:
+            self._generation += 1
+            self.rows.pop(book_id)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.rows.clear()
+            self.isbn_ids.clear()
+
+    def stats(self) -> Dict:
+        """Hit/miss counters of the row cache ('books') and the ISBN lookup cache ('isbns')."""
+        return {'books': self.rows.stats(), 'isbns': self.isbn_ids.stats()}
+
+
+_book_cache = BookCache(BOOK_CACHE_SIZE)
+
+def configure_book_cache(size: int = BOOK_CACHE_SIZE) -> BookCache:
+    """Replace the book cache with an empty one holding up to size rows (0 disables caching)."""
+    global _book_cache
+    _book_cache = BookCache(size)
+    return _book_cache
+
+def get_book_cache_stats() -> Dict:
+    """Hit/miss counters and size of the book cache."""
+    return _book_cache.stats()
+
+
+class CatalogVersion:
+    """
+    Counter bumped after every committed write that changes what the catalog
+    and search pages show (a book added, its availability changed), with the
+    time of the last bump. Never reset: switching DATABASE bumps it too, so a
+    version always identifies one state of one database. Like the book cache
+    it is per process and does not see writes made by other processes.
+    """
+
+    def __init__(self):
+        self.database = DATABASE
+        self._version = 1
+        self._last_modified = datetime.now(timezone.utc)
+        self._lock = threading.Lock()
+
+    def bump(self):
+        with self._lock:
+            self._version += 1
+            self._last_modified = datetime.now(timezone.utc)
+
+    def current(self) -> Tuple[int, datetime]:
+        """(version, last modified as an aware UTC datetime). Read before reading the catalog."""
+        if self.database != DATABASE:
+            with self._lock:
+                if self.database != DATABASE:
+                    self.database = DATABASE
+                    self._version += 1
+                    self._last_modified = datetime.now(timezone.utc)
+        return self._version, self._last_modified
+
+
+_catalog_version = CatalogVersion()
+
+def get_catalog_version() -> Tuple[int, datetime]:
+    """The current catalog version and the time it last changed. See CatalogVersion."""
+    return _catalog_version.current()
+
+def bump_catalog_version():
+    """Mark the catalog as changed; called by the writers below after they commit."""
+    _catalog_version.bump()
+
+# borrow_records timestamps. Dates are naive local datetimes in Python and
+# are stored as the epoch seconds of that wall-clock time read as UTC, which
+# is also how SQLite's strftime('%s') reads the ISO text of older databases.
+
+_EPOCH = datetime(1970, 1, 1)
+
+def to_epoch(value: datetime) -> int:
+    """Stored form of a borrow_records date (whole seconds; microseconds are dropped)."""
+    return calendar.timegm(value.timetuple())
+
+def parse_timestamp(value: Union[int, str, None]) -> Optional[datetime]:
+    """
+    A borrow_records date as a datetime. Accepts epoch seconds and the
+    ISO-8601 text of rows not migrated yet.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return _EPOCH + timedelta(seconds=value)
+
+def epoch_sql(column: str) -> str:
+    """SQL expression reading column as epoch seconds, whichever form it is stored in."""
+    return (f"CASE typeof({column}) WHEN 'text' "
+            f"THEN CAST(strftime('%s', {column}) AS INTEGER) ELSE {column} END")
+
+def get_schema_version(conn=None) -> int:
+    """The schema version of the current database (PRAGMA user_version)."""
+    if conn is not None:
+        return conn.execute('PRAGMA user_version').fetchone()[0]
     conn = get_db_connection()
+    try:
+        return get_schema_version(conn)
+    finally:
+        conn.close()
+
+def _timestamp_encoder(conn) -> Callable[[datetime], Union[int, str]]:
+    """How dates are written to borrow_records in this database's schema version."""
+    if get_schema_version(conn) >= EPOCH_TIMESTAMPS_VERSION:
+        return to_epoch
+    return datetime.isoformat
+
+# SQL for the hot-path helpers. Kept at module level so audit_query_plans()
+# checks exactly the statements the helpers run.
+
+# Loan dates as epoch seconds. Overdue filters use the same expression as
+# idx_borrow_records_overdue so that index serves them.
+SQL_DUE_EPOCH = epoch_sql('br.due_date')
+SQL_RETURN_EPOCH = epoch_sql('br.return_date')
+
+SQL_ALL_BOOKS = 'SELECT * FROM books ORDER BY title'
+
+SQL_BOOKS_FIRST_PAGE = 'SELECT * FROM books ORDER BY title, id LIMIT ?'
+
+SQL_BOOKS_PAGE_AFTER = '''
+    SELECT * FROM books
+    WHERE (title, id) > (?, ?)
+    ORDER BY title, id
+    LIMIT ?
+'''
+
+SQL_BOOK_BY_ID = 'SELECT * FROM books WHERE id = ?'
+
+SQL_INSERT_BOOK = '''
+    INSERT INTO books (title, author, isbn, total_copies, available_copies)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+SQL_BOOK_BY_ISBN = 'SELECT * FROM books WHERE isbn = ?'
+
+SQL_PATRON_BORROWED_BOOKS = f'''
+    SELECT br.*, b.title, b.author, {SQL_DUE_EPOCH} < ? AS is_overdue
+    FROM borrow_records br 
+    JOIN books b ON br.book_id = b.id 
+    WHERE br.patron_id = ? AND br.return_date IS NULL
+    ORDER BY br.borrow_date, br.id
+'''
+
+SQL_PATRON_BORROW_COUNT = '''
+    SELECT COUNT(*) as count FROM borrow_records 
+    WHERE patron_id = ? AND return_date IS NULL
+'''
+
+SQL_PATRON_BORROW_HISTORY = f'''
+    SELECT br.*, b.title, b.author,
+           CASE WHEN br.return_date IS NULL THEN {SQL_DUE_EPOCH} < ?
+                ELSE {SQL_RETURN_EPOCH} > {SQL_DUE_EPOCH} END AS is_overdue
+    FROM borrow_records br
+    JOIN books b ON br.book_id = b.id
+    WHERE br.patron_id = ?
+    ORDER BY br.borrow_date DESC, br.id DESC
+'''
+
+SQL_UPDATE_AVAILABILITY = 'UPDATE books SET available_copies = available_copies + ? WHERE id = ?'
+
+SQL_RESERVE_COPY = '''
+    UPDATE books SET available_copies = available_copies - 1
+    WHERE id = ? AND available_copies > 0
+'''
+
+SQL_PATRON_OPEN_LOANS = '''
+    SELECT COUNT(*) as count, COALESCE(SUM(book_id = ?), 0) as same_book
+    FROM borrow_records
+    WHERE patron_id = ? AND return_date IS NULL
+'''
+
+SQL_OPEN_LOAN_DUE_DATE = '''
+    SELECT due_date FROM borrow_records
+    WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
+    ORDER BY borrow_date
+    LIMIT 1
+'''
+
+SQL_INSERT_BORROW_RECORD = '''
+    INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
+    VALUES (?, ?, ?, ?)
+'''
+
+SQL_CLOSE_LOAN = '''
+    UPDATE borrow_records 
+    SET return_date = ? 
+    WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
+'''
+
+# Full-table exports, in primary key order
+SQL_EXPORT_BOOKS = 'SELECT id, title, author, isbn, total_copies, available_copies FROM books ORDER BY id'
+
+SQL_EXPORT_OPEN_LOANS = '''
+    SELECT id AS loan_id, patron_id, book_id, borrow_date, due_date FROM borrow_records
+    WHERE return_date IS NULL
+    ORDER BY id
+'''
+
+SQL_EXPORT_BORROW_HISTORY = '''
+    SELECT id AS loan_id, patron_id, book_id, borrow_date, due_date, return_date FROM borrow_records
+    ORDER BY id
+'''
+
+SQL_OPEN_LOANS = f'''
+    SELECT id, patron_id, book_id, {epoch_sql('due_date')} AS due_date FROM borrow_records
+    WHERE return_date IS NULL
+    ORDER BY patron_id, borrow_date
+'''
+
+# Overdue loans with whole days overdue, most overdue first. The first
+# parameter is the current time in epoch seconds, the last the same time
+# as the overdue cutoff.
+SQL_OVERDUE_SELECT = f'''
+    SELECT br.id AS loan_id, br.patron_id, br.book_id, b.title, b.author,
+           br.borrow_date, br.due_date, (? - {SQL_DUE_EPOCH}) / 86400 AS days_overdue
+    FROM borrow_records br
+    JOIN books b ON br.book_id = b.id
+'''
+
+SQL_OVERDUE_LOANS = SQL_OVERDUE_SELECT + f'''
+    WHERE br.return_date IS NULL AND {SQL_DUE_EPOCH} < ?
+    ORDER BY {SQL_DUE_EPOCH}, br.id
+'''
+
+SQL_PATRON_OVERDUE_LOANS = SQL_OVERDUE_SELECT + f'''
+    WHERE br.patron_id = ? AND br.return_date IS NULL AND {SQL_DUE_EPOCH} < ?
+    ORDER BY {SQL_DUE_EPOCH}, br.id
+'''
+
+SQL_BOOK_OVERDUE_LOANS = SQL_OVERDUE_SELECT + f'''
+    WHERE br.book_id = ? AND br.return_date IS NULL AND {SQL_DUE_EPOCH} < ?
+    ORDER BY {SQL_DUE_EPOCH}, br.id
+'''
+
+# Late fees already paid and not refunded, per open loan: one patron's open
+# loans (earliest first, as in SQL_PATRON_BORROWED_BOOKS), or every open loan
+# that has payments
+SQL_PATRON_OPEN_LOAN_PAYMENTS = '''
+    SELECT br.id AS loan_id, br.book_id, COALESCE(SUM(a.amount - a.refunded_amount), 0) AS paid
+    FROM borrow_records br
+    LEFT JOIN payment_allocations a ON a.loan_id = br.id
+    WHERE br.patron_id = ? AND br.return_date IS NULL
+    GROUP BY br.id
+    ORDER BY br.borrow_date, br.id
+'''
+
+SQL_OPEN_LOAN_PAYMENTS = '''
+    SELECT a.loan_id, SUM(a.amount - a.refunded_amount) AS paid
+    FROM payment_allocations a
+    JOIN borrow_records br ON br.id = a.loan_id
+    WHERE br.return_date IS NULL
+    GROUP BY a.loan_id
+'''
+
+# Title/author substring search through the trigram FTS5 index. The MATCH
+# argument is a quoted phrase, which the trigram tokenizer matches as a
+# case-insensitive substring.
+SQL_SEARCH_TITLE = '''
+    SELECT b.* FROM books b
+    WHERE b.id IN (SELECT rowid FROM books_fts WHERE title MATCH ?)
+    ORDER BY b.title
+'''
+
+SQL_SEARCH_AUTHOR = '''
+    SELECT b.* FROM books b
+    WHERE b.id IN (SELECT rowid FROM books_fts WHERE author MATCH ?)
+    ORDER BY b.title
+'''
+
+# Queries checked by audit_query_plans(), and the ones whose scans are expected:
+# the full catalog listing, the LIMITed first page in index order, the
+# library-wide open loans list, and the full-table exports
+AUDITED_QUERIES = {
+    'get_all_books': SQL_ALL_BOOKS,
+    'get_books_page:first': SQL_BOOKS_FIRST_PAGE,
+    'get_books_page:after': SQL_BOOKS_PAGE_AFTER,
+    'get_book_by_id': SQL_BOOK_BY_ID,
+    'get_book_by_isbn': SQL_BOOK_BY_ISBN,
+    'get_patron_borrowed_books': SQL_PATRON_BORROWED_BOOKS,
+    'get_patron_borrow_count': SQL_PATRON_BORROW_COUNT,
+    'get_patron_borrow_history': SQL_PATRON_BORROW_HISTORY,
+    'update_book_availability': SQL_UPDATE_AVAILABILITY,
+    'update_borrow_record_return_date': SQL_CLOSE_LOAN,
+    'borrow_book_transaction:reserve_copy': SQL_RESERVE_COPY,
+    'borrow_book_transaction:open_loans': SQL_PATRON_OPEN_LOANS,
+    'return_book_transaction:open_loan': SQL_OPEN_LOAN_DUE_DATE,
+    'return_book_transaction:close_loan': SQL_CLOSE_LOAN,
+    'get_open_loans': SQL_OPEN_LOANS,
+    'iter_overdue_loans': SQL_OVERDUE_LOANS,
+    'iter_overdue_loans:patron': SQL_PATRON_OVERDUE_LOANS,
+    'iter_overdue_loans:book': SQL_BOOK_OVERDUE_LOANS,
+    'iter_books': SQL_EXPORT_BOOKS,
+    'iter_open_loans': SQL_EXPORT_OPEN_LOANS,
+    'iter_borrow_history': SQL_EXPORT_BORROW_HISTORY,
+    'search_books_fts:title': SQL_SEARCH_TITLE,
+    'search_books_fts:author': SQL_SEARCH_AUTHOR,
+    'get_open_loan_payments': SQL_PATRON_OPEN_LOAN_PAYMENTS,
+    'get_paid_late_fees': SQL_OPEN_LOAN_PAYMENTS,
+}
+ALLOWED_SCAN_QUERIES = {
+    'get_all_books', 'get_books_page:first', 'get_open_loans',
+    'iter_books', 'iter_open_loans', 'iter_borrow_history', 'get_paid_late_fees',
+}
+
+# borrow_records in the current schema; also the target table of migrate_timestamps()
+SQL_CREATE_BORROW_RECORDS = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patron_id TEXT NOT NULL,
+        book_id INTEGER NOT NULL,
+        borrow_date INTEGER NOT NULL,
+        due_date INTEGER NOT NULL,
+        return_date INTEGER,
+        FOREIGN KEY (book_id) REFERENCES books (id)
+    )
+'''
+
+def init_database(migrate: bool = True):
+    """
+    Initialize the database with required tables. New databases start at
+    SCHEMA_VERSION; older ones are upgraded with migrate_timestamps() unless
+    migrate is False (the app then keeps working on the old schema).
+    """
+    conn = get_db_connection(write=True)
+    try:
+        # Create books table
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS books (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                author TEXT NOT NULL,
+                isbn TEXT UNIQUE NOT NULL,
+                total_copies INTEGER NOT NULL,
+                available_copies INTEGER NOT NULL
+            )
+        ''')
+
+        # Create borrow_records table
+        is_new = not conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'borrow_records'"
+        ).fetchone()
+        conn.execute(SQL_CREATE_BORROW_RECORDS.format(table='borrow_records'))
+        if is_new:
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+        # Create payment_jobs table (queued late fee payments)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS payment_jobs (
+                id TEXT PRIMARY KEY,
+                patron_id TEXT NOT NULL,
+                book_id INTEGER NOT NULL,
+                amount REAL NOT NULL,
+                description TEXT NOT NULL,
+                status TEXT NOT NULL,
+                message TEXT,
+                transaction_id TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                loan_id INTEGER
+            )
+        ''')
+        add_missing_column(conn, 'payment_jobs', 'loan_id', 'INTEGER')
+
+        # Create payment_allocations table (how a payment splits across loans)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS payment_allocations (
+                transaction_id TEXT NOT NULL,
+                book_id INTEGER NOT NULL,
+                patron_id TEXT NOT NULL,
+                loan_id INTEGER NOT NULL,
+                amount REAL NOT NULL,
+                refunded_amount REAL NOT NULL DEFAULT 0,
+                created_at TEXT NOT NULL,
+                PRIMARY KEY (transaction_id, book_id)
+            )
+        ''')
+
+        # Create idempotency_keys table (stored results of payment API calls)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                operation TEXT NOT NULL,
+                key TEXT NOT NULL,
+                request_hash TEXT NOT NULL,
+                result TEXT,
+                created_at TEXT NOT NULL,
+                PRIMARY KEY (operation, key)
+            )
+        ''')
+
+        # Create billing_runs and billing_run_patrons tables (nightly billing checkpoints)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS billing_runs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                started_at TEXT NOT NULL,
+                finished_at TEXT
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS billing_run_patrons (
+                run_id TEXT NOT NULL,
+                patron_id TEXT NOT NULL,
+                amount_due REAL NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                message TEXT,
+                transaction_id TEXT,
+                PRIMARY KEY (run_id, patron_id)
+            )
+        ''')
+
+        create_indexes(conn)
+        create_search_index(conn)
+
+        conn.commit()
+    finally:
+        conn.close()
+
+    if migrate:
+        migrate_timestamps()
+
+def add_missing_column(conn, table: str, column: str, definition: str):
+    """Add a column introduced after the table was first created, if the table lacks it."""
+    columns = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def create_indexes(conn):
+    """
+    Create the secondary indexes for books, borrow_records, payment_allocations
+    and idempotency_keys.
+    Safe to run against existing databases, so it doubles as the index migration.
+    """
+    # Catalog listing in title order, and keyset pagination on (title, id)
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_books_title
+        ON books (title, id)
+    ''')
     
-    # Create books table
+    # Open loans per patron: borrow limit, duplicate loan check, borrowed books list, returns
     conn.execute('''
-        CREATE TABLE IF NOT EXISTS books (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            author TEXT NOT NULL,
-            isbn TEXT UNIQUE NOT NULL,
-            total_copies INTEGER NOT NULL,
-            available_copies INTEGER NOT NULL
-        )
+        CREATE INDEX IF NOT EXISTS idx_borrow_records_patron_open
+        ON borrow_records (patron_id, borrow_date, book_id)
+        WHERE return_date IS NULL
     ''')
     
-    # Create borrow_records table
+    # Full borrowing history per patron, newest first
     conn.execute('''
-        CREATE TABLE IF NOT EXISTS borrow_records (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patron_id TEXT NOT NULL,
-            book_id INTEGER NOT NULL,
-            borrow_date TEXT NOT NULL,
-            due_date TEXT NOT NULL,
-            return_date TEXT,
-            FOREIGN KEY (book_id) REFERENCES books (id)
-        )
+        CREATE INDEX IF NOT EXISTS idx_borrow_records_patron_history
+        ON borrow_records (patron_id, borrow_date)
     ''')
     
-    conn.commit()
-    conn.close()
+    # Open loans per book
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_borrow_records_book_open
+        ON borrow_records (book_id)
+        WHERE return_date IS NULL
+    ''')
+    
+    # Library-wide overdue loans, by due date in epoch seconds
+    conn.execute(f'''
+        CREATE INDEX IF NOT EXISTS idx_borrow_records_overdue
+        ON borrow_records (({epoch_sql('due_date')}))
+        WHERE return_date IS NULL
+    ''')
+    
+    # What has been paid towards each loan's late fee
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_payment_allocations_loan
+        ON payment_allocations (loan_id)
+    ''')
+    
+    # Purging idempotency keys past the retention window
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created
+        ON idempotency_keys (created_at)
+    ''')
 
-def add_sample_data():
-    """Add sample data to the database if it's empty."""
+def migrate_timestamps(batch_size: int = MIGRATION_BATCH_SIZE,
+                       progress: Optional[Callable[[int, int], None]] = None) -> Optional[int]:
+    """
+    Upgrade borrow_records to epoch timestamps (schema version 2) while the
+    database stays in use.
+
+    Rows are copied into a new table batch_size at a time, one short write
+    transaction per batch, so other writers only wait for a batch rather than
+    the whole migration. Triggers mirror writes made to the old table in the
+    meantime. A final transaction swaps the tables, rebuilds the indexes and
+    sets the schema version. An interrupted migration resumes where it left off.
+
+    Args:
+        batch_size: Rows copied per transaction
+        progress: Called with (rows_copied, total_rows) after each batch
+
+    Returns:
+        int: Number of rows migrated (0 if already up to date), or None if the migration failed
+    """
+    new_table = 'borrow_records_migration'
+    columns = 'id, patron_id, book_id, borrow_date, due_date, return_date'
+    converted = ', '.join([
+        'id', 'patron_id', 'book_id',
+        epoch_sql('borrow_date'), epoch_sql('due_date'), epoch_sql('return_date'),
+    ])
+    copy_rows = f'''
+        INSERT OR IGNORE INTO {new_table} ({columns})
+        SELECT {converted} FROM borrow_records WHERE id > ? AND id <= ?
+    '''
+
+    conn = get_db_connection(write=True)
+    try:
+        if get_schema_version(conn) >= EPOCH_TIMESTAMPS_VERSION:
+            return 0
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute(SQL_CREATE_BORROW_RECORDS.format(table=new_table))
+        mirrored = ', '.join([
+            'new.id', 'new.patron_id', 'new.book_id',
+            epoch_sql('new.borrow_date'), epoch_sql('new.due_date'), epoch_sql('new.return_date'),
+        ])
+        for event in ('INSERT', 'UPDATE'):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS borrow_records_migrate_{event.lower()}
+                AFTER {event} ON borrow_records BEGIN
+                    INSERT OR REPLACE INTO {new_table} ({columns}) VALUES ({mirrored});
+                END
+            ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS borrow_records_migrate_delete
+            AFTER DELETE ON borrow_records BEGIN
+                DELETE FROM {new_table} WHERE id = old.id;
+            END
+        ''')
+        total = conn.execute('SELECT COUNT(*) FROM borrow_records').fetchone()[0]
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        return None
+    finally:
+        conn.close()
+
+    copied = 0
+    last_id = 0
+    while True:
+        conn = get_db_connection(write=True)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            batch = conn.execute('''
+                SELECT COUNT(*), MAX(id) FROM (
+                    SELECT id FROM borrow_records WHERE id > ? ORDER BY id LIMIT ?
+                )
+            ''', (last_id, batch_size)).fetchone()
+            if not batch[0]:
+                conn.rollback()
+                break
+            conn.execute(copy_rows, (last_id, batch[1]))
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            return None
+        finally:
+            conn.close()
+        copied += batch[0]
+        last_id = batch[1]
+        if progress:
+            progress(copied, max(total, copied))
+
+    conn = get_db_connection(write=True)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        # Rows inserted after the last batch were mirrored by the insert trigger
+        for event in ('insert', 'update', 'delete'):
+            conn.execute(f'DROP TRIGGER IF EXISTS borrow_records_migrate_{event}')
+        conn.execute('DROP TABLE borrow_records')
+        conn.execute(f'ALTER TABLE {new_table} RENAME TO borrow_records')
+        create_indexes(conn)
+        conn.execute(f'PRAGMA user_version = {EPOCH_TIMESTAMPS_VERSION}')
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        return None
+    finally:
+        conn.close()
+    return copied
+
+def create_search_index(conn):
+    """
+    Create the books_fts trigram index over title and author, kept in sync with
+    books by triggers. Existing rows are indexed the first time it is created.
+    Skipped if this SQLite build has no FTS5 support; search then falls back
+    to scanning the catalog.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'"
+    ).fetchone()
+    if exists:
+        return
+
+    try:
+        conn.execute('''
+            CREATE VIRTUAL TABLE books_fts USING fts5(
+                title, author, content='books', content_rowid='id', tokenize='trigram'
+            )
+        ''')
+    except sqlite3.OperationalError:
+        return
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+            INSERT INTO books_fts (rowid, title, author) VALUES (new.id, new.title, new.author);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, title, author)
+            VALUES ('delete', old.id, old.title, old.author);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF title, author ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, title, author)
+            VALUES ('delete', old.id, old.title, old.author);
+            INSERT INTO books_fts (rowid, title, author) VALUES (new.id, new.title, new.author);
+        END
+    ''')
+    conn.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
+
+def audit_query_plans() -> List[Dict]:
+    """
+    Run EXPLAIN QUERY PLAN on every query in AUDITED_QUERIES.
+
+    Returns:
+        list of dict: {
+            'query': str,           # Helper the query belongs to
+            'plan': List[str],      # Plan detail lines
+            'scans': List[str],     # Table or index scans, unless the query is in ALLOWED_SCAN_QUERIES
+        }
+    """
     conn = get_db_connection()
-    book_count = conn.execute('SELECT COUNT(*) as count FROM books').fetchone()['count']
-    
-    if book_count == 0:
-        # Add sample books
-        sample_books = [
-            ('The Great Gatsby', 'F. Scott Fitzgerald', '9780743273565', 3),
-            ('To Kill a Mockingbird', 'Harper Lee', '9780061120084', 2),
-            ('1984', 'George Orwell', '9780451524935', 1)
+    results = []
+    for name, sql in AUDITED_QUERIES.items():
+        params = (None,) * sql.count('?')
+        try:
+            plan = [row['detail'] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()]
+        except sqlite3.OperationalError as e:
+            # e.g. books_fts is missing because SQLite was built without FTS5
+            plan = [f'unavailable: {e}']
+        # Virtual table "scans" are lookups answered by the table's own index
+        scans = [] if name in ALLOWED_SCAN_QUERIES else [
+            detail for detail in plan if detail.startswith('SCAN') and 'VIRTUAL TABLE' not in detail
         ]
-        
-        for title, author, isbn, copies in sample_books:
-            conn.execute('''
-                INSERT INTO books (title, author, isbn, total_copies, available_copies)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (title, author, isbn, copies, copies))
-        
-        # Make 1984 unavailable by adding a borrow record
-        conn.execute('''
-            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
-            VALUES (?, ?, ?, ?)
-        ''', ('123456', 3, 
-              (datetime.now() - timedelta(days=5)).isoformat(),
-              (datetime.now() + timedelta(days=9)).isoformat()))
-        
-        # Update available copies for 1984
-        conn.execute('UPDATE books SET available_copies = 0 WHERE id = 3')
-        
-        conn.commit()
-    
+        results.append({'query': name, 'plan': plan, 'scans': scans})
     conn.close()
+    return results
+
+def add_sample_data():
+    """Add sample data to the database if it's empty."""
+    conn = get_db_connection(write=True)
+    try:
+        book_count = conn.execute('SELECT COUNT(*) as count FROM books').fetchone()['count']
+
+        if book_count == 0:
+            # Add sample books
+            sample_books = [
+                ('The Great Gatsby', 'F. Scott Fitzgerald', '9780743273565', 3),
+                ('To Kill a Mockingbird', 'Harper Lee', '9780061120084', 2),
+                ('1984', 'George Orwell', '9780451524935', 1)
+            ]
+
+            for title, author, isbn, copies in sample_books:
+                conn.execute('''
+                    INSERT INTO books (title, author, isbn, total_copies, available_copies)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (title, author, isbn, copies, copies))
+
+            # Make 1984 unavailable by adding a borrow record
+            encode = _timestamp_encoder(conn)
+            conn.execute(SQL_INSERT_BORROW_RECORD, ('123456', 3,
+                  encode(datetime.now() - timedelta(days=5)),
+                  encode(datetime.now() + timedelta(days=9))))
+
+            # Update available copies for 1984
+            conn.execute('UPDATE books SET available_copies = 0 WHERE id = 3')
+
+            conn.commit()
+            bump_catalog_version()
+    finally:
+        conn.close()
 
 # Helper Functions for Database Operations
 
+@instrumented('db')
 def get_all_books() -> List[Dict]:
     """Get all books from the database."""
     conn = get_db_connection()
-    books = conn.execute('SELECT * FROM books ORDER BY title').fetchall()
+    books = conn.execute(SQL_ALL_BOOKS).fetchall()
+    conn.close()
+    return [dict(book) for book in books]
+
+@instrumented('db')
+def get_books_page(limit: int, after: Optional[Tuple[str, int]] = None) -> List[Dict]:
+    """
+    Get one page of the catalog ordered by (title, id), using keyset pagination.
+
+    Args:
+        limit: Maximum number of books to return
+        after: (title, id) of the last book on the previous page, or None for the first page
+    """
+    conn = get_db_connection()
+    if after is None:
+        books = conn.execute(SQL_BOOKS_FIRST_PAGE, (limit,)).fetchall()
+    else:
+        books = conn.execute(SQL_BOOKS_PAGE_AFTER, (after[0], after[1], limit)).fetchall()
     conn.close()
     return [dict(book) for book in books]
 
 def get_book_by_id(book_id: int) -> Optional[Dict]:
-    """Get a specific book by ID."""
+    """Get a specific book by ID (served from the book cache when possible)."""
+    cache = _book_cache
+    book = cache.get(book_id)
+    if book is not None:
+        record_cache_hit('get_book_by_id')
+        return book
+    generation = cache.generation
+    book = _select_book_by_id(book_id)
+    if book is not None:
+        cache.put(book, generation)
+    return book
+
+@instrumented('db', 'get_book_by_id')
+def _select_book_by_id(book_id: int) -> Optional[Dict]:
     conn = get_db_connection()
-    book = conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
+    book = conn.execute(SQL_BOOK_BY_ID, (book_id,)).fetchone()
     conn.close()
     return dict(book) if book else None
 
+@instrumented('db')
+def get_books_by_ids(book_ids: List[int]) -> List[Dict]:
+    """Get books by ID, in the order the IDs are given. Unknown IDs are skipped."""
+    conn = get_db_connection()
+    rows = {}
+    for start in range(0, len(book_ids), 500):
+        chunk = book_ids[start:start + 500]
+        placeholders = ', '.join('?' * len(chunk))
+        for book in conn.execute(f'SELECT * FROM books WHERE id IN ({placeholders})', chunk):
+            rows[book['id']] = dict(book)
+    conn.close()
+    return [rows[book_id] for book_id in book_ids if book_id in rows]
+
 def get_book_by_isbn(isbn: str) -> Optional[Dict]:
-    """Get a specific book by ISBN."""
+    """Get a specific book by ISBN (served from the book cache when possible)."""
+    cache = _book_cache
+    book_id = cache.get_id(isbn)
+    if book_id is not None:
+        return get_book_by_id(book_id)
+    generation = cache.generation
+    book = _select_book_by_isbn(isbn)
+    if book is not None:
+        cache.put(book, generation)
+    return book
+
+@instrumented('db', 'get_book_by_isbn')
+def _select_book_by_isbn(isbn: str) -> Optional[Dict]:
     conn = get_db_connection()
-    book = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
+    book = conn.execute(SQL_BOOK_BY_ISBN, (isbn,)).fetchone()
     conn.close()
     return dict(book) if book else None
 
+@instrumented('db')
+def search_books_fts(column: str, term: str) -> Optional[List[Dict]]:
+    """
+    Case-insensitive substring search on 'title' or 'author' using the FTS5 trigram index.
+
+    Returns:
+        list of dict: Matching books ordered by title, or None if the index
+        cannot answer the query (term shorter than 3 characters, or no FTS5)
+    """
+    if len(term) < 3:
+        return None
+
+    sql = {'title': SQL_SEARCH_TITLE, 'author': SQL_SEARCH_AUTHOR}[column]
+    phrase = '"' + term.replace('"', '""') + '"'
+    conn = get_db_connection()
+    try:
+        books = conn.execute(sql, (phrase,)).fetchall()
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+    return [dict(book) for book in books]
+
+@instrumented('db')
 def get_patron_borrowed_books(patron_id: str) -> List[Dict]:
     """Get currently borrowed books for a patron."""
     conn = get_db_connection()
-    records = conn.execute('''
-        SELECT br.*, b.title, b.author 
-        FROM borrow_records br 
-        JOIN books b ON br.book_id = b.id 
-        WHERE br.patron_id = ? AND br.return_date IS NULL
-        ORDER BY br.borrow_date
-    ''', (patron_id,)).fetchall()
+    records = conn.execute(SQL_PATRON_BORROWED_BOOKS, (to_epoch(datetime.now()), patron_id)).fetchall()
     conn.close()
     
     borrowed_books = []
     for record in records:
         borrowed_books.append({
+            'loan_id': record['id'],
             'book_id': record['book_id'],
             'title': record['title'],
             'author': record['author'],
-            'borrow_date': datetime.fromisoformat(record['borrow_date']),
-            'due_date': datetime.fromisoformat(record['due_date']),
-            'is_overdue': datetime.now() > datetime.fromisoformat(record['due_date'])
+            'borrow_date': parse_timestamp(record['borrow_date']),
+            'due_date': parse_timestamp(record['due_date']),
+            'is_overdue': bool(record['is_overdue'])
         })
     
     return borrowed_books
 
+@instrumented('db')
 def get_patron_borrow_count(patron_id: str) -> int:
     """Get the number of books currently borrowed by a patron."""
     conn = get_db_connection()
-    count = conn.execute('''
-        SELECT COUNT(*) as count FROM borrow_records 
-        WHERE patron_id = ? AND return_date IS NULL
-    ''', (patron_id,)).fetchone()['count']
+    count = conn.execute(SQL_PATRON_BORROW_COUNT, (patron_id,)).fetchone()['count']
     conn.close()
     return count
 
-def insert_book(title: str, author: str, isbn: str, total_copies: int, available_copies: int) -> bool:
-    """Insert a new book into the database."""
+@instrumented('db')
+def get_open_loans() -> List[Tuple[int, str, int, int]]:
+    """
+    Get every open loan in the library in one pass, for batch processing.
+
+    Returns:
+        list of tuple: (loan_id, patron_id, book_id, due_date) with due_date in
+        epoch seconds (see to_epoch), ordered by patron and borrow date
+    """
+    conn = get_db_connection()
+    loans = [tuple(row) for row in conn.execute(SQL_OPEN_LOANS)]
+    conn.close()
+    return loans
+
+LOAN_DATE_COLUMNS = ('borrow_date', 'due_date', 'return_date')
+
+def _iter_rows(sql: str, params: Tuple = (), fetch_size: int = EXPORT_FETCH_SIZE) -> Iterator[Dict]:
+    """
+    Rows of a query as dicts, fetched fetch_size at a time so the result set
+    is never held in memory; loan dates are converted to datetimes. The
+    connection is returned to the pool once the iterator is exhausted or closed.
+    """
     conn = get_db_connection()
     try:
-        conn.execute('''
-            INSERT INTO books (title, author, isbn, total_copies, available_copies)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (title, author, isbn, total_copies, available_copies))
+        cursor = conn.execute(sql, params)
+        dates = [column[0] for column in cursor.description if column[0] in LOAN_DATE_COLUMNS]
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            for row in rows:
+                record = dict(row)
+                for column in dates:
+                    record[column] = parse_timestamp(record[column])
+                yield record
+    finally:
+        conn.close()
+
+@instrumented('db')
+def iter_books(fetch_size: int = EXPORT_FETCH_SIZE) -> Iterator[Dict]:
+    """Every book, in ID order, streamed from the database (see _iter_rows)."""
+    return _iter_rows(SQL_EXPORT_BOOKS, fetch_size=fetch_size)
+
+@instrumented('db')
+def iter_open_loans(fetch_size: int = EXPORT_FETCH_SIZE) -> Iterator[Dict]:
+    """Every open loan (loan_id, patron_id, book_id, borrow_date, due_date), in ID order."""
+    return _iter_rows(SQL_EXPORT_OPEN_LOANS, fetch_size=fetch_size)
+
+@instrumented('db')
+def iter_borrow_history(fetch_size: int = EXPORT_FETCH_SIZE) -> Iterator[Dict]:
+    """Every borrow record, returned or not, in ID order; return_date is None for open loans."""
+    return _iter_rows(SQL_EXPORT_BORROW_HISTORY, fetch_size=fetch_size)
+
+@instrumented('db')
+def iter_overdue_loans(now: Optional[datetime] = None, patron_id: Optional[str] = None,
+                       book_id: Optional[int] = None, fetch_size: int = EXPORT_FETCH_SIZE) -> Iterator[Dict]:
+    """
+    Overdue open loans, library-wide or for one patron or book, most overdue
+    first, streamed from the database (see _iter_rows).
+
+    Yields:
+        dict: {'loan_id', 'patron_id', 'book_id', 'title', 'author',
+        'borrow_date' (datetime), 'due_date' (datetime), 'days_overdue' (int)}
+    """
+    now_epoch = to_epoch(now or datetime.now())
+    if patron_id is not None:
+        sql, params = SQL_PATRON_OVERDUE_LOANS, (now_epoch, patron_id, now_epoch)
+    elif book_id is not None:
+        sql, params = SQL_BOOK_OVERDUE_LOANS, (now_epoch, book_id, now_epoch)
+    else:
+        sql, params = SQL_OVERDUE_LOANS, (now_epoch, now_epoch)
+    return _iter_rows(sql, params, fetch_size)
+
+def get_overdue_loans(now: Optional[datetime] = None, patron_id: Optional[str] = None,
+                      book_id: Optional[int] = None) -> List[Dict]:
+    """Overdue open loans as a list. See iter_overdue_loans (which records the call)."""
+    return list(iter_overdue_loans(now, patron_id, book_id))
+
+@instrumented('db')
+def insert_book(title: str, author: str, isbn: str, total_copies: int, available_copies: int) -> bool:
+    """
+    Insert a new book into the database.
+    The book cache needs no invalidation: lookups that found nothing are not cached.
+    """
+    conn = get_db_connection(write=True)
+    try:
+        conn.execute(SQL_INSERT_BOOK, (title, author, isbn, total_copies, available_copies))
         conn.commit()
         conn.close()
+        bump_catalog_version()
         return True
-    except Exception as e:
+    except Exception:
         conn.close()
         return False
 
+@instrumented('db')
+def get_all_isbns() -> Set[str]:
+    """Get the ISBN of every book, e.g. to check a bulk import for duplicates in memory."""
+    conn = get_db_connection()
+    isbns = {row[0] for row in conn.execute('SELECT isbn FROM books')}
+    conn.close()
+    return isbns
+
+@instrumented('db')
+def insert_books_bulk(books: Iterable[Tuple[str, str, str, int, int]],
+                      batch_size: int = BULK_INSERT_BATCH_SIZE) -> Optional[int]:
+    """
+    Insert many books in a single transaction, with executemany in batches.
+    Books are consumed lazily, so a generator over a large file is never held in memory.
+
+    Args:
+        books: (title, author, isbn, total_copies, available_copies) tuples
+
+    Returns:
+        int: Number of books inserted, or None if the insert failed and was rolled back
+    """
+    conn = get_db_connection(write=True)
+    inserted = 0
+    batch = []
+    try:
+        for book in books:
+            batch.append(book)
+            if len(batch) >= batch_size:
+                conn.executemany(SQL_INSERT_BOOK, batch)
+                inserted += len(batch)
+                batch = []
+        if batch:
+            conn.executemany(SQL_INSERT_BOOK, batch)
+            inserted += len(batch)
+        conn.commit()
+        if inserted:
+            bump_catalog_version()
+        return inserted
+    except sqlite3.Error:
+        conn.rollback()
+        return None
+    finally:
+        conn.close()
+
+@instrumented('db')
 def insert_borrow_record(patron_id: str, book_id: int, borrow_date: datetime, due_date: datetime) -> bool:
     """Insert a new borrow record into the database."""
-    conn = get_db_connection()
+    conn = get_db_connection(write=True)
     try:
-        conn.execute('''
-            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
-            VALUES (?, ?, ?, ?)
-        ''', (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat()))
+        encode = _timestamp_encoder(conn)
+        conn.execute(SQL_INSERT_BORROW_RECORD, (patron_id, book_id, encode(borrow_date), encode(due_date)))
         conn.commit()
         conn.close()
         return True
-    except Exception as e:
+    except Exception:
         conn.close()
         return False
 
+@instrumented('db')
 def update_book_availability(book_id: int, change: int) -> bool:
     """Update the available copies of a book by a given amount (+1 for return, -1 for borrow)."""
-    conn = get_db_connection()
+    conn = get_db_connection(write=True)
     try:
-        conn.execute('''
-            UPDATE books SET available_copies = available_copies + ? WHERE id = ?
-        ''', (change, book_id))
+        conn.execute(SQL_UPDATE_AVAILABILITY, (change, book_id))
         conn.commit()
         conn.close()
         return True
-    except Exception as e:
+    except Exception:
         conn.close()
         return False
+    finally:
+        _book_cache.invalidate(book_id)
+        bump_catalog_version()
 
+@instrumented('db')
 def update_borrow_record_return_date(patron_id: str, book_id: int, return_date: datetime) -> bool:
     """Update the return date for a borrow record."""
-    conn = get_db_connection()
+    conn = get_db_connection(write=True)
     try:
-        conn.execute('''
-            UPDATE borrow_records 
-            SET return_date = ? 
-            WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
-        ''', (return_date.isoformat(), patron_id, book_id))
+        encode = _timestamp_encoder(conn)
+        conn.execute(SQL_CLOSE_LOAN, (encode(return_date), patron_id, book_id))
         conn.commit()
         conn.close()
         return True
-    except Exception as e:
+    except Exception:
         conn.close()
         return False
 
+@instrumented('db')
+def borrow_book_transaction(patron_id: str, book_id: int, borrow_date: datetime,
+                            due_date: datetime, max_borrowed: int) -> Tuple[str, Optional[Dict]]:
+    """
+    Validate and record a borrow in a single BEGIN IMMEDIATE transaction.
+
+    A copy is reserved with a conditional UPDATE, so availability can never go
+    negative under concurrent borrows. Checks run in the same order as the
+    service layer messages: existence, availability, duplicate loan, limit.
+
+    Returns:
+        tuple: (status: str, book: Optional[Dict]) where status is one of
+        'ok', 'not_found', 'unavailable', 'already_borrowed', 'limit_reached' or 'error'
+    """
+    conn = get_db_connection(write=True)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        reserved = conn.execute(SQL_RESERVE_COPY, (book_id,)).rowcount
+        book = conn.execute(SQL_BOOK_BY_ID, (book_id,)).fetchone()
+        if not reserved:
+            conn.rollback()
+            return ('unavailable', dict(book)) if book else ('not_found', None)
+
+        loans = conn.execute(SQL_PATRON_OPEN_LOANS, (book_id, patron_id)).fetchone()
+        if loans['same_book']:
+            conn.rollback()
+            return 'already_borrowed', dict(book)
+        if loans['count'] >= max_borrowed:
+            conn.rollback()
+            return 'limit_reached', dict(book)
+
+        encode = _timestamp_encoder(conn)
+        conn.execute(SQL_INSERT_BORROW_RECORD, (patron_id, book_id, encode(borrow_date), encode(due_date)))
+        conn.commit()
+        _book_cache.invalidate(book_id)
+        bump_catalog_version()
+        return 'ok', dict(book)
+    except sqlite3.Error:
+        return 'error', None
+    finally:
+        conn.close()
+
+@instrumented('db')
+def return_book_transaction(patron_id: str, book_id: int, return_date: datetime) -> Tuple[str, Optional[Dict]]:
+    """
+    Close a patron's open loan and restore availability in a single BEGIN IMMEDIATE transaction.
+
+    Returns:
+        tuple: (status: str, book: Optional[Dict]) where status is one of
+        'ok', 'not_found', 'not_borrowed' or 'error'. On success the book dict
+        also carries the 'due_date' (datetime) of the loan that was closed.
+    """
+    conn = get_db_connection(write=True)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        book = conn.execute(SQL_BOOK_BY_ID, (book_id,)).fetchone()
+        if not book:
+            conn.rollback()
+            return 'not_found', None
+
+        loan = conn.execute(SQL_OPEN_LOAN_DUE_DATE, (patron_id, book_id)).fetchone()
+        if not loan:
+            conn.rollback()
+            return 'not_borrowed', dict(book)
+
+        conn.execute(SQL_CLOSE_LOAN, (_timestamp_encoder(conn)(return_date), patron_id, book_id))
+        conn.execute(SQL_UPDATE_AVAILABILITY, (1, book_id))
+        conn.commit()
+        _book_cache.invalidate(book_id)
+        bump_catalog_version()
+
+        returned = dict(book)
+        returned['due_date'] = parse_timestamp(loan['due_date'])
+        return 'ok', returned
+    except sqlite3.Error:
+        return 'error', None
+    finally:
+        conn.close()
+
+@instrumented('db')
 def get_patron_borrow_history(patron_id: str) -> List[Dict]:
     """ Get full borrowing history for a patron, including returned books."""
     
     conn = get_db_connection()
-    records = conn.execute('''
-        SELECT br.*, b.title, b.author
-        FROM borrow_records br
-        JOIN books b ON br.book_id = b.id
-        WHERE br.patron_id = ?
-        ORDER BY br.borrow_date DESC
-    ''', (patron_id,)).fetchall()
+    records = conn.execute(SQL_PATRON_BORROW_HISTORY, (to_epoch(datetime.now()), patron_id)).fetchall()
     conn.close()
 
     history = []
     for record in records:
-        borrow_date = datetime.fromisoformat(record['borrow_date'])
-        due_date = datetime.fromisoformat(record['due_date'])
-        return_date = datetime.fromisoformat(record['return_date']) if record['return_date'] else None
         history.append({
             'book_id': record['book_id'],
             'title': record['title'],
             'author': record['author'],
-            'borrow_date': borrow_date,
-            'due_date': due_date,
-            'return_date': return_date,
-            'is_overdue': (datetime.now() > due_date) if return_date is None else (return_date > due_date)
+            'borrow_date': parse_timestamp(record['borrow_date']),
+            'due_date': parse_timestamp(record['due_date']),
+            'return_date': parse_timestamp(record['return_date']),
+            'is_overdue': bool(record['is_overdue'])
         })
     return history
+
+@instrumented('db')
+def insert_payment_job(job_id: str, patron_id: str, book_id: int, amount: float,
+                       description: str, created_at: datetime, loan_id: Optional[int] = None) -> bool:
+    """Insert a new payment job in 'pending' status. loan_id is the loan whose fee it pays."""
+    conn = get_db_connection(write=True)
+    try:
+        conn.execute('''
+            INSERT INTO payment_jobs
+                (id, patron_id, book_id, amount, description, status, created_at, updated_at, loan_id)
+            VALUES (?, ?, ?, ?, ?, 'pending', ?, ?, ?)
+        ''', (job_id, patron_id, book_id, amount, description, created_at.isoformat(), created_at.isoformat(),
+              loan_id))
+        conn.commit()
+        conn.close()
+        return True
+    except Exception:
+        conn.close()
+        return False
+
+@instrumented('db')
+def update_payment_job(job_id: str, status: str, message: Optional[str] = None,
+                       transaction_id: Optional[str] = None) -> bool:
+    """Update the status (and outcome) of a payment job."""
+    conn = get_db_connection(write=True)
+    try:
+        conn.execute('''
+            UPDATE payment_jobs
+            SET status = ?, message = ?, transaction_id = ?, updated_at = ?
+            WHERE id = ?
+        ''', (status, message, transaction_id, datetime.now().isoformat(), job_id))
+        conn.commit()
+        conn.close()
+        return True
+    except Exception:
+        conn.close()
+        return False
+
+@instrumented('db')
+def claim_payment_job(job_id: str) -> bool:
+    """Move a payment job from 'pending' to 'processing'. False if it was not pending (already claimed)."""
+    conn = get_db_connection(write=True)
+    try:
+        cursor = conn.execute('''
+            UPDATE payment_jobs SET status = 'processing', updated_at = ?
+            WHERE id = ? AND status = 'pending'
+        ''', (datetime.now().isoformat(), job_id))
+        conn.commit()
+        conn.close()
+        return cursor.rowcount == 1
+    except Exception:
+        conn.close()
+        return False
+
+@instrumented('db')
+def get_unfinished_payment_jobs() -> List[Dict]:
+    """Payment jobs still 'pending' or 'processing', oldest first."""
+    conn = get_db_connection()
+    jobs = conn.execute('''
+        SELECT * FROM payment_jobs
+        WHERE status IN ('pending', 'processing')
+        ORDER BY created_at, id
+    ''').fetchall()
+    conn.close()
+    return [dict(job) for job in jobs]
+
+@instrumented('db')
+def get_payment_job(job_id: str) -> Optional[Dict]:
+    """Get a payment job by ID."""
+    conn = get_db_connection()
+    job = conn.execute('SELECT * FROM payment_jobs WHERE id = ?', (job_id,)).fetchone()
+    conn.close()
+    return dict(job) if job else None
+
+@instrumented('db')
+def insert_payment_allocations(transaction_id: str, patron_id: str, allocations: List[Dict],
+                               created_at: datetime) -> bool:
+    """
+    Record how one gateway payment splits across loans.
+    Each allocation is {'loan_id': int, 'book_id': int, 'amount': float}.
+    """
+    conn = get_db_connection(write=True)
+    try:
+        conn.executemany('''
+            INSERT INTO payment_allocations (transaction_id, book_id, patron_id, loan_id, amount, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(transaction_id, a['book_id'], patron_id, a['loan_id'], a['amount'], created_at.isoformat())
+              for a in allocations])
+        conn.commit()
+        conn.close()
+        return True
+    except Exception:
+        conn.close()
+        return False
+
+@instrumented('db')
+def get_payment_allocations(transaction_id: str) -> List[Dict]:
+    """Get the per-book split of a payment, in book ID order."""
+    conn = get_db_connection()
+    rows = conn.execute(
+        'SELECT * FROM payment_allocations WHERE transaction_id = ? ORDER BY book_id', (transaction_id,)
+    ).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+@instrumented('db')
+def get_open_loan_payments(patron_id: str) -> List[Dict]:
+    """
+    A patron's open loans, earliest first, with the late fees already paid
+    towards each and not refunded: {'loan_id', 'book_id', 'paid'}.
+    """
+    conn = get_db_connection()
+    rows = conn.execute(SQL_PATRON_OPEN_LOAN_PAYMENTS, (patron_id,)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+@instrumented('db')
+def get_paid_late_fees() -> Dict[int, float]:
+    """Late fees already paid and not refunded, per open loan ID (loans without payments are left out)."""
+    conn = get_db_connection()
+    paid = {row['loan_id']: row['paid'] for row in conn.execute(SQL_OPEN_LOAN_PAYMENTS)}
+    conn.close()
+    return paid
+
+@instrumented('db')
+def reserve_allocation_refund(transaction_id: str, book_id: int, amount: float) -> bool:
+    """
+    Mark amount of a book's share of a payment as refunded, if that much is still unrefunded.
+    Returns False if the allocation does not exist or amount exceeds what is left.
+    """
+    conn = get_db_connection(write=True)
+    try:
+        reserved = conn.execute('''
+            UPDATE payment_allocations SET refunded_amount = refunded_amount + ?
+            WHERE transaction_id = ? AND book_id = ? AND refunded_amount + ? <= amount + 0.005
+        ''', (amount, transaction_id, book_id, amount)).rowcount
+        conn.commit()
+        conn.close()
+        return reserved == 1
+    except Exception:
+        conn.close()
+        return False
+
+@instrumented('db')
+def release_allocation_refund(transaction_id: str, book_id: int, amount: float) -> bool:
+    """Undo reserve_allocation_refund after the gateway rejected the refund."""
+    conn = get_db_connection(write=True)
+    try:
+        conn.execute('''
+            UPDATE payment_allocations SET refunded_amount = MAX(refunded_amount - ?, 0)
+            WHERE transaction_id = ? AND book_id = ?
+        ''', (amount, transaction_id, book_id))
+        conn.commit()
+        conn.close()
+        return True
+    except Exception:
+        conn.close()
+        return False
+
+@instrumented('db')
+def claim_idempotency_key(operation: str, key: str, request_hash: str, now: datetime,
+                          expired_before: datetime, stale_claim_before: Optional[datetime] = None) -> bool:
+    """
+    Reserve an idempotency key for a new request (result pending).
+    A key whose record is older than expired_before is reclaimed, and so is a
+    claim still without a result that was made before stale_claim_before.
+    Returns False if the key is already in use.
+    """
+    stale_claim_before = stale_claim_before or expired_before
+    conn = get_db_connection(write=True)
+    try:
+        claimed = conn.execute('''
+            INSERT INTO idempotency_keys (operation, key, request_hash, result, created_at)
+            VALUES (?, ?, ?, NULL, ?)
+            ON CONFLICT (operation, key) DO UPDATE
+                SET request_hash = excluded.request_hash, result = NULL, created_at = excluded.created_at
+                WHERE idempotency_keys.created_at < ?
+                    OR (idempotency_keys.result IS NULL AND idempotency_keys.created_at < ?)
+        ''', (operation, key, request_hash, now.isoformat(), expired_before.isoformat(),
+              stale_claim_before.isoformat())).rowcount
+        conn.commit()
+        conn.close()
+        return claimed == 1
+    except Exception:
+        conn.close()
+        return False
+
+@instrumented('db')
+def complete_idempotency_key(operation: str, key: str, result: str) -> bool:
+    """Store the (JSON-encoded) result of the request holding an idempotency key."""
+    conn = get_db_connection(write=True)
+    try:
+        conn.execute(
+            'UPDATE idempotency_keys SET result = ? WHERE operation = ? AND key = ?', (result, operation, key)
+        )
+        conn.commit()
+        conn.close()
+        return True
+    except Exception:
+        conn.close()
+        return False
+
+@instrumented('db')
+def release_idempotency_key(operation: str, key: str) -> bool:
+    """Drop an idempotency key whose request did not complete."""
+    conn = get_db_connection(write=True)
+    try:
+        conn.execute('DELETE FROM idempotency_keys WHERE operation = ? AND key = ?', (operation, key))
+        conn.commit()
+        conn.close()
+        return True
+    except Exception:
+        conn.close()
+        return False
+
+@instrumented('db')
+def get_idempotency_key(operation: str, key: str) -> Optional[Dict]:
+    """Get the stored record of an idempotency key."""
+    conn = get_db_connection()
+    record = conn.execute(
+        'SELECT * FROM idempotency_keys WHERE operation = ? AND key = ?', (operation, key)
+    ).fetchone()
+    conn.close()
+    return dict(record) if record else None
+
+@instrumented('db')
+def delete_idempotency_keys_before(before: datetime) -> Optional[int]:
+    """Delete idempotency keys created before the given time. Returns the number deleted."""
+    conn = get_db_connection(write=True)
+    try:
+        deleted = conn.execute(
+            'DELETE FROM idempotency_keys WHERE created_at < ?', (before.isoformat(),)
+        ).rowcount
+        conn.commit()
+        conn.close()
+        return deleted
+    except Exception:
+        conn.close()
+        return None
+
+@instrumented('db')
+def create_billing_run(run_id: str, amounts_due: Dict[str, float], started_at: datetime) -> bool:
+    """Record a new billing run and the patrons it will charge, all pending."""
+    conn = get_db_connection(write=True)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute(
+            "INSERT INTO billing_runs (id, status, started_at) VALUES (?, 'running', ?)",
+            (run_id, started_at.isoformat())
+        )
+        conn.executemany('''
+            INSERT INTO billing_run_patrons (run_id, patron_id, amount_due, status)
+            VALUES (?, ?, ?, 'pending')
+        ''', [(run_id, patron_id, amount) for patron_id, amount in amounts_due.items()])
+        conn.commit()
+        conn.close()
+        return True
+    except Exception:
+        conn.rollback()
+        conn.close()
+        return False
+
+@instrumented('db')
+def get_billing_run(run_id: str) -> Optional[Dict]:
+    """Get a billing run by ID."""
+    conn = get_db_connection()
+    run = conn.execute('SELECT * FROM billing_runs WHERE id = ?', (run_id,)).fetchone()
+    conn.close()
+    return dict(run) if run else None
+
+@instrumented('db')
+def get_billing_run_patrons(run_id: str, status: Optional[str] = None) -> List[Dict]:
+    """Get the patrons of a billing run, optionally only those with the given status."""
+    conn = get_db_connection()
+    if status is None:
+        rows = conn.execute(
+            'SELECT * FROM billing_run_patrons WHERE run_id = ? ORDER BY patron_id', (run_id,)
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            'SELECT * FROM billing_run_patrons WHERE run_id = ? AND status = ? ORDER BY patron_id',
+            (run_id, status)
+        ).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+@instrumented('db')
+def get_billing_run_charged_total(run_id: str) -> float:
+    """
+    Sum of what the gateway charged the patrons of a billing run, from the
+    payment allocations of their transactions (not their amount_due).
+    """
+    conn = get_db_connection()
+    total = conn.execute('''
+        SELECT COALESCE(SUM(a.amount), 0) FROM payment_allocations a
+        JOIN billing_run_patrons p ON p.transaction_id = a.transaction_id
+        WHERE p.run_id = ? AND p.status = 'charged'
+    ''', (run_id,)).fetchone()[0]
+    conn.close()
+    return total
+
+@instrumented('db')
+def retry_failed_billing_patrons(run_id: str) -> Optional[int]:
+    """Put the failed patrons of a billing run back to pending for another attempt."""
+    conn = get_db_connection(write=True)
+    try:
+        retried = conn.execute('''
+            UPDATE billing_run_patrons SET status = 'pending', attempts = attempts + 1
+            WHERE run_id = ? AND status = 'failed'
+        ''', (run_id,)).rowcount
+        conn.execute("UPDATE billing_runs SET status = 'running', finished_at = NULL WHERE id = ?", (run_id,))
+        conn.commit()
+        conn.close()
+        return retried
+    except Exception:
+        conn.close()
+        return None
+
+@instrumented('db')
+def update_billing_run_patron(run_id: str, patron_id: str, status: str, message: Optional[str] = None,
+                              transaction_id: Optional[str] = None) -> bool:
+    """Checkpoint the outcome of charging one patron in a billing run."""
+    conn = get_db_connection(write=True)
+    try:
+        conn.execute('''
+            UPDATE billing_run_patrons SET status = ?, message = ?, transaction_id = ?
+            WHERE run_id = ? AND patron_id = ?
+        ''', (status, message, transaction_id, run_id, patron_id))
+        conn.commit()
+        conn.close()
+        return True
+    except Exception:
+        conn.close()
+        return False
+
+@instrumented('db')
+def finish_billing_run(run_id: str, status: str, finished_at: datetime) -> bool:
+    """Mark a billing run as finished (or interrupted)."""
+    conn = get_db_connection(write=True)
+    try:
+        conn.execute(
+            'UPDATE billing_runs SET status = ?, finished_at = ? WHERE id = ?',
+            (status, finished_at.isoformat(), run_id)
+        )
+        conn.commit()
+        conn.close()
+        return True
+    except Exception:
+        conn.close()
+        return False
@@ -0,0 +1,83 @@
+"""
+HTTP Cache Module - ETags, Last-Modified and a server-side response cache
+for pages that only change when the catalog does (catalog and search).
+Validators and cache keys come from database.get_catalog_version(), so a
+new book or an availability change invalidates every cached response.
+"""
+
+import uuid
+from datetime import datetime
+from functools import wraps
+from typing import Callable, Optional
+
+from flask import Response, make_response, request, session
+from cache import LRUCache
+from database import get_catalog_version
+
+RESPONSE_CACHE_SIZE = 256  # Rendered responses kept in memory (0 keeps only ETags and 304s)
+
+# Changes on every start, so an ETag from before a restart never matches a new counter value
+_BOOT_ID = uuid.uuid4().hex[:8]
+
+_response_cache = LRUCache(RESPONSE_CACHE_SIZE)
+
+def configure_response_cache(size: int = RESPONSE_CACHE_SIZE) -> LRUCache:
+    """Replace the response cache with an empty one holding up to size responses."""
+    global _response_cache
+    _response_cache = LRUCache(size)
+    return _response_cache
+
+def get_response_cache_stats():
+    """Hit/miss counters and size of the response cache."""
+    return _response_cache.stats()
+
+def catalog_etag(version: int) -> str:
+    """Strong entity tag (without quotes) of every catalog-derived response at a version."""
+    return f'catalog-{_BOOT_ID}-{version}'
+
+def _not_modified(etag: str, last_modified: datetime) -> bool:
+    """Whether the request's validators match; If-None-Match wins over If-Modified-Since."""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    since = request.if_modified_since
+    return since is not None and since >= last_modified.replace(microsecond=0)
+
+def _add_validators(response: Response, etag: str, last_modified: datetime) -> Response:
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    # Clients may keep the page but must check back each time (answered with a 304)
+    response.cache_control.no_cache = True
+    return response
+
+def cached_catalog_response(view: Callable) -> Callable:
+    """
+    Serve a GET view from the response cache, keyed on (endpoint, query
+    args, catalog version), and answer matching If-None-Match /
+    If-Modified-Since with 304 Not Modified. Only 200 responses are cached;
+    requests with pending flash messages (and views that flash) bypass it,
+    since their page is specific to one session.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+            return view(*args, **kwargs)
+
+        # Read before the view runs: a write during rendering makes the entry stale, never mislabelled
+        version, last_modified = get_catalog_version()
+        etag = catalog_etag(version)
+        if _not_modified(etag, last_modified):
+            return _add_validators(Response(status=304), etag, last_modified)
+
+        cache = _response_cache
+        key = (request.endpoint, tuple(sorted(request.args.items(multi=True))), version)
+        cached: Optional[tuple] = cache.get(key)
+        if cached is not None:
+            body, status, content_type = cached
+            response = Response(body, status=status, content_type=content_type)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed or session.modified:
+                return response
+            cache.put(key, (response.get_data(), response.status_code, response.content_type))
+        return _add_validators(response, etag, last_modified)
+    return wrapper
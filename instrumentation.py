@@ -0,0 +1,286 @@
+"""
+Instrumentation Module - Call counts, latency and row counts for database helpers and gateway calls
+Every instrumented call is added to the current request's totals (reported in
+debug response headers) and to process-wide histograms, served at /metrics
+in the Prometheus text format.
+"""
+
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+CALLS_PER_REQUEST_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+ENABLED = True  # Switched off by create_app(METRICS_ENABLED=False)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a running count and sum, as Prometheus exposes them."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(le, count of observations <= le) per bucket, ending with +Inf."""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append(('+Inf' if bound == float('inf') else f'{bound:g}', total))
+        return result
+
+
+class RequestStats:
+    """Instrumented calls made while handling one request: [count, seconds, rows] per (kind, name)."""
+
+    def __init__(self):
+        self.calls: Dict[Tuple[str, str], List] = {}
+        self._lock = threading.Lock()
+
+    def add(self, kind: str, name: str, seconds: float, rows: Optional[int]):
+        with self._lock:
+            entry = self.calls.setdefault((kind, name), [0, 0.0, 0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] += rows or 0
+
+    def totals(self, kind: str) -> Tuple[int, float, int]:
+        """(calls, seconds, rows) over every name of a kind."""
+        with self._lock:
+            entries = [entry for (k, _), entry in self.calls.items() if k == kind]
+        return (sum(e[0] for e in entries), sum(e[1] for e in entries), sum(e[2] for e in entries))
+
+    def counts(self, kind: str) -> Dict[str, int]:
+        """Call count per name of a kind."""
+        with self._lock:
+            return {name: entry[0] for (k, name), entry in self.calls.items() if k == kind}
+
+
+class MetricsRegistry:
+    """Process-wide histograms of instrumented calls and of requests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations: Dict[Tuple[str, str], Histogram] = {}
+        self.rows: Dict[Tuple[str, str], Histogram] = {}
+        self.errors: Dict[Tuple[str, str], int] = {}
+        self.requests: Dict[Tuple[str, str, int], Histogram] = {}
+        self.request_calls: Dict[Tuple[str, str], Histogram] = {}
+
+    def observe_call(self, kind: str, name: str, seconds: float, rows: Optional[int], error: bool = False):
+        with self._lock:
+            key = (kind, name)
+            if key not in self.durations:
+                self.durations[key] = Histogram(LATENCY_BUCKETS)
+                self.errors[key] = 0
+            self.durations[key].observe(seconds)
+            if rows is not None:
+                self.rows.setdefault(key, Histogram(ROW_BUCKETS)).observe(rows)
+            if error:
+                self.errors[key] += 1
+
+    def observe_request(self, endpoint: str, method: str, status: int, seconds: float, stats: RequestStats):
+        with self._lock:
+            self.requests.setdefault((endpoint, method, status), Histogram(LATENCY_BUCKETS)).observe(seconds)
+            for kind in ('db', 'gateway'):
+                histogram = self.request_calls.setdefault((endpoint, kind), Histogram(CALLS_PER_REQUEST_BUCKETS))
+                histogram.observe(stats.totals(kind)[0])
+
+    def reset(self):
+        with self._lock:
+            for metrics in (self.durations, self.rows, self.errors, self.requests, self.request_calls):
+                metrics.clear()
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for kind, what in (('db', 'database helper'), ('gateway', 'payment gateway')):
+                durations = {(name,): h for (k, name), h in self.durations.items() if k == kind}
+                _render_histogram(lines, f'library_{kind}_call_duration_seconds',
+                                  f'Wall time of {what} calls.', ('name',), durations)
+                rows = {(name,): h for (k, name), h in self.rows.items() if k == kind}
+                if rows:
+                    _render_histogram(lines, f'library_{kind}_call_rows',
+                                      f'Rows returned by {what} calls.', ('name',), rows)
+                metric = f'library_{kind}_call_errors_total'
+                lines.append(f'# HELP {metric} {what.capitalize()} calls that raised.')
+                lines.append(f'# TYPE {metric} counter')
+                for (k, name), count in sorted(self.errors.items()):
+                    if k == kind:
+                        lines.append(f'{metric}{{name="{_escape(name)}"}} {count}')
+
+            _render_histogram(lines, 'library_http_request_duration_seconds', 'Wall time of HTTP requests.',
+                              ('endpoint', 'method', 'status'), self.requests)
+            _render_histogram(lines, 'library_http_request_calls', 'Instrumented calls made per HTTP request.',
+                              ('endpoint', 'kind'), self.request_calls)
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _render_histogram(lines: List[str], metric: str, help_text: str, label_names: Tuple[str, ...],
+                      histograms: Dict[Tuple, Histogram]):
+    """Append one histogram family; histograms are keyed by their label values."""
+    lines.append(f'# HELP {metric} {help_text}')
+    lines.append(f'# TYPE {metric} histogram')
+    for values, histogram in sorted(histograms.items(), key=lambda item: tuple(map(str, item[0]))):
+        labels = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(label_names, values))
+        for le, count in histogram.cumulative():
+            lines.append(f'{metric}_bucket{{{labels},le="{le}"}} {count}')
+        lines.append(f'{metric}_sum{{{labels}}} {histogram.sum:.6g}')
+        lines.append(f'{metric}_count{{{labels}}} {histogram.count}')
+
+def render_cache_stats(caches: Dict[str, Dict]) -> str:
+    """LRUCache.stats() of named caches as Prometheus counters and gauges."""
+    families = (
+        ('hits', 'library_cache_hits_total', 'counter', 'Cache lookups answered from the cache.'),
+        ('misses', 'library_cache_misses_total', 'counter', 'Cache lookups that missed.'),
+        ('size', 'library_cache_entries', 'gauge', 'Entries currently cached.'),
+        ('bytes', 'library_cache_bytes', 'gauge', 'Estimated bytes held by caches with a memory budget.'),
+    )
+    lines: List[str] = []
+    for key, metric, metric_type, help_text in families:
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {metric_type}')
+        for name, stats in sorted(caches.items()):
+            if key in stats:
+                lines.append(f'{metric}{{cache="{_escape(name)}"}} {stats[key]}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+_request_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar('request_stats', default=None)
+
+def start_request() -> contextvars.Token:
+    """Begin collecting the calls made by the current request. Pass the token to finish_request()."""
+    return _request_stats.set(RequestStats())
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+def finish_request(token: contextvars.Token) -> Optional[RequestStats]:
+    """Stop collecting and return the request's calls."""
+    stats = _request_stats.get()
+    _request_stats.reset(token)
+    return stats
+
+
+def _row_count(result) -> Optional[int]:
+    """Rows in a helper's result: list/set length, 1 for a dict, 0 for None; None when not applicable."""
+    if result is None:
+        return 0
+    if isinstance(result, dict):
+        return 1
+    if isinstance(result, (list, set)):
+        return len(result)
+    return None
+
+def _record(kind: str, name: str, seconds: float, rows: Optional[int], stats: Optional[RequestStats],
+            error: bool = False):
+    registry.observe_call(kind, name, seconds, rows, error)
+    if stats is not None:
+        stats.add(kind, name, seconds, rows)
+
+def _instrument_generator(gen: Iterator, kind: str, name: str, seconds: float,
+                          stats: Optional[RequestStats]) -> Iterator:
+    """Count the rows of a streaming result and the time spent producing them; recorded once it ends."""
+    rows = 0
+    error = False
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(gen)
+            except StopIteration:
+                return
+            except BaseException:
+                error = True
+                raise
+            finally:
+                seconds += time.perf_counter() - start
+            rows += 1
+            yield item
+    finally:
+        gen.close()
+        _record(kind, name, seconds, rows, stats, error)
+
+def instrumented(kind: str, name: Optional[str] = None, count_rows: bool = True) -> Callable:
+    """
+    Decorator recording each call's wall time and (with count_rows) rows
+    returned under (kind, name), e.g. ('db', 'get_book_by_id'). Generators
+    returned by the function are timed and counted as they are consumed.
+    """
+    def decorate(fn):
+        label = name or fn.__name__
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if not ENABLED:
+                    return await fn(*args, **kwargs)
+                stats = _request_stats.get()
+                start = time.perf_counter()
+                try:
+                    result = await fn(*args, **kwargs)
+                except BaseException:
+                    _record(kind, label, time.perf_counter() - start, None, stats, error=True)
+                    raise
+                _record(kind, label, time.perf_counter() - start,
+                        _row_count(result) if count_rows else None, stats)
+                return result
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            stats = _request_stats.get()
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                _record(kind, label, time.perf_counter() - start, None, stats, error=True)
+                raise
+            seconds = time.perf_counter() - start
+            if inspect.isgenerator(result):
+                return _instrument_generator(result, kind, label, seconds, stats)
+            _record(kind, label, seconds, _row_count(result) if count_rows else None, stats)
+            return result
+        return wrapper
+
+    return decorate
+
+def record_cache_hit(name: str):
+    """
+    Count a lookup answered from a cache without touching the database, under
+    ('cache', name) in the current request's calls. Cache-wide hit counters
+    are served separately (see render_cache_stats).
+    """
+    if not ENABLED:
+        return
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.add('cache', name, 0.0, None)
+
+def configure_instrumentation(enabled: bool = True):
+    """Turn recording on or off and clear the collected metrics."""
+    global ENABLED
+    ENABLED = enabled
+    registry.reset()
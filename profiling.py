@@ -0,0 +1,149 @@
+"""
+Profiling Module - Opt-in cProfile capture of slow requests
+Requests are profiled while they run; the profile is kept only if the
+request took longer than the threshold, in a bounded on-disk ring buffer.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import tempfile
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+PROFILE_THRESHOLD_MS = 500     # Requests slower than this keep their profile
+PROFILE_SAMPLE_RATE = 1.0      # Fraction of requests profiled (cProfile roughly doubles their CPU time)
+PROFILE_MAX_FILES = 50         # Profiles kept on disk; the oldest is deleted first
+PROFILE_DIR = os.path.join(tempfile.gettempdir(), 'library-profiles')
+
+_PROFILE_ID = re.compile(r'^\d+-[0-9a-f]{8}$')
+
+
+class ProfileStore:
+    """
+    Ring buffer of request profiles in a directory: <id>.prof (pstats dump)
+    plus <id>.json (request details). Holds at most max_profiles.
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR, max_profiles: int = PROFILE_MAX_FILES):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+        self._last_stamp = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, profile_id: str, extension: str) -> str:
+        return os.path.join(self.directory, f'{profile_id}.{extension}')
+
+    def _ids(self) -> List[str]:
+        """Stored profile IDs, oldest first (IDs start with a microsecond timestamp)."""
+        ids = [name[:-5] for name in os.listdir(self.directory) if name.endswith('.json')]
+        return sorted((i for i in ids if _PROFILE_ID.match(i)), key=lambda i: (int(i.split('-')[0]), i))
+
+    def save(self, profile: cProfile.Profile, info: Dict) -> str:
+        """Store a profile with its request details and return its ID, evicting the oldest if full."""
+        with self._lock:
+            # Strictly increasing within the process, so the ring order is exact
+            self._last_stamp = max(time.time_ns() // 1000, self._last_stamp + 1)
+            profile_id = f"{self._last_stamp}-{uuid.uuid4().hex[:8]}"
+            info = dict(info, id=profile_id)
+            profile.dump_stats(self._path(profile_id, 'prof'))
+            # The .json is written last; a profile is listed once it exists
+            with open(self._path(profile_id, 'json'), 'w') as f:
+                json.dump(info, f)
+            ids = self._ids()
+            for old_id in ids[:max(0, len(ids) - self.max_profiles)]:
+                for extension in ('json', 'prof'):
+                    try:
+                        os.remove(self._path(old_id, extension))
+                    except FileNotFoundError:
+                        pass
+        return profile_id
+
+    def list(self) -> List[Dict]:
+        """Details of the stored profiles, newest first."""
+        profiles = []
+        for profile_id in reversed(self._ids()):
+            info = self.get(profile_id)
+            if info is not None:
+                profiles.append(info)
+        return profiles
+
+    def get(self, profile_id: str) -> Optional[Dict]:
+        """A stored profile's request details, or None if unknown or evicted."""
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        try:
+            with open(self._path(profile_id, 'json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def stats_path(self, profile_id: str) -> Optional[str]:
+        """Path of a stored profile's pstats file, or None."""
+        if self.get(profile_id) is None:
+            return None
+        path = self._path(profile_id, 'prof')
+        return path if os.path.exists(path) else None
+
+    def summary(self, profile_id: str, sort: str = 'cumulative', limit: int = 40) -> Optional[str]:
+        """The pstats report of a stored profile, top limit functions by sort key."""
+        path = self.stats_path(profile_id)
+        if path is None:
+            return None
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+
+class SlowRequestProfiler:
+    """Profiles sampled requests and keeps the profiles of those over threshold_ms."""
+
+    def __init__(self, store: ProfileStore, threshold_ms: float = PROFILE_THRESHOLD_MS,
+                 sample_rate: float = PROFILE_SAMPLE_RATE, rng: Callable[[], float] = random.random):
+        self.store = store
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self.rng = rng
+
+    def start(self) -> Optional[cProfile.Profile]:
+        """Start profiling the current request if it is sampled; returns the profiler or None."""
+        if self.sample_rate < 1 and self.rng() >= self.sample_rate:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active (e.g. a concurrent request on Python 3.12+)
+            return None
+        return profile
+
+    def finish(self, profile: cProfile.Profile, duration_ms: float, info: Dict) -> Optional[str]:
+        """Stop profiling; store the profile if the request was slow. Returns its ID if stored."""
+        profile.disable()
+        if duration_ms < self.threshold_ms:
+            return None
+        return self.store.save(profile, dict(info, duration_ms=round(duration_ms, 2)))
+
+
+_profiler: Optional[SlowRequestProfiler] = None
+
+def configure_profiler(enabled: bool = False, threshold_ms: float = PROFILE_THRESHOLD_MS,
+                       sample_rate: float = PROFILE_SAMPLE_RATE, directory: Optional[str] = None,
+                       max_profiles: int = PROFILE_MAX_FILES) -> Optional[SlowRequestProfiler]:
+    """Turn slow request profiling on (with these settings) or off."""
+    global _profiler
+    _profiler = SlowRequestProfiler(
+        ProfileStore(directory or PROFILE_DIR, max_profiles), threshold_ms, sample_rate
+    ) if enabled else None
+    return _profiler
+
+def get_profiler() -> Optional[SlowRequestProfiler]:
+    """The active slow request profiler, or None when profiling is off."""
+    return _profiler
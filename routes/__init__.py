@@ -6,6 +6,9 @@ from .catalog_routes import catalog_bp
 from .borrowing_routes import borrowing_bp
 from .search_routes import search_bp
 from .api_routes import api_bp
+from .payment_routes import payment_bp
+from .metrics_routes import metrics_bp
+from .profiling_routes import profiling_bp
 
 def register_blueprints(app):
     """Register all route blueprints with the Flask app."""
@@ -13,3 +16,6 @@ def register_blueprints(app):
     app.register_blueprint(borrowing_bp)
     app.register_blueprint(search_bp)
     app.register_blueprint(api_bp)
+    app.register_blueprint(payment_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(profiling_bp)
@@ -2,11 +2,25 @@
 API Routes - JSON API endpoints
 """
 
-from flask import Blueprint, jsonify, request
-from services.library_service import calculate_late_fee_for_book, search_books_in_catalog
+import io
+import json
+import shutil
+import tempfile
+from datetime import datetime
+from flask import Blueprint, Response, jsonify, request
+from services.library_service import (
+    calculate_late_fee_for_book, search_books_in_catalog, get_catalog_page, list_overdue_loans,
+    CATALOG_PAGE_SIZE
+)
+from services.billing_service import calculate_all_late_fees
+from services.import_service import import_books
+from services.export_service import export_dataset, gzip_chunks, EXPORT_CONTENT_TYPES
+from http_cache import cached_catalog_response
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
+IMPORT_SPOOL_MAX_MEMORY = 8 * 1024 * 1024  # Raw import bodies larger than this are spooled to disk
+
 @api_bp.route('/late_fee/<patron_id>/<int:book_id>')
 def get_late_fee(patron_id, book_id):
     """
@@ -16,7 +30,60 @@ def get_late_fee(patron_id, book_id):
     result = calculate_late_fee_for_book(patron_id, book_id)
     return jsonify(result), 501 if 'not implemented' in result.get('status', '') else 200
 
+@api_bp.route('/late_fees')
+def get_all_late_fees():
+    """
+    Outstanding late fees for every overdue loan, with per-patron totals.
+    Batch counterpart to the R4 late fee endpoint, for billing and dashboards.
+    """
+    return jsonify(calculate_all_late_fees())
+
+@api_bp.route('/overdue')
+def list_overdue_api():
+    """
+    Stream every overdue loan as a JSON array, most overdue first.
+    Narrow it down with ?patron_id= or ?book_id=.
+    """
+    patron_id = request.args.get('patron_id', '').strip() or None
+    book_id = request.args.get('book_id', '').strip() or None
+    if book_id is not None:
+        if not book_id.isdigit():
+            return jsonify({'error': 'Invalid book ID'}), 400
+        book_id = int(book_id)
+
+    loans, error = list_overdue_loans(patron_id, book_id)
+    if error:
+        return jsonify({'error': error}), 400
+
+    def generate():
+        yield '['
+        for i, loan in enumerate(loans):
+            yield (',' if i else '') + json.dumps(loan, default=datetime.isoformat)
+        yield ']'
+
+    return Response(generate(), mimetype='application/json')
+
+@api_bp.route('/export/<dataset>')
+def export_api(dataset):
+    """
+    Stream a full export of books, open loans or the borrow history
+    (/api/export/books|loans|history) as ?format=ndjson (default) or csv.
+    The body is gzipped when the client accepts gzip.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    chunks, error = export_dataset(dataset, export_format)
+    if error:
+        return jsonify({'error': error}), 400
+
+    headers = {'Content-Disposition': f'attachment; filename={dataset}.{export_format}'}
+    if 'gzip' in request.accept_encodings:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    headers['Vary'] = 'Accept-Encoding'
+    return Response(chunks, mimetype=EXPORT_CONTENT_TYPES[export_format], headers=headers)
+
 @api_bp.route('/search')
+@cached_catalog_response
 def search_books_api():
     """
     Search for books via API endpoint.
@@ -37,3 +104,51 @@ def search_books_api():
         'results': books,
         'count': len(books)
     })
+
+@api_bp.route('/books')
+def list_books_api():
+    """
+    List the catalog one page at a time via API endpoint.
+    Pass the returned next_cursor back as ?cursor= to get the following page.
+    """
+    cursor = request.args.get('cursor', '').strip()
+    page_size = request.args.get('page_size', CATALOG_PAGE_SIZE, type=int)
+    
+    page = get_catalog_page(cursor, page_size)
+    if page is None:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    return jsonify({
+        'results': page['books'],
+        'count': len(page['books']),
+        'page_size': page['page_size'],
+        'next_cursor': page['next_cursor']
+    })
+
+@api_bp.route('/books/import', methods=['POST'])
+def import_books_api():
+    """
+    Bulk import books from an uploaded CSV or JSONL file.
+    Send the file as multipart field 'file', or as the raw request body.
+    The format comes from ?format=, else from the uploaded file name (default csv).
+    """
+    upload = request.files.get('file')
+    filename = upload.filename if upload else ''
+    file_format = request.args.get('format') or (
+        'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+    )
+
+    # import_books reads the file inside the write transaction. Multipart
+    # uploads are already parsed, but a raw body still arrives at the
+    # client's pace, so receive it in full first or a slow upload would hold
+    # up every other write.
+    with tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_MAX_MEMORY) as spool:
+        if upload:
+            raw = upload.stream
+        else:
+            shutil.copyfileobj(request.stream, spool)
+            spool.seek(0)
+            raw = spool
+        stream = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+        result = import_books(stream, file_format)
+    return jsonify(result), 200 if result['success'] else 400
@@ -3,8 +3,8 @@ Catalog Routes - Book catalog related endpoints
 """
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash
-from database import get_all_books
-from services.library_service import add_book_to_catalog
+from services.library_service import add_book_to_catalog, get_catalog_page, CATALOG_PAGE_SIZE
+from http_cache import cached_catalog_response
 
 catalog_bp = Blueprint('catalog', __name__)
 
@@ -14,13 +14,23 @@ def index():
     return redirect(url_for('catalog.catalog'))
 
 @catalog_bp.route('/catalog')
+@cached_catalog_response
 def catalog():
     """
-    Display all books in the catalog.
+    Display the catalog one page at a time.
     Implements R2: Book Catalog Display
     """
-    books = get_all_books()
-    return render_template('catalog.html', books=books)
+    cursor = request.args.get('cursor', '').strip()
+    page_size = request.args.get('page_size', CATALOG_PAGE_SIZE, type=int)
+    
+    page = get_catalog_page(cursor, page_size)
+    if page is None:
+        flash('Invalid page cursor. Showing the first page.', 'error')
+        cursor = ''
+        page = get_catalog_page(None, page_size)
+    
+    return render_template('catalog.html', books=page['books'], next_cursor=page['next_cursor'],
+                           page_size=page['page_size'], is_first_page=not cursor)
 
 @catalog_bp.route('/add_book', methods=['GET', 'POST'])
 def add_book():
@@ -0,0 +1,74 @@
+"""
+Metrics Routes - Per-request instrumentation and the Prometheus /metrics endpoint
+"""
+
+import time
+from flask import Blueprint, Response, current_app, g, request
+import instrumentation
+from instrumentation import registry, render_cache_stats, start_request, finish_request
+from database import get_book_cache_stats
+from http_cache import get_response_cache_stats
+from services.search_cache import get_search_cache_stats
+
+metrics_bp = Blueprint('metrics', __name__)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+@metrics_bp.before_app_request
+def start_request_metrics():
+    """Collect the database and gateway calls made by this request."""
+    g.metrics_token = start_request()
+    g.metrics_started = time.perf_counter()
+
+@metrics_bp.after_app_request
+def finish_request_metrics(response):
+    """
+    Record the request in the /metrics histograms and, in debug mode (or with
+    METRICS_DEBUG_HEADERS), report its calls in X-DB-* / X-Gateway-* headers and
+    the lookups answered from caches in X-Cache-Hits.
+    A streamed body is produced after this runs, so its rows are not included.
+    """
+    token = g.pop('metrics_token', None)
+    if token is None:
+        return response
+    stats = finish_request(token)
+    if not instrumentation.ENABLED:
+        return response
+
+    elapsed = time.perf_counter() - g.pop('metrics_started')
+    registry.observe_request(request.endpoint or 'unmatched', request.method, response.status_code, elapsed, stats)
+
+    if current_app.debug or current_app.config.get('METRICS_DEBUG_HEADERS'):
+        db_calls, db_seconds, db_rows = stats.totals('db')
+        gateway_calls, gateway_seconds, _ = stats.totals('gateway')
+        response.headers['X-DB-Calls'] = str(db_calls)
+        response.headers['X-DB-Time-Ms'] = f'{db_seconds * 1000:.2f}'
+        response.headers['X-DB-Rows'] = str(db_rows)
+        response.headers['X-Gateway-Calls'] = str(gateway_calls)
+        response.headers['X-Gateway-Time-Ms'] = f'{gateway_seconds * 1000:.2f}'
+        helpers = sorted(stats.counts('db').items(), key=lambda item: (-item[1], item[0]))
+        if helpers:
+            response.headers['X-DB-Helpers'] = ', '.join(f'{name}={count}' for name, count in helpers)
+        cache_hits = sorted(stats.counts('cache').items(), key=lambda item: (-item[1], item[0]))
+        if cache_hits:
+            response.headers['X-Cache-Hits'] = ', '.join(f'{name}={count}' for name, count in cache_hits)
+    return response
+
+@metrics_bp.teardown_app_request
+def discard_request_metrics(exc):
+    """Stop collecting for a request that ended without a response (unhandled error)."""
+    token = g.pop('metrics_token', None)
+    if token is not None:
+        finish_request(token)
+
+@metrics_bp.route('/metrics')
+def metrics():
+    """Database helper, gateway and request histograms, and cache hit counters, in the Prometheus text format."""
+    book_cache = get_book_cache_stats()
+    caches = {
+        'books': book_cache['books'],
+        'isbns': book_cache['isbns'],
+        'responses': get_response_cache_stats(),
+        'search': get_search_cache_stats(),
+    }
+    return Response(registry.render() + render_cache_stats(caches), content_type=PROMETHEUS_CONTENT_TYPE)
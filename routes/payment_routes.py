@@ -0,0 +1,111 @@
+"""
+Payment Routes - Late fee payment endpoints
+"""
+
+from flask import Blueprint, jsonify, request, url_for
+from services.library_service import pay_all_late_fees, get_payment_breakdown
+from services.payment_queue import enqueue_late_fee_payment, get_payment_job_status
+from services.resilient_gateway import get_gateway_metrics
+from services.idempotency import MAX_IDEMPOTENCY_KEY_LENGTH
+from services.payment_status import verify_payment_status, verify_payment_statuses, MAX_BULK_STATUS_LOOKUP
+
+payment_bp = Blueprint('payments', __name__, url_prefix='/api/payments')
+
+def _idempotency_key():
+    """The request's Idempotency-Key header (None if absent), or raise ValueError if too long."""
+    key = request.headers.get('Idempotency-Key', '').strip() or None
+    if key and len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise ValueError(f"Idempotency-Key must be at most {MAX_IDEMPOTENCY_KEY_LENGTH} characters.")
+    return key
+
+@payment_bp.route('/late_fees', methods=['POST'])
+def queue_late_fee_payment():
+    """
+    Queue a late fee payment and return a pending job handle right away.
+    Poll the returned status_url for the outcome. Repeating a request with
+    the same Idempotency-Key header returns the original job.
+    """
+    data = request.get_json(silent=True) or request.form
+    patron_id = str(data.get('patron_id', '')).strip()
+    
+    try:
+        book_id = int(data.get('book_id', ''))
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid book ID.'}), 400
+    
+    try:
+        idempotency_key = _idempotency_key()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    success, message, job_id = enqueue_late_fee_payment(patron_id, book_id, idempotency_key)
+    if not success:
+        return jsonify({'error': message}), 400
+    
+    job = get_payment_job_status(job_id)
+    return jsonify({
+        'job_id': job_id,
+        'status': job['status'] if job else 'pending',
+        'message': message,
+        'status_url': url_for('payments.payment_status', job_id=job_id)
+    }), 202
+
+@payment_bp.route('/late_fees/all', methods=['POST'])
+def pay_all_outstanding_late_fees():
+    """
+    Pay all of a patron's outstanding late fees with one gateway charge.
+    The response includes how the total splits across books. Repeating a
+    request with the same Idempotency-Key header does not charge again.
+    """
+    data = request.get_json(silent=True) or request.form
+    patron_id = str(data.get('patron_id', '')).strip()
+    
+    try:
+        idempotency_key = _idempotency_key()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    success, message, transaction_id = pay_all_late_fees(patron_id, idempotency_key=idempotency_key)
+    if not success:
+        return jsonify({'error': message}), 400
+    
+    breakdown = get_payment_breakdown(transaction_id)
+    return jsonify({
+        'transaction_id': transaction_id,
+        'message': message,
+        'total': round(sum(item['amount'] for item in breakdown), 2),
+        'books': breakdown
+    })
+
+@payment_bp.route('/gateway/metrics')
+def gateway_metrics():
+    """Circuit breaker state, retry budget and call counters of the payment gateway client."""
+    return jsonify(get_gateway_metrics())
+
+@payment_bp.route('/transactions/<transaction_id>/status')
+def transaction_status(transaction_id):
+    """Gateway status of one transaction (cached)."""
+    return jsonify(verify_payment_status(transaction_id))
+
+@payment_bp.route('/transactions/status', methods=['POST'])
+def bulk_transaction_status():
+    """
+    Gateway status of many transactions, checked concurrently.
+    Body: {"transaction_ids": [...]}; response is keyed by transaction ID.
+    """
+    data = request.get_json(silent=True) or {}
+    transaction_ids = data.get('transaction_ids')
+    if not isinstance(transaction_ids, list) or not all(isinstance(txn, str) for txn in transaction_ids):
+        return jsonify({'error': 'transaction_ids must be a list of strings.'}), 400
+    if len(transaction_ids) > MAX_BULK_STATUS_LOOKUP:
+        return jsonify({'error': f'At most {MAX_BULK_STATUS_LOOKUP} transactions per request.'}), 400
+    
+    return jsonify(verify_payment_statuses(transaction_ids))
+
+@payment_bp.route('/<job_id>')
+def payment_status(job_id):
+    """Status of a queued payment."""
+    job = get_payment_job_status(job_id)
+    if job is None:
+        return jsonify({'error': 'Payment job not found.'}), 404
+    return jsonify(job)
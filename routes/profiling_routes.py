@@ -0,0 +1,88 @@
+"""
+Profiling Routes - Slow request profiling hooks and the admin profile listing
+Only active when the app is created with PROFILE_SLOW_REQUESTS.
+"""
+
+import time
+from datetime import datetime
+from flask import Blueprint, Response, abort, g, jsonify, request, send_file
+from profiling import get_profiler
+
+profiling_bp = Blueprint('profiling', __name__, url_prefix='/admin/profiles')
+
+@profiling_bp.before_app_request
+def start_profile():
+    """Profile the request if profiling is on and the request is sampled."""
+    profiler = get_profiler()
+    if profiler is None:
+        return
+    g.profile = profiler.start()
+    g.profile_started = time.perf_counter()
+
+@profiling_bp.after_app_request
+def finish_profile(response):
+    """
+    Keep the profile of a request slower than the threshold. A streamed body
+    is produced after this runs and is not part of the profile.
+    """
+    profile = g.pop('profile', None)
+    profiler = get_profiler()
+    if profile is None or profiler is None:
+        return response
+    duration_ms = (time.perf_counter() - g.pop('profile_started')) * 1000
+    profile_id = profiler.finish(profile, duration_ms, {
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'recorded_at': datetime.now().isoformat(timespec='seconds'),
+    })
+    if profile_id:
+        response.headers['X-Profile-Id'] = profile_id
+    return response
+
+@profiling_bp.teardown_app_request
+def discard_profile(exc):
+    """Stop a profile left running by a request that ended with an unhandled error."""
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.disable()
+
+def _profile_store():
+    profiler = get_profiler()
+    if profiler is None:
+        abort(404)
+    return profiler.store
+
+@profiling_bp.route('')
+def list_profiles():
+    """Stored slow request profiles, newest first."""
+    store = _profile_store()
+    profiles = store.list()
+    return jsonify({
+        'threshold_ms': get_profiler().threshold_ms,
+        'profiles': profiles,
+        'count': len(profiles)
+    })
+
+@profiling_bp.route('/<profile_id>')
+def show_profile(profile_id):
+    """
+    A stored profile as a pstats report (?sort=cumulative|tottime|calls, ?limit=40),
+    or the raw pstats file with ?format=raw (load it with pstats or snakeviz).
+    """
+    store = _profile_store()
+    if request.args.get('format') == 'raw':
+        path = store.stats_path(profile_id)
+        if path is None:
+            abort(404)
+        return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                         download_name=f'{profile_id}.prof')
+
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in ('cumulative', 'tottime', 'calls'):
+        return jsonify({'error': 'sort must be cumulative, tottime or calls'}), 400
+    summary = store.summary(profile_id, sort, request.args.get('limit', 40, type=int))
+    if summary is None:
+        abort(404)
+    return Response(summary, mimetype='text/plain')
@@ -0,0 +1,249 @@
+"""
+Billing Service Module - Library-wide late fee computation and nightly billing
+Batch counterpart to calculate_late_fee_for_book for nightly billing and dashboards
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; fall back to the scalar fee schedule
+    np = None
+
+from database import (
+    get_open_loans, get_paid_late_fees, to_epoch, create_billing_run, get_billing_run, get_billing_run_patrons,
+    get_billing_run_charged_total, retry_failed_billing_patrons, update_billing_run_patron,
+    finish_billing_run
+)
+from services.library_service import _late_fee_for_days, _unpaid, pay_all_late_fees
+
+BILLING_CONCURRENCY = 8     # Patrons charged at once
+BILLING_RATE_LIMIT = 10.0   # Gateway charges per second (0 for no limit)
+
+SECONDS_PER_DAY = 86400
+
+
+def _is_valid_patron_id(patron_id: str) -> bool:
+    return bool(patron_id) and patron_id.isdigit() and len(patron_id) == 6
+
+def _fees_numpy(due_dates: Sequence[int], valid: Sequence[bool], now: datetime) -> Tuple[List[int], List[float]]:
+    """Days overdue and fees for all loans at once, as NumPy array operations."""
+    due = np.array(due_dates, dtype=np.int64)
+    # Floor division by one day matches timedelta.days on naive datetimes
+    days = (to_epoch(now) - due) // SECONDS_PER_DAY
+
+    fees = np.where(days <= 7, days * 0.50, (7 * 0.50) + (days - 7) * 1.00)
+    fees = np.round(np.minimum(fees, 15.0), 2)
+
+    overdue = (days > 0) & np.array(valid, dtype=bool)
+    fees = np.where(overdue, fees, 0.0)
+    days = np.where(overdue, days, 0)
+    return days.tolist(), fees.tolist()
+
+def _fees_python(due_dates: Sequence[int], valid: Sequence[bool], now: datetime) -> Tuple[List[int], List[float]]:
+    """Days overdue and fees loan by loan, used when NumPy is not installed."""
+    now_epoch = to_epoch(now)
+    days, fees = [], []
+    for due_date, is_valid in zip(due_dates, valid):
+        days_overdue = (now_epoch - due_date) // SECONDS_PER_DAY
+        if not is_valid or days_overdue <= 0:
+            days_overdue = 0
+        days.append(days_overdue)
+        fees.append(_late_fee_for_days(days_overdue))
+    return days, fees
+
+def calculate_all_late_fees(now: Optional[datetime] = None) -> Dict:
+    """
+    Calculate outstanding late fees for every open loan in the library.
+
+    Open loans are read in one query and the fee schedule of
+    calculate_late_fee_for_book ($0.50/day for 7 days, then $1.00/day,
+    capped at $15.00) is applied to all of them at once. What is due on a
+    loan is its fee less the payments already allocated to it and not
+    refunded, so a loan that was paid for is only billed for what accrued
+    since.
+
+    Args:
+        now: Time to calculate fees at (defaults to the current time)
+
+    Returns:
+        dict: {
+            'loans': List[Dict],               # Overdue loans: loan_id, patron_id, book_id, days_overdue,
+                                               # fee_amount, amount_due
+            'patron_totals': Dict[str, float],  # Total due per patron, for patrons who owe anything
+            'total_late_fees': float            # Total due
+        }
+    """
+    now = now or datetime.now()
+    summary = {'loans': [], 'patron_totals': {}, 'total_late_fees': 0.0}
+
+    loans = get_open_loans()
+    if not loans:
+        return summary
+
+    loan_ids, patron_ids, book_ids, due_dates = zip(*loans)
+    # calculate_late_fee_for_book charges nothing for malformed patron IDs
+    valid = [_is_valid_patron_id(patron_id) for patron_id in patron_ids]
+
+    if np is not None:
+        days, fees = _fees_numpy(due_dates, valid, now)
+    else:
+        days, fees = _fees_python(due_dates, valid, now)
+
+    paid = get_paid_late_fees()
+    patron_totals = summary['patron_totals']
+    for i, fee in enumerate(fees):
+        if fee <= 0:
+            continue
+        amount_due = _unpaid(fee, paid.get(loan_ids[i], 0.0))
+        summary['loans'].append({
+            'loan_id': loan_ids[i],
+            'patron_id': patron_ids[i],
+            'book_id': book_ids[i],
+            'days_overdue': days[i],
+            'fee_amount': fee,
+            'amount_due': amount_due
+        })
+        if amount_due > 0:
+            patron_totals[patron_ids[i]] = patron_totals.get(patron_ids[i], 0.0) + amount_due
+
+    summary['total_late_fees'] = sum(patron_totals.values())
+    return summary
+
+
+class RateLimiter:
+    """Token bucket allowing rate acquisitions per second, in bursts of up to burst."""
+
+    def __init__(self, rate: float, burst: int = 1, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Taking the token up front (possibly going negative) reserves this
+            # caller's slot, so waiting callers are spaced 1/rate apart
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            self.sleep(wait)
+
+
+def _billing_summary(run_id: str) -> Dict:
+    patrons = get_billing_run_patrons(run_id)
+    counts = {status: 0 for status in ('charged', 'failed', 'skipped', 'pending')}
+    for patron in patrons:
+        counts[patron['status']] += 1
+    # What the gateway charged, which can differ from the amount due at the start of the run
+    total = round(get_billing_run_charged_total(run_id), 2)
+    return {
+        'success': True,
+        'run_id': run_id,
+        'patrons': len(patrons),
+        **counts,
+        'total_charged': total,
+        'message': (f"Billing run {run_id}: charged {counts['charged']} patron(s) ${total:.2f}; "
+                    f"{counts['failed']} failed, {counts['skipped']} had nothing to pay.")
+    }
+
+def start_billing_run(now: Optional[datetime] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Record a new billing run with every patron who owes late fees not yet paid, without charging anyone yet.
+
+    Returns:
+        tuple: (run_id: Optional[str], error: Optional[str])
+    """
+    now = now or datetime.now()
+    run_id = f"billing_{now:%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:6]}"
+    amounts_due = calculate_all_late_fees(now)['patron_totals']
+    if not create_billing_run(run_id, amounts_due, datetime.now()):
+        return None, "Database error occurred while starting the billing run."
+    return run_id, None
+
+def run_nightly_billing(concurrency: int = BILLING_CONCURRENCY, rate_limit: float = BILLING_RATE_LIMIT,
+                        resume_run_id: Optional[str] = None, payment_gateway=None,
+                        now: Optional[datetime] = None) -> Dict:
+    """
+    Charge every patron with overdue loans for all of their late fees.
+
+    Patrons who still owe fees are found with calculate_all_late_fees (so
+    fees paid by an earlier run are not billed again) and charged one
+    gateway payment each (pay_all_late_fees) on a pool of concurrency
+    threads, at no more than rate_limit charges per second. Each patron's
+    outcome is checkpointed in billing_run_patrons, so an interrupted run can
+    be resumed: resuming charges the patrons still pending and retries the
+    failed ones. Every charge carries an idempotency key for its run, patron
+    and attempt, so a patron charged just before an interruption is not
+    charged again.
+
+    Args:
+        concurrency: Worker threads charging patrons
+        rate_limit: Maximum gateway charges per second (0 for no limit)
+        resume_run_id: ID of a run to continue (from start_billing_run, or an
+            interrupted one) instead of starting a new one
+        payment_gateway: Payment gateway instance (injectable for testing)
+        now: Time to calculate fees at when starting a run (defaults to the current time)
+
+    Returns:
+        dict: {'success', 'run_id', 'patrons', 'charged', 'failed', 'skipped',
+        'pending', 'total_charged', 'message'}
+    """
+    if resume_run_id is None:
+        run_id, error = start_billing_run(now)
+        if error:
+            return {'success': False, 'run_id': None, 'message': error}
+    else:
+        run_id = resume_run_id
+        if get_billing_run(run_id) is None:
+            return {'success': False, 'run_id': run_id, 'message': "Billing run not found."}
+        if retry_failed_billing_patrons(run_id) is None:
+            return {'success': False, 'run_id': run_id,
+                    'message': "Database error occurred while resuming the billing run."}
+
+    limiter = RateLimiter(rate_limit) if rate_limit else None
+
+    def charge(patron: Dict):
+        if limiter is not None:
+            limiter.acquire()
+        key = f"{run_id}:{patron['patron_id']}:{patron['attempts']}"
+        success, message, transaction_id = pay_all_late_fees(
+            patron['patron_id'], payment_gateway, idempotency_key=key
+        )
+        if success:
+            status = 'charged'
+        elif message == "No late fees to pay.":
+            status = 'skipped'
+        else:
+            status = 'failed'
+        update_billing_run_patron(run_id, patron['patron_id'], status, message, transaction_id)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='billing')
+    try:
+        futures = [pool.submit(charge, patron) for patron in get_billing_run_patrons(run_id, 'pending')]
+        for future in as_completed(futures):
+            future.result()
+    except BaseException:
+        # Interrupted: let in-flight charges finish and checkpoint, drop the rest
+        pool.shutdown(wait=True, cancel_futures=True)
+        finish_billing_run(run_id, 'interrupted', datetime.now())
+        raise
+    pool.shutdown()
+
+    summary = _billing_summary(run_id)
+    finish_billing_run(run_id, 'completed' if not summary['failed'] else 'completed_with_failures',
+                       datetime.now())
+    return summary
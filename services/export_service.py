@@ -0,0 +1,90 @@
+"""
+Export Service Module - Streaming exports of the catalog and loan records
+Rows are read from the database in chunks and written out as NDJSON or CSV
+as they arrive, so memory use does not grow with the size of the table.
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from database import iter_books, iter_open_loans, iter_borrow_history, EXPORT_FETCH_SIZE
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+EXPORT_CONTENT_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+# Dataset name -> (row source, CSV columns)
+EXPORT_DATASETS = {
+    'books': (iter_books, ('id', 'title', 'author', 'isbn', 'total_copies', 'available_copies')),
+    'loans': (iter_open_loans, ('loan_id', 'patron_id', 'book_id', 'borrow_date', 'due_date')),
+    'history': (iter_borrow_history,
+                ('loan_id', 'patron_id', 'book_id', 'borrow_date', 'due_date', 'return_date')),
+}
+
+GZIP_LEVEL = 6
+
+
+def _to_text(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def _ndjson_chunks(rows: Iterable[Dict], chunk_rows: int) -> Iterator[str]:
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, default=datetime.isoformat))
+        if len(lines) >= chunk_rows:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+def _csv_chunks(rows: Iterable[Dict], columns, chunk_rows: int) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    pending = 0
+    for row in rows:
+        writer.writerow([_to_text(row[column]) for column in columns])
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+def export_dataset(dataset: str, export_format: str,
+                   chunk_rows: int = EXPORT_FETCH_SIZE) -> Tuple[Optional[Iterator[str]], Optional[str]]:
+    """
+    Stream a dataset as NDJSON (one object per line) or CSV (with a header row).
+    Dates are ISO-8601 text. The database is read lazily as the result is
+    consumed, chunk_rows rows per piece of output.
+
+    Args:
+        dataset: One of EXPORT_DATASETS ('books', 'loans', 'history')
+        export_format: One of EXPORT_FORMATS ('ndjson', 'csv')
+
+    Returns:
+        tuple: (chunks: Optional[Iterator[str]], error: Optional[str])
+    """
+    if dataset not in EXPORT_DATASETS:
+        return None, f"Unknown dataset. Use one of: {', '.join(EXPORT_DATASETS)}."
+    if export_format not in EXPORT_FORMATS:
+        return None, f"Unsupported format. Use one of: {', '.join(EXPORT_FORMATS)}."
+
+    source, columns = EXPORT_DATASETS[dataset]
+    rows = source(chunk_rows)
+    if export_format == 'ndjson':
+        return _ndjson_chunks(rows, chunk_rows), None
+    return _csv_chunks(rows, columns, chunk_rows), None
+
+def gzip_chunks(chunks: Iterable[str], level: int = GZIP_LEVEL) -> Iterator[bytes]:
+    """Gzip a stream of text chunks incrementally, as UTF-8."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: gzip header and trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,124 @@
+"""
+Idempotency Module - Replay stored results of repeated payment API calls
+A request carrying an idempotency key it has already used gets the stored
+result back without the payment gateway being contacted again.
+"""
+
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+import database
+from cache import LRUCache
+from database import (
+    claim_idempotency_key, complete_idempotency_key, release_idempotency_key,
+    get_idempotency_key, delete_idempotency_keys_before
+)
+
+IDEMPOTENCY_RETENTION_HOURS = 24
+IDEMPOTENCY_CACHE_SIZE = 1024
+IDEMPOTENCY_CLAIM_LEASE_SECONDS = 300  # A claim without a result is abandoned (e.g. crashed) after this
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+
+def _request_hash(params: Dict) -> str:
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+def _failure(message: str, result_size: int) -> Tuple:
+    """(False, message) padded with None to the operation's result size."""
+    return (False, message) + (None,) * (result_size - 2)
+
+
+class IdempotencyStore:
+    """
+    Results of keyed requests, stored in the idempotency_keys table with an
+    in-memory LRU in front. Keys are scoped per operation and expire after
+    the retention window.
+
+    Every outcome is stored, failures included: a charge that timed out may
+    still have gone through, so a retry with the same key must not reach the
+    gateway again. Clients use a new key to try again.
+
+    A key is claimed while its request runs. If the process dies before the
+    result is stored, the claim is taken over by a retry once it is older
+    than claim_lease_seconds, so the lease must outlast the slowest request.
+    """
+
+    def __init__(self, retention_hours: float = IDEMPOTENCY_RETENTION_HOURS,
+                 cache_size: int = IDEMPOTENCY_CACHE_SIZE,
+                 claim_lease_seconds: float = IDEMPOTENCY_CLAIM_LEASE_SECONDS):
+        self.retention = timedelta(hours=retention_hours)
+        self.claim_lease = timedelta(seconds=claim_lease_seconds)
+        self.cache = LRUCache(cache_size)
+
+    def run(self, operation: str, key: str, params: Dict, fn: Callable[[], Tuple],
+            result_size: int = 3) -> Tuple:
+        """
+        Call fn() once per (operation, key) and return its result tuple;
+        later calls with the same key return the stored result.
+
+        Args:
+            operation: Name of the API call, e.g. 'pay_late_fees'
+            key: Client-supplied idempotency key
+            params: Request parameters; reusing a key with different ones is an error
+            fn: Performs the request; returns a tuple of JSON-serializable values
+            result_size: Length of fn's result, (success, message[, id]); errors
+                reported by the store itself have the same shape
+        """
+        request_hash = _request_hash(params)
+        now = datetime.now()
+        expired_before = now - self.retention
+        # Tests and tools switch DATABASE, so cache entries are per database
+        cache_key = (database.DATABASE, operation, key)
+
+        record = self.cache.get(cache_key)
+        if record is not None and datetime.fromisoformat(record['created_at']) >= expired_before:
+            return self._replay(record, request_hash, result_size)
+
+        if not claim_idempotency_key(operation, key, request_hash, now, expired_before, now - self.claim_lease):
+            record = get_idempotency_key(operation, key)
+            if record is None or record['result'] is None:
+                return _failure("A request with this idempotency key is still being processed.", result_size)
+            self.cache.put(cache_key, record)
+            return self._replay(record, request_hash, result_size)
+
+        try:
+            result = fn()
+        except Exception:
+            release_idempotency_key(operation, key)
+            raise
+
+        encoded = json.dumps(list(result))
+        if complete_idempotency_key(operation, key, encoded):
+            self.cache.put(cache_key, {'request_hash': request_hash, 'result': encoded,
+                                       'created_at': now.isoformat()})
+        return result
+
+    @staticmethod
+    def _replay(record: Dict, request_hash: str, result_size: int) -> Tuple:
+        if record['request_hash'] != request_hash:
+            return _failure("This idempotency key was already used for a different request.", result_size)
+        return tuple(json.loads(record['result']))
+
+    def purge_expired(self) -> Optional[int]:
+        """Delete stored keys past the retention window. Returns the number deleted."""
+        self.cache.clear()
+        return delete_idempotency_keys_before(datetime.now() - self.retention)
+
+
+_store: Optional[IdempotencyStore] = None
+
+def configure_idempotency_store(retention_hours: float = IDEMPOTENCY_RETENTION_HOURS,
+                                cache_size: int = IDEMPOTENCY_CACHE_SIZE,
+                                claim_lease_seconds: float = IDEMPOTENCY_CLAIM_LEASE_SECONDS) -> IdempotencyStore:
+    """Replace the process-wide idempotency store."""
+    global _store
+    _store = IdempotencyStore(retention_hours, cache_size, claim_lease_seconds)
+    return _store
+
+def get_idempotency_store() -> IdempotencyStore:
+    """The process-wide idempotency store, created with default settings on first use."""
+    if _store is None:
+        configure_idempotency_store()
+    return _store
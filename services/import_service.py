@@ -0,0 +1,132 @@
+"""
+Import Service Module - Bulk catalog import from CSV or JSONL
+Applies the R1 validation rules to every row and inserts valid books in batches
+"""
+
+import csv
+import json
+from typing import Dict, IO, Iterator, List, Optional, Tuple
+
+from database import get_all_isbns, insert_books_bulk, bump_catalog_version, BULK_INSERT_BATCH_SIZE
+from services.library_service import validate_book_fields
+from services.search_index import get_search_index, build_search_index
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+IMPORT_FIELDS = ('title', 'author', 'isbn', 'total_copies')
+
+
+def _read_csv(stream: IO[str]) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """Yield (row number, fields, parse error) for a CSV file with a header row."""
+    reader = csv.DictReader(stream)
+    missing = [field for field in IMPORT_FIELDS if field not in (reader.fieldnames or [])]
+    if missing:
+        yield 1, None, f"Missing column(s): {', '.join(missing)}."
+        return
+    for row in reader:
+        yield reader.line_num, row, None
+
+def _read_jsonl(stream: IO[str]) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """Yield (line number, fields, parse error) for a file with one JSON object per line."""
+    for line_num, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_num, None, "Invalid JSON."
+            continue
+        if not isinstance(row, dict):
+            yield line_num, None, "Each line must be a JSON object."
+            continue
+        yield line_num, row, None
+
+def _parse_copies(value) -> Optional[int]:
+    """total_copies as an int, accepting digit strings from CSV; None if not an integer."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            return None
+    return None
+
+def import_books(stream: IO[str], file_format: str, batch_size: int = BULK_INSERT_BATCH_SIZE) -> Dict:
+    """
+    Import books from a CSV or JSONL text stream.
+
+    Every row goes through the same validation as add_book_to_catalog. ISBNs
+    are checked against the catalog (loaded once) and against earlier rows of
+    the file. Valid rows are inserted in executemany batches inside a single
+    transaction, so either all of them are imported or none are.
+
+    Args:
+        stream: Text stream with a header row (CSV) or one JSON object per line (JSONL),
+            with fields title, author, isbn and total_copies
+        file_format: 'csv' or 'jsonl'
+        batch_size: Rows per executemany batch
+
+    Returns:
+        dict: {
+            'success': bool,
+            'imported': int,
+            'errors': List[Dict],   # {'row': int, 'isbn': Optional[str], 'message': str}
+            'message': str
+        }
+    """
+    if file_format not in IMPORT_FORMATS:
+        return {'success': False, 'imported': 0, 'errors': [],
+                'message': f"Unsupported format. Use one of: {', '.join(IMPORT_FORMATS)}."}
+
+    reader = _read_csv(stream) if file_format == 'csv' else _read_jsonl(stream)
+    known_isbns = get_all_isbns()
+    errors: List[Dict] = []
+
+    def valid_books():
+        for row_num, row, parse_error in reader:
+            if parse_error:
+                errors.append({'row': row_num, 'isbn': None, 'message': parse_error})
+                continue
+
+            title = row.get('title') or ''
+            author = row.get('author') or ''
+            isbn = str(row.get('isbn') or '').strip()
+            total_copies = _parse_copies(row.get('total_copies'))
+            if not isinstance(title, str) or not isinstance(author, str):
+                errors.append({'row': row_num, 'isbn': isbn, 'message': "Title and author must be text."})
+                continue
+
+            error = validate_book_fields(title, author, isbn, total_copies)
+            if not error and isbn in known_isbns:
+                error = "A book with this ISBN already exists."
+            if error:
+                errors.append({'row': row_num, 'isbn': isbn or None, 'message': error})
+                continue
+
+            known_isbns.add(isbn)
+            yield title.strip(), author.strip(), isbn, total_copies, total_copies
+
+    try:
+        imported = insert_books_bulk(valid_books(), batch_size)
+    except (csv.Error, UnicodeDecodeError) as e:
+        return {'success': False, 'imported': 0, 'errors': errors,
+                'message': f"Could not read the file: {e}"}
+
+    if imported is None:
+        return {'success': False, 'imported': 0, 'errors': errors,
+                'message': "Database error occurred while importing books. No books were added."}
+
+    # Keep the in-memory search index (if enabled) up to date; bump the catalog
+    # version again so no search cached before the rebuild outlives it
+    if imported and get_search_index() is not None:
+        build_search_index()
+        bump_catalog_version()
+
+    return {
+        'success': True,
+        'imported': imported,
+        'errors': errors,
+        'message': f"Imported {imported} book(s); {len(errors)} row(s) rejected."
+    }
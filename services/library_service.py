@@ -3,53 +3,111 @@ Library Service Module - Business Logic Functions
 Contains all the core business logic for the Library Management System
 """
 
+import base64
+import binascii
+import json
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 from database import (
-    get_book_by_id, get_book_by_isbn, get_patron_borrow_count,
-    insert_book, insert_borrow_record, update_book_availability,
-    update_borrow_record_return_date, get_all_books, get_patron_borrowed_books,
-    get_patron_borrow_history
+    get_book_by_id, get_book_by_isbn, insert_book, get_all_books, get_patron_borrowed_books,
+    get_patron_borrow_history, borrow_book_transaction, return_book_transaction,
+    search_books_fts, get_books_by_ids, get_books_page,
+    insert_payment_allocations, get_payment_allocations, get_open_loan_payments,
+    reserve_allocation_refund, release_allocation_refund, iter_overdue_loans,
+    get_catalog_version, bump_catalog_version
 )
 
 from services.payment_service import PaymentGateway
+from services.resilient_gateway import get_payment_gateway
+from services.idempotency import get_idempotency_store
+from services.search_index import get_search_index
+from services.search_cache import get_search_cache
+
+MAX_BORROWED_BOOKS = 5
+LOAN_PERIOD_DAYS = 14
+CATALOG_PAGE_SIZE = 50
+MAX_CATALOG_PAGE_SIZE = 200
+
+# Messages for the failure statuses reported by the borrow/return transactions
+BORROW_FAILURE_MESSAGES = {
+    'not_found': "Book not found.",
+    'unavailable': "This book is currently not available.",
+    'already_borrowed': "You have already borrowed a copy of this book.",
+    'limit_reached': f"You have reached the maximum borrowing limit of {MAX_BORROWED_BOOKS} books.",
+    'error': "Database error occurred while creating borrow record.",
+}
+
+RETURN_FAILURE_MESSAGES = {
+    'not_found': "Book not found.",
+    'not_borrowed': "This book is currently not borrowed by you.",
+    'error': "Database error occurred while updating borrow record.",
+}
+
+def _late_fee_for_days(days_overdue: int) -> float:
+    """Apply the late fee schedule: $0.50/day for 7 days, then $1.00/day, capped at $15.00."""
+    if days_overdue <= 0:
+        return 0.0
 
-def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -> Tuple[bool, str]:
+    if days_overdue <= 7:
+        fee = days_overdue * 0.50
+    else:
+        fee = (7 * 0.50) + ((days_overdue - 7) * 1.00)
+
+    # Max fee at $15
+    if fee > 15.0:
+        fee = 15.0
+
+    return round(fee, 2)
+
+def validate_book_fields(title: str, author: str, isbn: str, total_copies: int) -> Optional[str]:
     """
-    Add a new book to the catalog.
-    Implements R1: Book Catalog Management
-    
-    Args:
-        title: Book title (max 200 chars)
-        author: Book author (max 100 chars)
-        isbn: 13-digit ISBN
-        total_copies: Number of copies (positive integer)
-        
+    Validate the fields of a new book (R1 rules).
+
     Returns:
-        tuple: (success: bool, message: str)
+        str: Error message for the first invalid field, or None if all are valid
     """
-    # Input validation
     if not title or not title.strip():
-        return False, "Title is required."
+        return "Title is required."
     
     if len(title.strip()) > 200:
-        return False, "Title must be less than 200 characters."
+        return "Title must be less than 200 characters."
     
     if not author or not author.strip():
-        return False, "Author is required."
+        return "Author is required."
     
     if len(author.strip()) > 100:
-        return False, "Author must be less than 100 characters."
+        return "Author must be less than 100 characters."
     
     if len(isbn) != 13:
-        return False, "ISBN must be exactly 13 digits."
+        return "ISBN must be exactly 13 digits."
     
     #Adding a condition to check ISBN only contain digits
     if not isbn.isdigit():
-        return False, "ISBN should only contain digits"
+        return "ISBN should only contain digits"
     
     if not isinstance(total_copies, int) or total_copies <= 0:
-        return False, "Total copies must be a positive integer."
+        return "Total copies must be a positive integer."
+    
+    return None
+
+def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -> Tuple[bool, str]:
+    """
+    Add a new book to the catalog.
+    Implements R1: Book Catalog Management
+    
+    Args:
+        title: Book title (max 200 chars)
+        author: Book author (max 100 chars)
+        isbn: 13-digit ISBN
+        total_copies: Number of copies (positive integer)
+        
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    # Input validation
+    error = validate_book_fields(title, author, isbn, total_copies)
+    if error:
+        return False, error
     
     # Check for duplicate ISBN
     existing = get_book_by_isbn(isbn)
@@ -59,10 +117,65 @@ def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -
     # Insert new book
     success = insert_book(title.strip(), author.strip(), isbn, total_copies, total_copies)
     if success:
+        # Keep the in-memory search index (if enabled) up to date; bump the catalog
+        # version again so no search cached before the book was indexed outlives it
+        search_index = get_search_index()
+        if search_index is not None:
+            search_index.add_book(get_book_by_isbn(isbn))
+            bump_catalog_version()
         return True, f'Book "{title.strip()}" has been successfully added to the catalog.'
     else:
         return False, "Database error occurred while adding the book."
 
+def _encode_catalog_cursor(book: Dict) -> str:
+    """Opaque cursor pointing just after the given book in (title, id) order."""
+    raw = json.dumps([book['title'], book['id']]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def _decode_catalog_cursor(cursor: str) -> Optional[Tuple[str, int]]:
+    """Decode a cursor made by _encode_catalog_cursor, or None if it is malformed."""
+    try:
+        title, book_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError, binascii.Error):
+        return None
+    if not isinstance(title, str) or not isinstance(book_id, int):
+        return None
+    return title, book_id
+
+def get_catalog_page(cursor: Optional[str] = None, page_size: int = CATALOG_PAGE_SIZE) -> Optional[Dict]:
+    """
+    Get one page of the catalog in title order.
+    Paginated version of R2: Book Catalog Display
+
+    Args:
+        cursor: next_cursor from the previous page, or None for the first page
+        page_size: Books per page (clamped to 1..MAX_CATALOG_PAGE_SIZE)
+
+    Returns:
+        dict: {
+            'books': List[Dict],
+            'next_cursor': Optional[str],  # None on the last page
+            'page_size': int
+        }
+        or None if the cursor is invalid
+    """
+    page_size = max(1, min(page_size, MAX_CATALOG_PAGE_SIZE))
+
+    after = None
+    if cursor:
+        after = _decode_catalog_cursor(cursor)
+        if after is None:
+            return None
+
+    # Fetch one extra row to find out whether there is a next page
+    books = get_books_page(page_size + 1, after)
+    next_cursor = None
+    if len(books) > page_size:
+        books = books[:page_size]
+        next_cursor = _encode_catalog_cursor(books[-1])
+
+    return {'books': books, 'next_cursor': next_cursor, 'page_size': page_size}
+
 def borrow_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     """
     Allow a patron to borrow a book.
@@ -79,38 +192,14 @@ def borrow_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
         return False, "Invalid patron ID. Must be exactly 6 digits."
     
-    # Check if book exists and is available
-    book = get_book_by_id(book_id)
-    if not book:
-        return False, "Book not found."
-    
-    if book['available_copies'] <= 0:
-        return False, "This book is currently not available."
-    
-    # Check if patron has already borrowed this book
-    borrowed_books = get_patron_borrowed_books(patron_id)
-    borrowed_ids = [b["book_id"] for b in borrowed_books]
-    if book_id in borrowed_ids:
-        return False, "You have already borrowed a copy of this book."
-    
-    # Check patron's current borrowed books count
-    current_borrowed = get_patron_borrow_count(patron_id)
-    
-    if current_borrowed >= 5:   #changed to >= to apply max borrow 5 lofic correctly
-        return False, "You have reached the maximum borrowing limit of 5 books."
-    
-    # Create borrow record
+    # Check availability, duplicate loans and the borrowing limit, then record
+    # the loan, all inside one transaction
     borrow_date = datetime.now()
-    due_date = borrow_date + timedelta(days=14)
-    
-    # Insert borrow record and update availability
-    borrow_success = insert_borrow_record(patron_id, book_id, borrow_date, due_date)
-    if not borrow_success:
-        return False, "Database error occurred while creating borrow record."
-    
-    availability_success = update_book_availability(book_id, -1)
-    if not availability_success:
-        return False, "Database error occurred while updating book availability."
+    due_date = borrow_date + timedelta(days=LOAN_PERIOD_DAYS)
+
+    status, book = borrow_book_transaction(patron_id, book_id, borrow_date, due_date, MAX_BORROWED_BOOKS)
+    if status != 'ok':
+        return False, BORROW_FAILURE_MESSAGES[status]
     
     return True, f'Successfully borrowed "{book["title"]}". Due date: {due_date.strftime("%Y-%m-%d")}.'
 
@@ -130,39 +219,14 @@ def return_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
         return False, "Invalid patron ID. Must be exactly 6 digits."
 
-    # Check if the book exists
-    book = get_book_by_id(book_id)
-    if not book:
-        return False, "Book not found."
-
-    # Get patron's currently borrowed books
-    borrowed_books = get_patron_borrowed_books(patron_id)
-
-    # Check if patron has borrowed this book and not yet returned it
-    borrowed_ids = []
-    for b in borrowed_books:
-        borrowed_ids.append(b["book_id"])
-
-    if book_id not in borrowed_ids:
-        return False, "This book is currently not borrowed by you."
-
-    # Update borrow record with return date
+    # Close the loan and restore availability in one transaction
     return_date = datetime.now()
-    return_success = update_borrow_record_return_date(patron_id, book_id, return_date)
-    if not return_success:
-        return False, "Database error occurred while updating borrow record."
-
-    # Increase available copies by 1
-    availability_success = update_book_availability(book_id, +1)
-    if not availability_success:
-        return False, "Database error occurred while updating book availability."
+    status, book = return_book_transaction(patron_id, book_id, return_date)
+    if status != 'ok':
+        return False, RETURN_FAILURE_MESSAGES[status]
 
-    #Calculate late fee if applicable
-    fee_info = calculate_late_fee_for_book(patron_id, book_id)
-    if fee_info is not None and 'fee_amount' in fee_info:
-        late_fee = fee_info['fee_amount']
-    else:
-        late_fee = 0.0
+    # Calculate late fee from the loan that was just closed
+    late_fee = _late_fee_for_days((return_date - book['due_date']).days)
     
     return True, (
         f'Successfully returned "{book["title"]}". '
@@ -214,22 +278,36 @@ def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict:
     if days_overdue <= 0:
         return {"fee_amount": 0.0, "days_overdue": 0, "message": "Book is not overdue."}
 
-    # Calculate fee
-    if days_overdue <= 7:
-        fee = days_overdue * 0.50
-    else:
-        fee = (7 * 0.50) + ((days_overdue - 7) * 1.00)
-
-    # Max fee at $15
-    if fee > 15.0:
-        fee = 15.0
-
     return {
-        "fee_amount": round(fee, 2),
+        "fee_amount": _late_fee_for_days(days_overdue),
         "days_overdue": days_overdue,
         "message": f'Late fee for "{book["title"]}" calculated successfully.'
     }
 
+def list_overdue_loans(patron_id: Optional[str] = None, book_id: Optional[int] = None,
+                       now: Optional[datetime] = None) -> Tuple[Optional[Iterator[Dict]], Optional[str]]:
+    """
+    Overdue loans library-wide, or for one patron or one book, most overdue first.
+    Filtering and days_overdue are computed in the database; loans are
+    produced lazily so callers can stream them.
+
+    Args:
+        patron_id: Optional 6-digit library card ID
+        book_id: Optional book ID
+        now: Time to check due dates against (defaults to the current time)
+
+    Returns:
+        tuple: (loans: Optional[Iterator[Dict]], error: Optional[str]) where each
+        loan has loan_id, patron_id, book_id, title, author, borrow_date, due_date
+        and days_overdue
+    """
+    if patron_id is not None and book_id is not None:
+        return None, "Filter by patron ID or book ID, not both."
+    if patron_id is not None and (not patron_id.isdigit() or len(patron_id) != 6):
+        return None, "Invalid patron ID. Must be exactly 6 digits."
+
+    return iter_overdue_loans(now, patron_id, book_id), None
+
 def search_books_in_catalog(search_term: str, search_type: str) -> List[Dict]:
     """
     Search for books in the catalog.
@@ -250,6 +328,41 @@ def search_books_in_catalog(search_term: str, search_type: str) -> List[Dict]:
         return []
 
     search_term = search_term.strip().lower()
+
+    # Repeat searches are answered from the search cache until the catalog changes
+    version, _ = get_catalog_version()
+    search_cache = get_search_cache()
+    results = search_cache.get(search_term, search_type, version)
+    if results is None:
+        results = _search_books(search_term, search_type)
+        search_cache.put(search_term, search_type, version, results)
+    return results
+
+def _search_books(search_term: str, search_type: str) -> List[Dict]:
+    """Run a search against the database. Expects a validated, stripped, lower-cased search term."""
+    # ISBN search — exact match through the unique ISBN index
+    if search_type == "isbn":
+        book = get_book_by_isbn(search_term)
+        return [book] if book else []
+
+    # Title/author search — answered by the in-memory index if enabled, then
+    # the trigram search index when possible
+    search_index = get_search_index()
+    if search_index is not None:
+        return get_books_by_ids(search_index.search(search_term, search_type))
+
+    results = search_books_fts(search_type, search_term)
+    if results is not None:
+        return results
+
+    return _search_books_linear(search_term, search_type)
+
+def _search_books_linear(search_term: str, search_type: str) -> List[Dict]:
+    """
+    Search by scanning the whole catalog. Used for terms the search index
+    cannot answer (shorter than 3 characters, or no FTS5 support).
+    Expects a stripped, lower-cased search term.
+    """
     books = get_all_books()
     results = []
 
@@ -268,6 +381,24 @@ def search_books_in_catalog(search_term: str, search_type: str) -> List[Dict]:
 
     return results
 
+def _late_fees_by_book(patron_id: str, borrowed_books: List[Dict], now: datetime) -> Dict[int, float]:
+    """
+    Late fee per book for rows from get_patron_borrowed_books (earliest loan first).
+    As in calculate_late_fee_for_book, a book's fee comes from its earliest open
+    loan, and an invalid patron ID owes nothing.
+    """
+    valid_patron = bool(patron_id) and patron_id.isdigit() and len(patron_id) == 6
+    fees_by_book = {}
+    for book in borrowed_books:
+        if book['book_id'] not in fees_by_book:
+            days_overdue = (now - book['due_date']).days
+            fees_by_book[book['book_id']] = _late_fee_for_days(days_overdue) if valid_patron else 0.0
+    return fees_by_book
+
+def _unpaid(fee: float, paid: float) -> float:
+    """What is left of a late fee after payments not refunded, never negative."""
+    return round(max(fee - paid, 0.0), 2)
+
 def get_patron_status_report(patron_id: str) -> Dict:
     """
     Get status report for a patron.
@@ -297,10 +428,12 @@ def get_patron_status_report(patron_id: str) -> Dict:
     borrowed_books = get_patron_borrowed_books(patron_id)
     report['books_borrowed_count'] = len(borrowed_books)
 
+    # Late fees are computed from the rows already fetched
+    fees_by_book = _late_fees_by_book(patron_id, borrowed_books, datetime.now())
+
     total_late_fees = 0.0
     for book in borrowed_books:
-        fee_info = calculate_late_fee_for_book(patron_id, book['book_id'])
-        late_fee = fee_info.get('fee_amount', 0.0) if fee_info else 0.0
+        late_fee = fees_by_book[book['book_id']]
         total_late_fees += late_fee
 
         #Currently Borrowed books with due dates
@@ -322,72 +455,214 @@ def get_patron_status_report(patron_id: str) -> Dict:
 
     return report
 
-def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway = None) -> Tuple[bool, str, Optional[str]]:
+def prepare_late_fee_payment(patron_id: str, book_id: int) -> Tuple[Optional[Dict], Optional[str]]:
     """
-    Process payment for late fees using external payment gateway.
-    
-    NEW FEATURE FOR ASSIGNMENT 3: Demonstrates need for mocking/stubbing
-    This function depends on an external payment service that should be mocked in tests.
+    Validate a late fee payment and work out what to charge, without contacting the gateway.
     
     Args:
         patron_id: 6-digit library card ID
         book_id: ID of the book with late fees
-        payment_gateway: Payment gateway instance (injectable for testing)
         
     Returns:
-        tuple: (success: bool, message: str, transaction_id: Optional[str])
-        
-    Example for you to mock:
-        # In tests, mock the payment gateway:
-        mock_gateway = Mock(spec=PaymentGateway)
-        mock_gateway.process_payment.return_value = (True, "txn_123", "Success")
-        success, msg, txn = pay_late_fees("123456", 1, mock_gateway)
+        tuple: (charge: Optional[Dict], error: Optional[str]) where charge is
+        {'amount': float, 'description': str, 'loan_id': Optional[int]}, or
+        None with an error message. The amount leaves out what was already
+        paid towards the loan (and not refunded).
     """
     # Validate patron ID
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
-        return False, "Invalid patron ID. Must be exactly 6 digits.", None
+        return None, "Invalid patron ID. Must be exactly 6 digits."
     
     # Calculate late fee first
     fee_info = calculate_late_fee_for_book(patron_id, book_id)
     
     # Check if there's a fee to pay
     if not fee_info or 'fee_amount' not in fee_info:
-        return False, "Unable to calculate late fees.", None
+        return None, "Unable to calculate late fees."
     
     fee_amount = fee_info.get('fee_amount', 0.0)
     
+    # As in calculate_late_fee_for_book, the fee belongs to the earliest open loan of the book
+    loan_id = None
+    if fee_amount > 0:
+        loan = next((open_loan for open_loan in get_open_loan_payments(patron_id)
+                     if open_loan['book_id'] == book_id), None)
+        if loan is not None:
+            loan_id = loan['loan_id']
+            fee_amount = _unpaid(fee_amount, loan['paid'])
+    
     if fee_amount <= 0:
-        return False, "No late fees to pay for this book.", None
+        return None, "No late fees to pay for this book."
     
     # Get book details for payment description
     book = get_book_by_id(book_id)
     if not book:
-        return False, "Book not found.", None
+        return None, "Book not found."
+    
+    return {'amount': fee_amount, 'description': f"Late fees for '{book['title']}'", 'loan_id': loan_id}, None
+
+def record_late_fee_payment(transaction_id: str, patron_id: str, book_id: int,
+                            loan_id: Optional[int], amount: float) -> bool:
+    """
+    Record a single-book payment as an allocation to its loan, so later
+    payments leave it out and refunds can name the book. True if recorded
+    (or there is no loan to record it against).
+    """
+    if loan_id is None:
+        return True
+    return insert_payment_allocations(
+        transaction_id, patron_id, [{'loan_id': loan_id, 'book_id': book_id, 'amount': amount}], datetime.now()
+    )
+
+def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway = None,
+                  idempotency_key: Optional[str] = None) -> Tuple[bool, str, Optional[str]]:
+    """
+    Process payment for late fees using external payment gateway.
+    
+    NEW FEATURE FOR ASSIGNMENT 3: Demonstrates need for mocking/stubbing
+    This function depends on an external payment service that should be mocked in tests.
+    
+    Args:
+        patron_id: 6-digit library card ID
+        book_id: ID of the book with late fees
+        payment_gateway: Payment gateway instance (injectable for testing)
+        idempotency_key: Optional client key; repeating it returns the stored
+            result instead of charging again
+        
+    Returns:
+        tuple: (success: bool, message: str, transaction_id: Optional[str])
+        
+    Example for you to mock:
+        # In tests, mock the payment gateway:
+        mock_gateway = Mock(spec=PaymentGateway)
+        mock_gateway.process_payment.return_value = (True, "txn_123", "Success")
+        success, msg, txn = pay_late_fees("123456", 1, mock_gateway)
+    """
+    if idempotency_key:
+        return get_idempotency_store().run(
+            'pay_late_fees', idempotency_key, {'patron_id': patron_id, 'book_id': book_id},
+            lambda: pay_late_fees(patron_id, book_id, payment_gateway)
+        )
     
-    # Use provided gateway or create new one
+    # Validate and work out the charge
+    charge, error = prepare_late_fee_payment(patron_id, book_id)
+    if error:
+        return False, error, None
+    
+    # Use provided gateway or the shared resilient client
     if payment_gateway is None:
-        payment_gateway = PaymentGateway()
+        payment_gateway = get_payment_gateway()
     
     # Process payment through external gateway
     # THIS IS WHAT YOU SHOULD MOCK IN THEIR TESTS!
     try:
         success, transaction_id, message = payment_gateway.process_payment(
             patron_id=patron_id,
-            amount=fee_amount,
-            description=f"Late fees for '{book['title']}'"
+            amount=charge['amount'],
+            description=charge['description']
         )
         
-        if success:
-            return True, f"Payment successful! {message}", transaction_id
-        else:
+        if not success:
             return False, f"Payment failed: {message}", None
             
     except Exception as e:
         # Handle payment gateway errors
         return False, f"Payment processing error: {str(e)}", None
+    
+    if not record_late_fee_payment(transaction_id, patron_id, book_id, charge['loan_id'], charge['amount']):
+        return True, (f"Payment successful! {message} "
+                      f"The payment could not be recorded against the loan."), transaction_id
+    return True, f"Payment successful! {message}", transaction_id
 
 
-def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway: PaymentGateway = None) -> Tuple[bool, str]:
+def pay_all_late_fees(patron_id: str, payment_gateway: PaymentGateway = None,
+                      idempotency_key: Optional[str] = None) -> Tuple[bool, str, Optional[str]]:
+    """
+    Pay every outstanding late fee of a patron with a single gateway charge.
+    
+    Fees for all open loans are computed in one pass, less what earlier
+    payments already covered. The total is charged once, and its split
+    across loans is recorded so that later payments leave it out and
+    refund_late_fee_payment can refund a single book.
+    
+    Args:
+        patron_id: 6-digit library card ID
+        payment_gateway: Payment gateway instance (injectable for testing)
+        idempotency_key: Optional client key; repeating it returns the stored
+            result instead of charging again
+        
+    Returns:
+        tuple: (success: bool, message: str, transaction_id: Optional[str])
+    """
+    if idempotency_key:
+        return get_idempotency_store().run(
+            'pay_all_late_fees', idempotency_key, {'patron_id': patron_id},
+            lambda: pay_all_late_fees(patron_id, payment_gateway)
+        )
+    
+    # Validate patron ID
+    if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
+        return False, "Invalid patron ID. Must be exactly 6 digits.", None
+    
+    borrowed_books = get_patron_borrowed_books(patron_id)
+    fees_by_book = _late_fees_by_book(patron_id, borrowed_books, datetime.now())
+    paid_by_loan = {loan['loan_id']: loan['paid'] for loan in get_open_loan_payments(patron_id)}
+    
+    # One allocation per book, against its earliest open loan, less what was already paid
+    allocations = []
+    for book in borrowed_books:
+        fee = fees_by_book.pop(book['book_id'], 0.0)
+        if fee > 0:
+            fee = _unpaid(fee, paid_by_loan.get(book['loan_id'], 0.0))
+        if fee > 0:
+            allocations.append({'loan_id': book['loan_id'], 'book_id': book['book_id'],
+                                'title': book['title'], 'amount': fee})
+    
+    if not allocations:
+        return False, "No late fees to pay.", None
+    
+    total = round(sum(a['amount'] for a in allocations), 2)
+    titles = ', '.join(f"'{a['title']}'" for a in allocations)
+    description = f"Late fees for {len(allocations)} book(s): {titles}"
+    
+    # Use provided gateway or the shared resilient client
+    if payment_gateway is None:
+        payment_gateway = get_payment_gateway()
+    
+    try:
+        success, transaction_id, message = payment_gateway.process_payment(
+            patron_id=patron_id,
+            amount=total,
+            description=description
+        )
+    except Exception as e:
+        return False, f"Payment processing error: {str(e)}", None
+    
+    if not success:
+        return False, f"Payment failed: {message}", None
+    
+    if not insert_payment_allocations(transaction_id, patron_id, allocations, datetime.now()):
+        return True, (f"Payment successful! {message} "
+                      f"The per-book breakdown could not be saved."), transaction_id
+    
+    return True, f"Payment successful! {message}", transaction_id
+
+def get_payment_breakdown(transaction_id: str) -> List[Dict]:
+    """
+    Get how a pay_all_late_fees payment splits across books.
+    
+    Returns:
+        list of dict: book_id, loan_id, amount and refunded_amount per book
+        (empty for unknown payments)
+    """
+    return [
+        {'book_id': a['book_id'], 'loan_id': a['loan_id'], 'amount': a['amount'],
+         'refunded_amount': a['refunded_amount']}
+        for a in get_payment_allocations(transaction_id)
+    ]
+
+def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway: PaymentGateway = None,
+                            book_id: Optional[int] = None, idempotency_key: Optional[str] = None) -> Tuple[bool, str]:
     """
     Refund a late fee payment (e.g., if book was returned on time but fees were charged in error).
     
@@ -397,10 +672,22 @@ def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway:
         transaction_id: Original transaction ID to refund
         amount: Amount to refund
         payment_gateway: Payment gateway instance (injectable for testing)
+        book_id: For pay_all_late_fees payments, the book to refund; the
+            amount may not exceed what is left of that book's share
+        idempotency_key: Optional client key; repeating it returns the stored
+            result instead of refunding again
         
     Returns:
         tuple: (success: bool, message: str)
     """
+    if idempotency_key:
+        return get_idempotency_store().run(
+            'refund_late_fee_payment', idempotency_key,
+            {'transaction_id': transaction_id, 'amount': amount, 'book_id': book_id},
+            lambda: refund_late_fee_payment(transaction_id, amount, payment_gateway, book_id),
+            result_size=2
+        )
+    
     # Validate inputs
     if not transaction_id or not transaction_id.startswith("txn_"):
         return False, "Invalid transaction ID."
@@ -411,9 +698,16 @@ def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway:
     if amount > 15.00:  # Maximum late fee per book
         return False, "Refund amount exceeds maximum late fee."
     
-    # Use provided gateway or create new one
+    # Refunding one book of a multi-book payment: claim its share first
+    if book_id is not None:
+        if not any(a['book_id'] == book_id for a in get_payment_allocations(transaction_id)):
+            return False, "This book was not paid for in that transaction."
+        if not reserve_allocation_refund(transaction_id, book_id, amount):
+            return False, "Refund amount exceeds the unrefunded late fee for this book."
+    
+    # Use provided gateway or the shared resilient client
     if payment_gateway is None:
-        payment_gateway = PaymentGateway()
+        payment_gateway = get_payment_gateway()
     
     # Process refund through external gateway
     # THIS IS WHAT YOU SHOULD MOCK IN YOUR TESTS!
@@ -423,7 +717,11 @@ def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway:
         if success:
             return True, message
         else:
+            if book_id is not None:
+                release_allocation_refund(transaction_id, book_id, amount)
             return False, f"Refund failed: {message}"
             
     except Exception as e:
+        if book_id is not None:
+            release_allocation_refund(transaction_id, book_id, amount)
         return False, f"Refund processing error: {str(e)}"
\ No newline at end of file
@@ -0,0 +1,206 @@
+"""
+Payment Queue Module - Asynchronous late fee payments
+Queued payments run on an asyncio event loop in a background thread, so
+request handlers return a pending job handle instead of waiting on the gateway.
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from database import (
+    insert_payment_job, update_payment_job, get_payment_job, claim_payment_job, get_unfinished_payment_jobs
+)
+from services.library_service import prepare_late_fee_payment, record_late_fee_payment
+from services.idempotency import get_idempotency_store
+from services.resilient_gateway import get_async_payment_gateway
+
+PAYMENT_QUEUE_CONCURRENCY = 20  # Maximum gateway calls in flight at once
+
+# Job statuses: pending -> processing -> completed | failed
+JOB_PENDING = 'pending'
+JOB_PROCESSING = 'processing'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+
+JOB_INTERRUPTED_MESSAGE = ("Payment interrupted before the gateway replied. "
+                           "Check your payment history before paying again.")
+
+
+class PaymentJobQueue:
+    """
+    Runs payment jobs against an async gateway client on a dedicated event loop thread.
+    The loop starts on the first submit; at most max_concurrency jobs talk to the gateway at once.
+    Each job is claimed (pending -> processing) before its gateway call, so a
+    job scheduled twice is still charged once.
+    """
+
+    def __init__(self, gateway=None, max_concurrency: int = PAYMENT_QUEUE_CONCURRENCY):
+        self.gateway = gateway if gateway is not None else get_async_payment_gateway()
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the event loop thread if it is not running yet, resuming unfinished jobs."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._run_loop, name='payment-queue', daemon=True)
+            self._thread.start()
+        self._resume_unfinished()
+
+    def _resume_unfinished(self):
+        """
+        Pick up jobs left behind by a previous run or by stop(). Pending jobs
+        are queued again. Processing jobs may already have been charged by the
+        gateway, so they are failed rather than charged a second time. Assumes
+        one queue per database, as in a single-process deployment.
+        """
+        for job in get_unfinished_payment_jobs():
+            if job['status'] == JOB_PROCESSING:
+                update_payment_job(job['id'], JOB_FAILED, JOB_INTERRUPTED_MESSAGE)
+            else:
+                asyncio.run_coroutine_threadsafe(
+                    self._process(job['id'], job['patron_id'], job['amount'], job['description']), self._loop
+                )
+
+    def resume(self) -> bool:
+        """Start the loop now if the database holds unfinished jobs. True if it was started."""
+        if self._thread is not None or not get_unfinished_payment_jobs():
+            return False
+        self.start()
+        return True
+
+    def _run_loop(self):
+        loop = self._loop
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+        # Cancel jobs still in flight so the loop closes cleanly
+        pending = asyncio.all_tasks(loop)
+        for task in pending:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.close()
+
+    def stop(self):
+        """
+        Stop the event loop thread. Jobs still in flight stay in their current
+        status until the queue is started again (see _resume_unfinished).
+        """
+        with self._lock:
+            if self._thread is None:
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+            self._loop = None
+
+    def submit(self, job_id: str, patron_id: str, amount: float, description: str) -> concurrent.futures.Future:
+        """Schedule a job that is already stored as pending. Returns a future for its final status."""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(
+            self._process(job_id, patron_id, amount, description), self._loop
+        )
+
+    async def _process(self, job_id: str, patron_id: str, amount: float, description: str) -> str:
+        async with self._semaphore:
+            if not await asyncio.to_thread(claim_payment_job, job_id):
+                # Already claimed, e.g. resumed on start and then submitted
+                job = await asyncio.to_thread(get_payment_job, job_id)
+                return job['status'] if job else JOB_FAILED
+            try:
+                success, transaction_id, message = await self.gateway.process_payment(
+                    patron_id=patron_id, amount=amount, description=description
+                )
+                if success:
+                    status, message = JOB_COMPLETED, f"Payment successful! {message}"
+                else:
+                    status, message, transaction_id = JOB_FAILED, f"Payment failed: {message}", None
+            except Exception as e:
+                status, message, transaction_id = JOB_FAILED, f"Payment processing error: {str(e)}", None
+            if status == JOB_COMPLETED:
+                await asyncio.to_thread(_record_job_payment, job_id, transaction_id)
+            await asyncio.to_thread(update_payment_job, job_id, status, message, transaction_id)
+            return status
+
+
+def _record_job_payment(job_id: str, transaction_id: str) -> None:
+    """Allocate a completed job's charge to its loan so the fee is not charged again."""
+    job = get_payment_job(job_id)
+    if job:
+        record_late_fee_payment(transaction_id, job['patron_id'], job['book_id'], job['loan_id'], job['amount'])
+
+
+_queue: Optional[PaymentJobQueue] = None
+_queue_lock = threading.Lock()
+
+def get_payment_queue() -> PaymentJobQueue:
+    """The process-wide payment queue, created on first use."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = PaymentJobQueue()
+        return _queue
+
+def configure_payment_queue(gateway=None, max_concurrency: int = PAYMENT_QUEUE_CONCURRENCY) -> PaymentJobQueue:
+    """Replace the process-wide payment queue, stopping the old one."""
+    global _queue
+    with _queue_lock:
+        if _queue is not None:
+            _queue.stop()
+        _queue = PaymentJobQueue(gateway, max_concurrency)
+        return _queue
+
+def resume_payment_jobs() -> bool:
+    """Start the payment queue if jobs were left unfinished, e.g. by a restart. True if it was started."""
+    return get_payment_queue().resume()
+
+def enqueue_late_fee_payment(patron_id: str, book_id: int,
+                             idempotency_key: Optional[str] = None) -> Tuple[bool, str, Optional[str]]:
+    """
+    Validate a late fee payment and queue it for the gateway.
+    Asynchronous counterpart of pay_late_fees.
+
+    Args:
+        patron_id: 6-digit library card ID
+        book_id: ID of the book with late fees
+        idempotency_key: Optional client key; repeating it returns the
+            original job instead of queuing another payment
+
+    Returns:
+        tuple: (success: bool, message: str, job_id: Optional[str])
+    """
+    if idempotency_key:
+        return get_idempotency_store().run(
+            'enqueue_late_fee_payment', idempotency_key, {'patron_id': patron_id, 'book_id': book_id},
+            lambda: enqueue_late_fee_payment(patron_id, book_id)
+        )
+
+    charge, error = prepare_late_fee_payment(patron_id, book_id)
+    if error:
+        return False, error, None
+
+    job_id = f"job_{uuid.uuid4().hex}"
+    if not insert_payment_job(job_id, patron_id, book_id, charge['amount'], charge['description'], datetime.now(),
+                              loan_id=charge['loan_id']):
+        return False, "Database error occurred while queuing the payment.", None
+
+    get_payment_queue().submit(job_id, patron_id, charge['amount'], charge['description'])
+    return True, "Payment queued.", job_id
+
+def get_payment_job_status(job_id: str) -> Optional[Dict]:
+    """
+    Look up a queued payment.
+
+    Returns:
+        dict: The job (id, patron_id, book_id, amount, description, status,
+        message, transaction_id, created_at, updated_at), or None if unknown
+    """
+    return get_payment_job(job_id)
@@ -6,6 +6,7 @@ For Assignment 3: You will learn to mock this service in their tests
 since we cannot make actual payment API calls during testing.
 """
 
+import asyncio
 import requests
 from typing import Dict, Tuple
 import time
@@ -68,19 +69,7 @@ class PaymentGateway:
         
         # For this template, we simulate different scenarios based on amount
         # This allows testing without a real API
-        
-        if amount <= 0:
-            return False, "", "Invalid amount: must be greater than 0"
-        
-        if amount > 1000:
-            return False, "", "Payment declined: amount exceeds limit"
-        
-        if len(patron_id) != 6:
-            return False, "", "Invalid patron ID format"
-        
-        # Simulate successful payment
-        transaction_id = f"txn_{patron_id}_{int(time.time())}"
-        return True, transaction_id, f"Payment of ${amount:.2f} processed successfully"
+        return _simulate_payment(patron_id, amount)
     
     def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
         """
@@ -97,15 +86,7 @@ class PaymentGateway:
             tuple: (success: bool, message: str)
         """
         time.sleep(0.5)
-        
-        if not transaction_id or not transaction_id.startswith("txn_"):
-            return False, "Invalid transaction ID"
-        
-        if amount <= 0:
-            return False, "Invalid refund amount"
-        
-        refund_id = f"refund_{transaction_id}_{int(time.time())}"
-        return True, f"Refund of ${amount:.2f} processed successfully. Refund ID: {refund_id}"
+        return _simulate_refund(transaction_id, amount)
     
     def verify_payment_status(self, transaction_id: str) -> Dict:
         """
@@ -121,14 +102,72 @@ class PaymentGateway:
             dict: Payment status information
         """
         time.sleep(0.3)
-        
-        if not transaction_id or not transaction_id.startswith("txn_"):
-            return {"status": "not_found", "message": "Transaction not found"}
-        
-        # Simulate status check
-        return {
-            "transaction_id": transaction_id,
-            "status": "completed",
-            "amount": 10.50,
-            "timestamp": time.time()
-        }
\ No newline at end of file
+        return _simulate_status(transaction_id)
+
+
+class AsyncPaymentGateway:
+    """
+    asyncio client for the same external payment gateway API.
+    Calls await the (simulated) HTTP round trip instead of blocking a thread,
+    so one event loop can have many payments in flight.
+    
+    Same return values as PaymentGateway. MOCK or fake this class in tests.
+    """
+    
+    def __init__(self, api_key: str = "test_key_12345"):
+        self.api_key = api_key
+        self.base_url = "https://api.payment-gateway.example.com"
+    
+    async def process_payment(self, patron_id: str, amount: float, description: str = "") -> Tuple[bool, str, str]:
+        """Process a payment. Returns (success, transaction_id, message)."""
+        await asyncio.sleep(0.5)
+        return _simulate_payment(patron_id, amount)
+    
+    async def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
+        """Refund a previous payment. Returns (success, message)."""
+        await asyncio.sleep(0.5)
+        return _simulate_refund(transaction_id, amount)
+    
+    async def verify_payment_status(self, transaction_id: str) -> Dict:
+        """Check the status of a payment transaction."""
+        await asyncio.sleep(0.3)
+        return _simulate_status(transaction_id)
+
+
+# Simulated gateway responses shared by the sync and async clients
+
+def _simulate_payment(patron_id: str, amount: float) -> Tuple[bool, str, str]:
+    if amount <= 0:
+        return False, "", "Invalid amount: must be greater than 0"
+    
+    if amount > 1000:
+        return False, "", "Payment declined: amount exceeds limit"
+    
+    if len(patron_id) != 6:
+        return False, "", "Invalid patron ID format"
+    
+    # Simulate successful payment
+    transaction_id = f"txn_{patron_id}_{int(time.time())}"
+    return True, transaction_id, f"Payment of ${amount:.2f} processed successfully"
+
+def _simulate_refund(transaction_id: str, amount: float) -> Tuple[bool, str]:
+    if not transaction_id or not transaction_id.startswith("txn_"):
+        return False, "Invalid transaction ID"
+    
+    if amount <= 0:
+        return False, "Invalid refund amount"
+    
+    refund_id = f"refund_{transaction_id}_{int(time.time())}"
+    return True, f"Refund of ${amount:.2f} processed successfully. Refund ID: {refund_id}"
+
+def _simulate_status(transaction_id: str) -> Dict:
+    if not transaction_id or not transaction_id.startswith("txn_"):
+        return {"status": "not_found", "message": "Transaction not found"}
+    
+    # Simulate status check
+    return {
+        "transaction_id": transaction_id,
+        "status": "completed",
+        "amount": 10.50,
+        "timestamp": time.time()
+    }
\ No newline at end of file
@@ -0,0 +1,125 @@
+"""
+Payment Status Module - Cached payment status lookups
+Wraps verify_payment_status with a TTL cache and a bulk lookup that checks
+many transactions concurrently on a bounded thread pool.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+
+from cache import LRUCache
+from services.resilient_gateway import get_payment_gateway
+
+PAYMENT_STATUS_TTL = 30.0          # Seconds a non-terminal status is reused
+PAYMENT_STATUS_CACHE_SIZE = 4096
+PAYMENT_STATUS_WORKERS = 8         # Concurrent gateway calls per bulk lookup
+MAX_BULK_STATUS_LOOKUP = 500
+
+# A transaction in one of these states never changes again, so it is cached
+# without expiry (until evicted by the LRU size bound)
+TERMINAL_STATUSES = {'completed'}
+
+
+class PaymentStatusCache:
+    """
+    Gateway transaction statuses keyed by transaction ID. Terminal statuses
+    are kept until evicted; others expire after ttl seconds. Failed lookups
+    are not cached.
+    """
+
+    def __init__(self, ttl: float = PAYMENT_STATUS_TTL, maxsize: int = PAYMENT_STATUS_CACHE_SIZE,
+                 max_workers: int = PAYMENT_STATUS_WORKERS, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self.clock = clock
+        self.cache = LRUCache(maxsize)
+
+    def _cached(self, transaction_id: str) -> Optional[Dict]:
+        entry = self.cache.get(transaction_id)
+        if entry is None:
+            return None
+        status, expires_at = entry
+        if expires_at is not None and self.clock() >= expires_at:
+            self.cache.pop(transaction_id)
+            return None
+        return status
+
+    def _lookup(self, transaction_id: str, payment_gateway) -> Dict:
+        try:
+            status = payment_gateway.verify_payment_status(transaction_id)
+        except Exception as e:
+            return {'transaction_id': transaction_id, 'status': 'error',
+                    'message': f"Status check error: {str(e)}"}
+
+        expires_at = None if status.get('status') in TERMINAL_STATUSES else self.clock() + self.ttl
+        self.cache.put(transaction_id, (status, expires_at))
+        return status
+
+    def verify(self, transaction_id: str, payment_gateway=None) -> Dict:
+        """
+        Status of one transaction, from the cache when fresh.
+
+        Args:
+            transaction_id: Gateway transaction ID
+            payment_gateway: Payment gateway instance (injectable for testing)
+
+        Returns:
+            dict: The gateway's status response, or {'transaction_id', 'status': 'error', 'message'}
+        """
+        status = self._cached(transaction_id)
+        if status is not None:
+            return status
+        if payment_gateway is None:
+            payment_gateway = get_payment_gateway()
+        return self._lookup(transaction_id, payment_gateway)
+
+    def verify_many(self, transaction_ids: Iterable[str], payment_gateway=None) -> Dict[str, Dict]:
+        """
+        Statuses of many transactions. Cached ones are answered immediately;
+        the rest are checked concurrently on at most max_workers threads.
+
+        Returns:
+            dict: Status response per transaction ID (see verify)
+        """
+        results = {}
+        missing = []
+        for transaction_id in dict.fromkeys(transaction_ids):
+            status = self._cached(transaction_id)
+            if status is not None:
+                results[transaction_id] = status
+            else:
+                missing.append(transaction_id)
+
+        if missing:
+            if payment_gateway is None:
+                payment_gateway = get_payment_gateway()
+            workers = max(1, min(self.max_workers, len(missing)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='payment-status') as pool:
+                statuses = pool.map(lambda txn: self._lookup(txn, payment_gateway), missing)
+                results.update(zip(missing, statuses))
+        return results
+
+
+_status_cache: Optional[PaymentStatusCache] = None
+
+def configure_payment_status_cache(ttl: float = PAYMENT_STATUS_TTL, maxsize: int = PAYMENT_STATUS_CACHE_SIZE,
+                                   max_workers: int = PAYMENT_STATUS_WORKERS) -> PaymentStatusCache:
+    """Replace the process-wide payment status cache."""
+    global _status_cache
+    _status_cache = PaymentStatusCache(ttl, maxsize, max_workers)
+    return _status_cache
+
+def get_payment_status_cache() -> PaymentStatusCache:
+    """The process-wide payment status cache, created with default settings on first use."""
+    if _status_cache is None:
+        configure_payment_status_cache()
+    return _status_cache
+
+def verify_payment_status(transaction_id: str, payment_gateway=None) -> Dict:
+    """Cached status of one gateway transaction. See PaymentStatusCache.verify."""
+    return get_payment_status_cache().verify(transaction_id, payment_gateway)
+
+def verify_payment_statuses(transaction_ids: Iterable[str], payment_gateway=None) -> Dict[str, Dict]:
+    """Cached statuses of many gateway transactions, keyed by ID. See PaymentStatusCache.verify_many."""
+    return get_payment_status_cache().verify_many(transaction_ids, payment_gateway)
@@ -0,0 +1,358 @@
+"""
+Resilient Gateway Module - Deadlines, retries and a circuit breaker for the payment gateway
+Wraps PaymentGateway / AsyncPaymentGateway so a slow or failing gateway
+cannot make every payment request slow: calls time out, transient errors are
+retried with jittered backoff within a retry budget, and the circuit opens
+(failing fast) while the gateway's error rate is above a threshold.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Optional, Tuple
+
+from instrumentation import instrumented
+from services.payment_service import PaymentGateway, AsyncPaymentGateway
+
+GATEWAY_TIMEOUT = 2.0           # Seconds per attempt
+GATEWAY_MAX_RETRIES = 2         # Retries after the first attempt
+GATEWAY_BACKOFF_BASE = 0.1      # Seconds; doubles per retry, with full jitter
+GATEWAY_BACKOFF_MAX = 2.0
+FAILURE_THRESHOLD = 0.5         # Error rate that opens the circuit
+FAILURE_WINDOW = 20             # Most recent calls considered
+MIN_CALLS = 10                  # Calls in the window before the circuit may open
+RESET_TIMEOUT = 30.0            # Seconds the circuit stays open before a trial call
+RETRY_BUDGET_RATIO = 0.2        # Retries earned per call
+RETRY_BUDGET_MAX = 10.0
+
+# Charges and refunds are not idempotent, so they are only retried when the
+# gateway could not be reached. Status checks are read-only and also retried
+# after a timeout.
+RETRY_ON_WRITE = (ConnectionError,)
+RETRY_ON_READ = (ConnectionError, TimeoutError)
+
+
+class GatewayError(Exception):
+    """Base class for errors raised by the resilience layer itself."""
+
+class GatewayTimeoutError(GatewayError, TimeoutError):
+    """A gateway call missed its deadline."""
+
+class CircuitOpenError(GatewayError):
+    """The circuit is open; the gateway was not called."""
+
+
+class CircuitBreaker:
+    """
+    Closed -> open when the error rate over the last window_size calls reaches
+    failure_threshold (after at least min_calls). Open -> half-open after
+    reset_timeout, letting one trial call through: success closes the
+    circuit, failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: float = FAILURE_THRESHOLD, window_size: int = FAILURE_WINDOW,
+                 min_calls: int = MIN_CALLS, reset_timeout: float = RESET_TIMEOUT,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.times_opened = 0
+        self._outcomes = deque(maxlen=window_size)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go to the gateway now."""
+        with self._lock:
+            if self._state == self.OPEN:
+                if self.clock() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    return False
+                self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._state = self.CLOSED
+                self._outcomes.clear()
+                self._trial_in_flight = False
+            self._outcomes.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._open()
+                return
+            self._outcomes.append(False)
+            if self._state == self.CLOSED and len(self._outcomes) >= self.min_calls:
+                failures = self._outcomes.count(False)
+                if failures / len(self._outcomes) >= self.failure_threshold:
+                    self._open()
+
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = self.clock()
+        self._trial_in_flight = False
+        self._outcomes.clear()
+        self.times_opened += 1
+
+
+class RetryBudget:
+    """Token bucket capping retries to a fraction of calls, so retries cannot pile onto an outage."""
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, max_tokens: float = RETRY_BUDGET_MAX):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    @property
+    def tokens(self) -> float:
+        return self._tokens
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class GatewayGuard:
+    """
+    Resilience state shared by the sync and async gateway wrappers: settings,
+    circuit breaker, retry budget and counters.
+    """
+
+    def __init__(self, timeout: float = GATEWAY_TIMEOUT, max_retries: int = GATEWAY_MAX_RETRIES,
+                 backoff_base: float = GATEWAY_BACKOFF_BASE, backoff_max: float = GATEWAY_BACKOFF_MAX,
+                 breaker: Optional[CircuitBreaker] = None, retry_budget: Optional[RetryBudget] = None,
+                 rng: Optional[random.Random] = None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.retry_budget = retry_budget if retry_budget is not None else RetryBudget()
+        self.rng = rng if rng is not None else random.Random()
+        self._counters = {'calls': 0, 'attempts': 0, 'successes': 0, 'failures': 0,
+                          'timeouts': 0, 'retries': 0, 'rejected': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def start_call(self):
+        self._count('calls')
+        self.retry_budget.deposit()
+
+    def admit(self):
+        """Raise CircuitOpenError unless the breaker lets this attempt through."""
+        if not self.breaker.allow():
+            self._count('rejected')
+            raise CircuitOpenError("Payment gateway temporarily unavailable (circuit open).")
+        self._count('attempts')
+
+    def record_success(self):
+        self._count('successes')
+        self.breaker.record_success()
+
+    def record_failure(self, error: Exception, attempt: int, retry_on: Tuple[type, ...]) -> Optional[float]:
+        """
+        Record a failed attempt. Returns the backoff delay before retrying, or
+        None if the error should be raised.
+        """
+        self._count('failures')
+        if isinstance(error, GatewayTimeoutError):
+            self._count('timeouts')
+        self.breaker.record_failure()
+
+        if not isinstance(error, retry_on) or attempt >= self.max_retries:
+            return None
+        if not self.retry_budget.withdraw():
+            return None
+        self._count('retries')
+        # Full jitter: uniform over [0, capped exponential backoff]
+        return self.rng.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def metrics(self) -> Dict:
+        """Counters, circuit state and remaining retry budget."""
+        with self._lock:
+            snapshot = dict(self._counters)
+        snapshot['circuit_state'] = self.breaker.state
+        snapshot['circuit_opened'] = self.breaker.times_opened
+        snapshot['retry_budget'] = round(self.retry_budget.tokens, 2)
+        return snapshot
+
+
+class ResilientPaymentGateway:
+    """
+    Drop-in replacement for PaymentGateway that applies a GatewayGuard to every call.
+    Gateway errors (including GatewayTimeoutError and CircuitOpenError) are raised
+    to the caller after retries, as the plain gateway would raise them.
+    """
+
+    def __init__(self, gateway=None, guard: Optional[GatewayGuard] = None,
+                 sleep: Callable[[float], None] = time.sleep, max_workers: int = 32):
+        self.gateway = gateway if gateway is not None else PaymentGateway()
+        self.guard = guard if guard is not None else GatewayGuard()
+        self.sleep = sleep
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='payment-gateway')
+
+    def _call(self, fn, args: tuple, retry_on: Tuple[type, ...]):
+        guard = self.guard
+        guard.start_call()
+        attempt = 0
+        while True:
+            guard.admit()
+            future = self._executor.submit(fn, *args)
+            try:
+                result = future.result(timeout=guard.timeout)
+            except FutureTimeoutError:
+                error = GatewayTimeoutError(f"Payment gateway did not respond within {guard.timeout:g}s.")
+            except Exception as e:
+                error = e
+            else:
+                guard.record_success()
+                return result
+
+            delay = guard.record_failure(error, attempt, retry_on)
+            if delay is None:
+                raise error
+            self.sleep(delay)
+            attempt += 1
+
+    @instrumented('gateway', count_rows=False)
+    def process_payment(self, patron_id: str, amount: float, description: str = "") -> Tuple[bool, str, str]:
+        return self._call(self.gateway.process_payment, (patron_id, amount, description), RETRY_ON_WRITE)
+
+    @instrumented('gateway', count_rows=False)
+    def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
+        return self._call(self.gateway.refund_payment, (transaction_id, amount), RETRY_ON_WRITE)
+
+    @instrumented('gateway', count_rows=False)
+    def verify_payment_status(self, transaction_id: str) -> Dict:
+        return self._call(self.gateway.verify_payment_status, (transaction_id,), RETRY_ON_READ)
+
+    def metrics(self) -> Dict:
+        return self.guard.metrics()
+
+    def close(self):
+        """Stop the worker threads (calls still past their deadline finish in the background)."""
+        self._executor.shutdown(wait=False)
+
+
+class ResilientAsyncPaymentGateway:
+    """asyncio counterpart of ResilientPaymentGateway, wrapping AsyncPaymentGateway."""
+
+    def __init__(self, gateway=None, guard: Optional[GatewayGuard] = None):
+        self.gateway = gateway if gateway is not None else AsyncPaymentGateway()
+        self.guard = guard if guard is not None else GatewayGuard()
+
+    async def _call(self, fn, args: tuple, retry_on: Tuple[type, ...]):
+        guard = self.guard
+        guard.start_call()
+        attempt = 0
+        while True:
+            guard.admit()
+            try:
+                result = await asyncio.wait_for(fn(*args), timeout=guard.timeout)
+            except asyncio.TimeoutError:
+                error = GatewayTimeoutError(f"Payment gateway did not respond within {guard.timeout:g}s.")
+            except Exception as e:
+                error = e
+            else:
+                guard.record_success()
+                return result
+
+            delay = guard.record_failure(error, attempt, retry_on)
+            if delay is None:
+                raise error
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    @instrumented('gateway', count_rows=False)
+    async def process_payment(self, patron_id: str, amount: float, description: str = "") -> Tuple[bool, str, str]:
+        return await self._call(self.gateway.process_payment, (patron_id, amount, description), RETRY_ON_WRITE)
+
+    @instrumented('gateway', count_rows=False)
+    async def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
+        return await self._call(self.gateway.refund_payment, (transaction_id, amount), RETRY_ON_WRITE)
+
+    @instrumented('gateway', count_rows=False)
+    async def verify_payment_status(self, transaction_id: str) -> Dict:
+        return await self._call(self.gateway.verify_payment_status, (transaction_id,), RETRY_ON_READ)
+
+    def metrics(self) -> Dict:
+        return self.guard.metrics()
+
+
+_gateway: Optional[ResilientPaymentGateway] = None
+_async_gateway: Optional[ResilientAsyncPaymentGateway] = None
+_gateway_lock = threading.Lock()
+
+def configure_payment_gateway(gateway=None, async_gateway=None, **settings) -> ResilientPaymentGateway:
+    """
+    Replace the process-wide gateway clients. Both share one GatewayGuard
+    (one circuit breaker and retry budget for the one external gateway).
+
+    Args:
+        gateway: Sync gateway to wrap (defaults to PaymentGateway)
+        async_gateway: Async gateway to wrap (defaults to AsyncPaymentGateway)
+        **settings: GatewayGuard settings (timeout, max_retries, ...) and
+            CircuitBreaker settings (failure_threshold, reset_timeout, ...)
+    """
+    global _gateway, _async_gateway
+    breaker_settings = {key: settings.pop(key) for key in
+                        ('failure_threshold', 'window_size', 'min_calls', 'reset_timeout', 'clock')
+                        if key in settings}
+    guard = GatewayGuard(breaker=CircuitBreaker(**breaker_settings), **settings)
+    with _gateway_lock:
+        if _gateway is not None:
+            _gateway.close()
+        _gateway = ResilientPaymentGateway(gateway, guard)
+        _async_gateway = ResilientAsyncPaymentGateway(async_gateway, guard)
+        return _gateway
+
+def get_payment_gateway() -> ResilientPaymentGateway:
+    """The process-wide sync gateway client, created with default settings on first use."""
+    if _gateway is None:
+        configure_payment_gateway()
+    return _gateway
+
+def get_async_payment_gateway() -> ResilientAsyncPaymentGateway:
+    """The process-wide async gateway client, sharing its guard with get_payment_gateway()."""
+    if _async_gateway is None:
+        configure_payment_gateway()
+    return _async_gateway
+
+def get_gateway_metrics() -> Dict:
+    """Metrics of the process-wide gateway clients."""
+    return get_payment_gateway().metrics()
@@ -0,0 +1,82 @@
+"""
+Search Cache Module - Bounded cache of catalog search results
+Results are keyed on the normalized (search_term, search_type) and tied to
+the catalog version, so adding a book or changing its availability
+invalidates them while repeat searches in between skip the database.
+"""
+
+import sys
+import threading
+from typing import Dict, List, Optional
+
+from cache import LRUCache
+
+SEARCH_CACHE_SIZE = 1024                   # Distinct searches kept
+SEARCH_CACHE_MAX_BYTES = 16 * 1024 * 1024  # Estimated memory budget for the cached results
+
+
+def estimate_results_size(results: List[Dict]) -> int:
+    """Approximate bytes held by a result list: the list, each row dict and its values (keys are shared)."""
+    return sys.getsizeof(results) + sum(
+        sys.getsizeof(book) + sum(sys.getsizeof(value) for value in book.values()) for book in results
+    )
+
+
+class SearchResultCache:
+    """
+    LRU cache of search results valid for one catalog version. A lookup
+    with a newer version empties the cache first; results computed at an
+    older version are not stored. Like the book cache it is per process.
+    """
+
+    def __init__(self, maxsize: int = SEARCH_CACHE_SIZE, max_bytes: int = SEARCH_CACHE_MAX_BYTES):
+        self.cache = LRUCache(maxsize, max_bytes=max_bytes, sizeof=estimate_results_size)
+        self.version: Optional[int] = None
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def _check_version(self, version: int):
+        if version != self.version:
+            with self._lock:
+                if self.version is None or version > self.version:
+                    if self.version is not None:
+                        self.invalidations += 1
+                    self.version = version
+                    self.cache.clear()
+
+    def get(self, search_term: str, search_type: str, version: int) -> Optional[List[Dict]]:
+        """Cached results (copies) for a normalized search at the catalog version, or None."""
+        self._check_version(version)
+        results = self.cache.get((search_type, search_term))
+        return [dict(book) for book in results] if results is not None else None
+
+    def put(self, search_term: str, search_type: str, version: int, results: List[Dict]):
+        """Cache results computed at a catalog version (taken before the search ran)."""
+        with self._lock:
+            if version != self.version:
+                return
+            self.cache.put((search_type, search_term), [dict(book) for book in results])
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self) -> Dict:
+        """LRU stats (including the hit ratio and estimated bytes), the catalog version and invalidations."""
+        return dict(self.cache.stats(), version=self.version, invalidations=self.invalidations)
+
+
+_search_cache = SearchResultCache()
+
+def configure_search_cache(maxsize: int = SEARCH_CACHE_SIZE,
+                           max_bytes: int = SEARCH_CACHE_MAX_BYTES) -> SearchResultCache:
+    """Replace the search cache with an empty one (maxsize 0 disables caching)."""
+    global _search_cache
+    _search_cache = SearchResultCache(maxsize, max_bytes)
+    return _search_cache
+
+def get_search_cache() -> SearchResultCache:
+    return _search_cache
+
+def get_search_cache_stats() -> Dict:
+    """Hit/miss counters, size and estimated bytes of the search cache."""
+    return _search_cache.stats()
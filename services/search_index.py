@@ -0,0 +1,101 @@
+"""
+Search Index Module - In-memory inverted index for catalog search
+Optional alternative to the SQL search path in search_books_in_catalog
+"""
+
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+import database
+
+SEARCH_FIELDS = ('title', 'author')
+MAX_GRAM = 3  # Longest n-gram indexed; longer terms intersect their trigrams
+
+
+def _grams(text: str, n: int) -> Set[str]:
+    """All n-character substrings of text."""
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class CatalogSearchIndex:
+    """
+    Inverted index from 1-, 2- and 3-grams of the lower-cased title and author
+    to book IDs. A term matches exactly when it is a substring of the field,
+    the same semantics as the catalog scan in search_books_in_catalog.
+    """
+
+    def __init__(self, database_path: str):
+        self.database = database_path
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[str, Set[int]]] = {field: defaultdict(set) for field in SEARCH_FIELDS}
+        self._text: Dict[str, Dict[int, str]] = {field: {} for field in SEARCH_FIELDS}
+        self._sort_keys: Dict[int, tuple] = {}
+
+    def add_book(self, book: Dict):
+        """Index a single book (a row dict from the books table)."""
+        book_id = book['id']
+        with self._lock:
+            self._sort_keys[book_id] = (book['title'], book_id)
+            for field in SEARCH_FIELDS:
+                text = book[field].lower()
+                self._text[field][book_id] = text
+                postings = self._postings[field]
+                for n in range(1, MAX_GRAM + 1):
+                    for gram in _grams(text, n):
+                        postings[gram].add(book_id)
+
+    def add_books(self, books: Iterable[Dict]):
+        """Index many books."""
+        for book in books:
+            self.add_book(book)
+
+    def search(self, search_term: str, search_type: str) -> List[int]:
+        """
+        Find books whose title or author contains search_term.
+
+        Args:
+            search_term: Stripped, lower-cased search term
+            search_type: 'title' or 'author'
+
+        Returns:
+            list of int: Matching book IDs in catalog order (title, then ID)
+        """
+        postings = self._postings[search_type]
+        with self._lock:
+            if len(search_term) <= MAX_GRAM:
+                matches = set(postings.get(search_term, ()))
+            else:
+                candidate_sets = sorted(
+                    (postings.get(gram, set()) for gram in _grams(search_term, MAX_GRAM)), key=len
+                )
+                candidates = set.intersection(*candidate_sets)
+                texts = self._text[search_type]
+                matches = {book_id for book_id in candidates if search_term in texts[book_id]}
+            return sorted(matches, key=self._sort_keys.__getitem__)
+
+    def __len__(self):
+        return len(self._sort_keys)
+
+
+_index: Optional[CatalogSearchIndex] = None
+
+def build_search_index() -> CatalogSearchIndex:
+    """Build the index from the books table and make it the active search index."""
+    global _index
+    index = CatalogSearchIndex(database.DATABASE)
+    index.add_books(database.get_all_books())
+    _index = index
+    return index
+
+def get_search_index() -> Optional[CatalogSearchIndex]:
+    """The active search index, or None if disabled or built for a different database."""
+    index = _index
+    if index is None or index.database != database.DATABASE:
+        return None
+    return index
+
+def disable_search_index():
+    """Drop the active search index; searches go back to the SQL path."""
+    global _index
+    _index = None
@@ -0,0 +1,105 @@
+"""
+Fake payment gateways for tests.
+Drop-in replacements for PaymentGateway and AsyncPaymentGateway with
+configurable latency, declines and exceptions, recording every call.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class FakePaymentGateway:
+    """
+    Synchronous fake gateway.
+
+    Args:
+        latency: Seconds each call takes
+        decline: Message to decline payments with (None to approve)
+        error: Exception raised by calls (None for no error)
+        fail_first: Only the first fail_first calls raise error (None: every call)
+    """
+
+    def __init__(self, latency: float = 0.0, decline: Optional[str] = None,
+                 error: Optional[Exception] = None, fail_first: Optional[int] = None):
+        self.latency = latency
+        self.decline = decline
+        self.error = error
+        self.fail_first = fail_first
+        self.calls = 0
+        self.payments: List[Dict] = []
+        self.refunds: List[Dict] = []
+        self._lock = threading.Lock()
+        self._counter = 0
+
+    def _next_transaction_id(self, patron_id: str) -> str:
+        with self._lock:
+            self._counter += 1
+            return f"txn_{patron_id}_{self._counter}"
+
+    def _maybe_raise(self):
+        with self._lock:
+            self.calls += 1
+            failing = self.error is not None and (self.fail_first is None or self.calls <= self.fail_first)
+        if failing:
+            raise self.error
+
+    def _charge(self, patron_id: str, amount: float, description: str) -> Tuple[bool, str, str]:
+        with self._lock:
+            self.payments.append({'patron_id': patron_id, 'amount': amount, 'description': description})
+        self._maybe_raise()
+        if self.decline is not None:
+            return False, "", self.decline
+        return True, self._next_transaction_id(patron_id), f"Payment of ${amount:.2f} processed successfully"
+
+    def _refund(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
+        with self._lock:
+            self.refunds.append({'transaction_id': transaction_id, 'amount': amount})
+        self._maybe_raise()
+        return True, f"Refund of ${amount:.2f} processed successfully. Refund ID: refund_{transaction_id}"
+
+    def _status(self, transaction_id: str) -> Dict:
+        self._maybe_raise()
+        return {'transaction_id': transaction_id, 'status': 'completed'}
+
+    def process_payment(self, patron_id: str, amount: float, description: str = "") -> Tuple[bool, str, str]:
+        time.sleep(self.latency)
+        return self._charge(patron_id, amount, description)
+
+    def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
+        time.sleep(self.latency)
+        return self._refund(transaction_id, amount)
+
+    def verify_payment_status(self, transaction_id: str) -> Dict:
+        time.sleep(self.latency)
+        return self._status(transaction_id)
+
+
+class FakeAsyncPaymentGateway(FakePaymentGateway):
+    """asyncio fake gateway; also tracks how many calls are in flight at once."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def _call(self, fn, *args):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    async def process_payment(self, patron_id: str, amount: float, description: str = "") -> Tuple[bool, str, str]:
+        return await self._call(self._charge, patron_id, amount, description)
+
+    async def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
+        return await self._call(self._refund, transaction_id, amount)
+
+    async def verify_payment_status(self, transaction_id: str) -> Dict:
+        return await self._call(self._status, transaction_id)
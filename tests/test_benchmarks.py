@@ -0,0 +1,52 @@
+import json
+import database
+from benchmarks.run_benchmarks import run_benchmarks, compare, main, seed_database, run_service_benchmarks
+from services.search_cache import configure_search_cache, get_search_cache_stats
+
+def test_benchmark_suite_smoke(tmp_path):
+    """A tiny run of the suite produces every benchmark and restores DATABASE."""
+    original_database = database.DATABASE
+    report = run_benchmarks(books=30, patrons=5, loans=40, iterations=3)
+
+    assert database.DATABASE == original_database
+    assert report['meta']['books'] == 30
+    for name in ('add_book_to_catalog', 'borrow_book_by_patron', 'return_book_by_patron',
+                 'search_books_in_catalog', 'get_patron_status_report', 'GET /catalog', 'GET /api/search'):
+        result = report['results'][name]
+        assert result['iterations'] == 3
+        assert 0 <= result['p50_ms'] <= result['p99_ms'] <= result['max_ms']
+
+    lines = compare(report, report)
+    assert len(lines) == len(report['results'])
+    assert all('(1.00x)' in line for line in lines)
+
+def test_benchmark_borrows_succeed(tmp_path):
+    """Every benchmarked borrow and return goes through, and searches are not cache hits."""
+    original_database = database.DATABASE
+    database.DATABASE = str(tmp_path / "bench.db")
+    try:
+        seed_database(books=5, patrons=3, loans=10)
+        available = sum(book['available_copies'] for book in database.get_all_books())
+        run_service_benchmarks(iterations=available, patrons=3)
+
+        conn = database.get_db_connection()
+        returned = conn.execute(
+            "SELECT COUNT(*) FROM borrow_records WHERE patron_id >= '900000' AND return_date IS NOT NULL"
+        ).fetchone()[0]
+        conn.close()
+        assert returned == available
+        assert get_search_cache_stats()['hits'] == 0
+    finally:
+        configure_search_cache()
+        database.close_connection_pool()
+        database.DATABASE = original_database
+
+def test_benchmark_cli_writes_json(tmp_path):
+    """The command line entry point writes the results as JSON."""
+    output = tmp_path / "bench.json"
+    main(['--books', '20', '--patrons', '3', '--loans', '10', '--iterations', '2',
+          '--no-routes', '--output', str(output)])
+
+    data = json.loads(output.read_text())
+    assert 'GET /catalog' not in data['results']
+    assert data['results']['search_books_in_catalog']['iterations'] == 2
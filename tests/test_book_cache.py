@@ -0,0 +1,112 @@
+import pytest
+import tempfile
+import os
+import database
+from services.library_service import borrow_book_by_patron, return_book_by_patron
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    """Set up a temp SQLite DB with one book and an empty book cache."""
+    db_fd, db_path = tempfile.mkstemp()
+    global BOOK_ID
+    original_database = database.DATABASE
+    database.DATABASE = db_path
+    database.init_database()
+    database.configure_book_cache(16)
+    database.insert_book("Cached Book", "Author", "1234567890123", 2, 2)
+    BOOK_ID = database.get_book_by_isbn("1234567890123")['id']
+    database.configure_book_cache(16)
+
+    yield
+
+    # Cleanup
+    database.configure_book_cache()
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+def queries(mocker):
+    return mocker.spy(database, 'get_db_connection')
+
+def test_repeated_reads_hit_cache(mocker):
+    spy = queries(mocker)
+    for _ in range(3):
+        assert database.get_book_by_id(BOOK_ID)['title'] == "Cached Book"
+    assert spy.call_count == 1
+    stats = database.get_book_cache_stats()['books']
+    assert (stats['hits'], stats['misses']) == (2, 1)
+
+def test_isbn_lookup_shares_row_cache(mocker):
+    spy = queries(mocker)
+    assert database.get_book_by_isbn("1234567890123")['id'] == BOOK_ID
+    assert database.get_book_by_isbn("1234567890123")['id'] == BOOK_ID
+    assert database.get_book_by_id(BOOK_ID)['isbn'] == "1234567890123"
+    assert spy.call_count == 1
+
+    # After an update the ISBN still resolves, and the row is read again
+    database.update_book_availability(BOOK_ID, -1)
+    spy.reset_mock()
+    assert database.get_book_by_isbn("1234567890123")['available_copies'] == 1
+    assert spy.call_count == 1
+
+def test_missing_books_are_not_cached():
+    assert database.get_book_by_id(9999) is None
+    assert database.get_book_by_isbn("9999999999999") is None
+    database.insert_book("New Book", "Author", "9999999999999", 1, 1)
+    assert database.get_book_by_isbn("9999999999999")['title'] == "New Book"
+
+def test_returned_rows_are_copies():
+    book = database.get_book_by_id(BOOK_ID)
+    book['available_copies'] = 0
+    assert database.get_book_by_id(BOOK_ID)['available_copies'] == 2
+
+def test_update_availability_invalidates():
+    database.get_book_by_id(BOOK_ID)
+    database.update_book_availability(BOOK_ID, -1)
+    assert database.get_book_by_id(BOOK_ID)['available_copies'] == 1
+
+def test_borrow_and_return_invalidate():
+    database.get_book_by_id(BOOK_ID)
+    assert borrow_book_by_patron("123456", BOOK_ID)[0] is True
+    assert database.get_book_by_id(BOOK_ID)['available_copies'] == 1
+    assert return_book_by_patron("123456", BOOK_ID)[0] is True
+    assert database.get_book_by_id(BOOK_ID)['available_copies'] == 2
+
+def test_read_racing_a_write_is_not_cached():
+    cache = database._book_cache
+    generation = cache.generation
+    stale = database.get_book_by_id(BOOK_ID)
+    database.update_book_availability(BOOK_ID, -1)
+    cache.put(stale, generation)
+    assert database.get_book_by_id(BOOK_ID)['available_copies'] == 1
+
+def test_lru_size_limit():
+    database.configure_book_cache(2)
+    ids = []
+    for i in range(3):
+        database.insert_book(f"Book {i}", "Author", f"{1000000000000 + i}", 1, 1)
+        ids.append(database.get_book_by_isbn(f"{1000000000000 + i}")['id'])
+    assert database.get_book_cache_stats()['books']['size'] == 2
+
+def test_cache_disabled(mocker):
+    database.configure_book_cache(0)
+    spy = queries(mocker)
+    database.get_book_by_id(BOOK_ID)
+    database.get_book_by_id(BOOK_ID)
+    assert spy.call_count == 2
+
+def test_switching_database_clears_cache():
+    database.get_book_by_id(BOOK_ID)
+    other_fd, other_path = tempfile.mkstemp()
+    current = database.DATABASE
+    try:
+        database.DATABASE = other_path
+        database.init_database()
+        assert database.get_book_by_id(BOOK_ID) is None
+    finally:
+        database.close_connection_pool()
+        database.DATABASE = current
+        os.close(other_fd)
+        os.remove(other_path)
+    assert database.get_book_by_id(BOOK_ID)['title'] == "Cached Book"
@@ -0,0 +1,87 @@
+import pytest
+import tempfile
+import os
+import threading
+import datetime
+import database
+from services.library_service import borrow_book_by_patron, return_book_by_patron
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    """Set up a temp SQLite DB for transactional borrow/return tests."""
+    db_fd, db_path = tempfile.mkstemp()
+    global Book_A_ID, Book_B_ID
+    original_database = database.DATABASE
+    database.DATABASE = db_path
+    database.init_database()
+
+    database.insert_book("Book A", "Author A", "1111111111111", 3, 3)
+    database.insert_book("Book B", "Author B", "2222222222222", 1, 1)
+
+    Book_A_ID = database.get_book_by_isbn("1111111111111")['id']
+    Book_B_ID = database.get_book_by_isbn("2222222222222")['id']
+
+    yield
+
+    # Cleanup
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+def test_concurrent_borrows_never_oversell():
+    """Concurrent borrows of the same title cannot drive availability negative."""
+    patrons = [f"{100000 + i}" for i in range(10)]
+    results = []
+
+    def worker(patron_id):
+        results.append(borrow_book_by_patron(patron_id, Book_A_ID)[0])
+
+    threads = [threading.Thread(target=worker, args=(p,)) for p in patrons]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results.count(True) == 3
+    assert database.get_book_by_id(Book_A_ID)['available_copies'] == 0
+
+def test_rejected_borrow_does_not_reserve_copy():
+    """A borrow rejected after the copy was reserved rolls the reservation back."""
+    borrow_book_by_patron("123456", Book_A_ID)
+    success, message = borrow_book_by_patron("123456", Book_A_ID)
+
+    assert success is False
+    assert "already borrowed" in message.lower()
+    assert database.get_book_by_id(Book_A_ID)['available_copies'] == 2
+
+def test_unavailable_checked_before_duplicate():
+    """Message precedence matches the original checks: availability first."""
+    borrow_book_by_patron("123456", Book_B_ID)
+    success, message = borrow_book_by_patron("123456", Book_B_ID)
+
+    assert success is False
+    assert "not available" in message.lower()
+
+def test_return_restores_copy_once():
+    """Returning closes the loan and restores exactly one copy."""
+    borrow_book_by_patron("123456", Book_A_ID)
+    success, _ = return_book_by_patron("123456", Book_A_ID)
+    assert success is True
+    assert database.get_book_by_id(Book_A_ID)['available_copies'] == 3
+
+    success, message = return_book_by_patron("123456", Book_A_ID)
+    assert success is False
+    assert "not borrowed" in message.lower()
+    assert database.get_book_by_id(Book_A_ID)['available_copies'] == 3
+
+def test_return_reports_late_fee_of_closed_loan():
+    """The late fee in the return message comes from the loan being closed."""
+    borrow_date = datetime.datetime.now() - datetime.timedelta(days=24)
+    due_date = datetime.datetime.now() - datetime.timedelta(days=10)  # 10 days overdue
+    database.insert_borrow_record("654321", Book_A_ID, borrow_date, due_date)
+
+    success, message = return_book_by_patron("654321", Book_A_ID)
+
+    assert success is True
+    assert "$6.50" in message  # 7 * 0.50 + 3 * 1.00
@@ -0,0 +1,137 @@
+import pytest
+import tempfile
+import os
+import io
+import json
+import database
+from app import create_app
+from services.import_service import import_books
+
+CSV_DATA = """title,author,isbn,total_copies
+Book A,Author A,1111111111111,3
+  Book B  ,Author B,2222222222222,1
+,No Title,3333333333333,2
+Book D,Author D,12345,2
+Book E,Author E,4444444444444,zero
+Book F,Author F,5555555555555,-1
+Book A Again,Author A,1111111111111,1
+Book G,Author G,9780743273565,1
+"""
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    """Set up a temp SQLite DB for bulk import tests."""
+    db_fd, db_path = tempfile.mkstemp()
+    original_database = database.DATABASE
+    database.DATABASE = db_path
+    database.init_database()
+
+    database.insert_book("The Great Gatsby", "F. Scott Fitzgerald", "9780743273565", 3, 3)
+
+    yield
+
+    # Cleanup
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+def test_csv_import_with_error_report():
+    """Valid rows are imported; every invalid row is reported with its reason."""
+    result = import_books(io.StringIO(CSV_DATA), 'csv', batch_size=1)
+
+    assert result['success'] is True
+    assert result['imported'] == 2
+    errors = {e['row']: e['message'] for e in result['errors']}
+    assert errors == {
+        4: "Title is required.",
+        5: "ISBN must be exactly 13 digits.",
+        6: "Total copies must be a positive integer.",
+        7: "Total copies must be a positive integer.",
+        8: "A book with this ISBN already exists.",
+        9: "A book with this ISBN already exists.",
+    }
+    book = database.get_book_by_isbn("2222222222222")
+    assert book['title'] == "Book B"
+    assert book['available_copies'] == 1
+
+def test_jsonl_import():
+    """JSONL rows are validated the same way, including malformed lines."""
+    lines = [
+        json.dumps({"title": "Book J", "author": "Author J", "isbn": "6666666666666", "total_copies": 2}),
+        "not json",
+        json.dumps(["a", "list"]),
+        "",
+        json.dumps({"title": "Book K", "author": "Author K", "isbn": "7777777777777", "total_copies": True}),
+    ]
+    result = import_books(io.StringIO("\n".join(lines)), 'jsonl')
+
+    assert result['imported'] == 1
+    assert [(e['row'], e['message']) for e in result['errors']] == [
+        (2, "Invalid JSON."),
+        (3, "Each line must be a JSON object."),
+        (5, "Total copies must be a positive integer."),
+    ]
+    assert database.get_book_by_isbn("6666666666666")['total_copies'] == 2
+
+def test_imported_books_are_searchable():
+    """The FTS triggers index imported books."""
+    import_books(io.StringIO(CSV_DATA), 'csv')
+    assert len(database.search_books_fts("title", "book b")) == 1
+
+def test_missing_columns():
+    """A CSV without the required header is rejected as a whole."""
+    result = import_books(io.StringIO("name,isbn\nBook,1111111111111\n"), 'csv')
+    assert result['imported'] == 0
+    assert "Missing column" in result['errors'][0]['message']
+
+def test_database_error_rolls_back(mocker):
+    """A failure part-way through leaves the catalog unchanged."""
+    mocker.patch('services.import_service.get_all_isbns', return_value=set())
+    result = import_books(io.StringIO(CSV_DATA), 'csv', batch_size=1)
+
+    assert result['success'] is False
+    assert database.get_book_by_isbn("1111111111111") is None
+
+def test_unsupported_format():
+    result = import_books(io.StringIO(""), 'xml')
+    assert result['success'] is False
+
+def test_import_api():
+    """The API accepts an uploaded file and returns the report."""
+    client = create_app().test_client()
+    response = client.post('/api/books/import', data={
+        'file': (io.BytesIO(CSV_DATA.encode('utf-8')), 'books.csv')
+    })
+    data = response.get_json()
+    assert response.status_code == 200
+    assert data['imported'] == 2
+    assert len(data['errors']) == 6
+
+    response = client.post('/api/books/import?format=jsonl', data=json.dumps(
+        {"title": "Raw", "author": "Body", "isbn": "8888888888888", "total_copies": 1}))
+    assert response.get_json()['imported'] == 1
+
+def test_raw_body_is_read_before_taking_the_writer():
+    """Other writes go through while a raw import body is still arriving."""
+    body = json.dumps({"title": "Raw", "author": "Body", "isbn": "8888888888888", "total_copies": 1}).encode()
+    written = []
+
+    class UploadingBody(io.BytesIO):
+        def _arrive(self):
+            if not written:
+                written.append(database.insert_book("Meanwhile", "Other", "7777777777777", 1, 1))
+
+        def read(self, *args):
+            self._arrive()
+            return super().read(*args)
+
+        def readinto(self, buffer):
+            self._arrive()
+            return super().readinto(buffer)
+
+    client = create_app().test_client()
+    response = client.post('/api/books/import?format=jsonl', input_stream=UploadingBody(body),
+                           headers={'Content-Length': str(len(body))})
+    assert response.get_json()['imported'] == 1
+    assert written == [True]
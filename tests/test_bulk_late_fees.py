@@ -0,0 +1,96 @@
+import pytest
+import tempfile
+import os
+import datetime
+import database
+from app import create_app
+from services import billing_service
+from services.billing_service import calculate_all_late_fees
+from services.library_service import calculate_late_fee_for_book
+
+OVERDUE_DAYS = [-3, 0, 1, 6, 7, 8, 12, 18, 19, 25, 60]
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    """Set up a temp SQLite DB with one open loan per overdue-day case."""
+    db_fd, db_path = tempfile.mkstemp()
+    global LOANS
+    original_database = database.DATABASE
+    database.DATABASE = db_path
+    database.init_database()
+
+    now = datetime.datetime.now()
+    LOANS = []
+    for i, days in enumerate(OVERDUE_DAYS):
+        isbn = f"{1000000000000 + i}"
+        database.insert_book(f"Book {i}", "Author", isbn, 1, 1)
+        book_id = database.get_book_by_isbn(isbn)['id']
+        patron_id = f"{100000 + i % 3}"
+        due = now - datetime.timedelta(days=days, hours=1)
+        database.insert_borrow_record(patron_id, book_id, due - datetime.timedelta(days=14), due)
+        LOANS.append((patron_id, book_id))
+    # Returned loans and malformed patron IDs are never billed
+    database.insert_borrow_record("100000", LOANS[-1][1], now - datetime.timedelta(days=90),
+                                  now - datetime.timedelta(days=76))
+    database.update_borrow_record_return_date("100000", LOANS[-1][1], now)
+    database.insert_borrow_record("12ab", LOANS[-1][1], now - datetime.timedelta(days=90),
+                                  now - datetime.timedelta(days=76))
+
+    yield
+
+    # Cleanup
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+@pytest.fixture(params=["numpy", "python"])
+def fee_backend(request, monkeypatch):
+    """Run each test with the NumPy path and the pure Python fallback."""
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(billing_service, "np", None)
+    return request.param
+
+def test_matches_scalar_calculation(fee_backend):
+    """Every per-loan fee equals calculate_late_fee_for_book for that loan."""
+    now = datetime.datetime.now()
+    summary = calculate_all_late_fees(now)
+    by_loan = {(loan['patron_id'], loan['book_id']): loan for loan in summary['loans']}
+
+    for patron_id, book_id in LOANS:
+        expected = calculate_late_fee_for_book(patron_id, book_id)
+        loan = by_loan.get((patron_id, book_id))
+        if expected['fee_amount'] == 0:
+            assert loan is None
+        else:
+            assert loan['fee_amount'] == expected['fee_amount']
+            assert loan['days_overdue'] == expected['days_overdue']
+
+def test_patron_totals(fee_backend):
+    """Per-patron totals add up the patron's loans, and the grand total adds up the patrons."""
+    summary = calculate_all_late_fees()
+    totals = {}
+    for patron_id, book_id in LOANS:
+        fee = calculate_late_fee_for_book(patron_id, book_id)['fee_amount']
+        if fee:
+            totals[patron_id] = totals.get(patron_id, 0.0) + fee
+
+    assert summary['patron_totals'] == totals
+    assert summary['total_late_fees'] == sum(totals.values())
+    assert "12ab" not in summary['patron_totals']
+
+def test_no_open_loans():
+    """An empty library owes nothing."""
+    conn = database.get_db_connection()
+    conn.execute("DELETE FROM borrow_records")
+    conn.commit()
+    conn.close()
+    assert calculate_all_late_fees() == {'loans': [], 'patron_totals': {}, 'total_late_fees': 0.0}
+
+def test_late_fees_api():
+    """The API endpoint returns the same summary as JSON."""
+    client = create_app().test_client()
+    data = client.get('/api/late_fees').get_json()
+    assert data['total_late_fees'] == calculate_all_late_fees()['total_late_fees']
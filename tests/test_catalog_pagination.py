@@ -0,0 +1,78 @@
+import pytest
+import tempfile
+import os
+import database
+from app import create_app
+from services.library_service import get_catalog_page
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    """Set up a temp SQLite DB with duplicate titles for pagination tests."""
+    db_fd, db_path = tempfile.mkstemp()
+    original_database = database.DATABASE
+    database.DATABASE = db_path
+    database.init_database()
+
+    for i in range(25):
+        title = f"Book {i % 10:02d}"  # Duplicate titles exercise the id tie-breaker
+        database.insert_book(title, f"Author {i}", f"{1000000000000 + i}", 1, 1)
+
+    yield
+
+    # Cleanup
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+def test_pages_cover_catalog_in_order():
+    """Walking every page yields the full catalog once, in (title, id) order."""
+    seen = []
+    cursor = None
+    while True:
+        page = get_catalog_page(cursor, page_size=4)
+        assert len(page['books']) <= 4
+        seen.extend(page['books'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    expected = sorted(database.get_all_books(), key=lambda b: (b['title'], b['id']))
+    assert seen == expected
+
+def test_last_page_has_no_cursor():
+    """A page that reaches the end of the catalog has no next cursor."""
+    page = get_catalog_page(None, page_size=25)
+    assert len(page['books']) == 25
+    assert page['next_cursor'] is None
+
+def test_page_size_is_clamped():
+    """Page sizes outside 1..MAX are clamped."""
+    assert get_catalog_page(None, page_size=0)['page_size'] == 1
+    assert get_catalog_page(None, page_size=10**6)['page_size'] == 200
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "bnVsbA==", "WzEsIDJd"])
+def test_invalid_cursor(cursor):
+    """Malformed cursors are rejected."""
+    assert get_catalog_page(cursor) is None
+
+def test_catalog_route_and_api_paginate():
+    """The HTML and JSON endpoints serve pages and follow cursors."""
+    client = create_app().test_client()
+
+    response = client.get('/api/books?page_size=10')
+    data = response.get_json()
+    assert response.status_code == 200
+    assert data['count'] == 10
+    assert data['next_cursor']
+
+    response = client.get(f"/api/books?page_size=10&cursor={data['next_cursor']}")
+    second = response.get_json()
+    assert second['results'][0]['id'] not in {b['id'] for b in data['results']}
+
+    assert client.get('/api/books?cursor=garbage').status_code == 400
+
+    response = client.get(f"/catalog?page_size=5&cursor={data['next_cursor']}")
+    assert response.status_code == 200
+    assert b'Next Page' in response.data
+    assert b'First Page' in response.data
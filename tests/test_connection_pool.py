@@ -0,0 +1,105 @@
+import pytest
+import tempfile
+import os
+import threading
+import database
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    """Set up a temp SQLite DB for connection pool tests."""
+    db_fd, db_path = tempfile.mkstemp()
+    original_database = database.DATABASE
+    database.DATABASE = db_path
+    database.init_database()
+
+    yield
+
+    # Cleanup
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+def test_connection_is_reused():
+    """Closing a pooled connection returns it to the pool for the next caller."""
+    conn = database.get_db_connection()
+    raw = conn._conn
+    conn.close()
+
+    conn2 = database.get_db_connection()
+    assert conn2._conn is raw
+    conn2.close()
+
+def test_pool_keeps_at_most_pool_size_idle():
+    """Connections beyond the pool size are closed when released."""
+    pool = database.get_connection_pool()
+    conns = [database.get_db_connection() for _ in range(database.POOL_SIZE + 3)]
+    for conn in conns:
+        conn.close()
+    assert pool.idle_count() == database.POOL_SIZE
+
+def test_pragmas_applied_on_connect():
+    """Pragmas are applied once when a connection is opened."""
+    conn = database.get_db_connection()
+    temp_store = conn.execute('PRAGMA temp_store').fetchone()[0]
+    conn.close()
+    assert temp_store == 2  # MEMORY
+
+def test_unhealthy_connection_is_replaced():
+    """A broken idle connection is discarded instead of being handed out."""
+    conn = database.get_db_connection()
+    raw = conn._conn
+    conn.close()
+    raw.close()  # Simulate a connection that died while idle
+
+    conn2 = database.get_db_connection()
+    assert conn2._conn is not raw
+    assert conn2.execute('SELECT COUNT(*) FROM books').fetchone()[0] == 0
+    conn2.close()
+
+def test_uncommitted_work_rolled_back_on_release():
+    """Uncommitted writes do not leak to the next user of the connection."""
+    conn = database.get_db_connection()
+    conn.execute('''
+        INSERT INTO books (title, author, isbn, total_copies, available_copies)
+        VALUES ('Ghost', 'Nobody', '0000000000000', 1, 1)
+    ''')
+    conn.close()
+
+    assert database.get_book_by_isbn('0000000000000') is None
+
+def test_closed_connection_cannot_be_used():
+    """Using a connection after close() raises instead of touching the pool."""
+    conn = database.get_db_connection()
+    conn.close()
+    with pytest.raises(database.sqlite3.ProgrammingError):
+        conn.execute('SELECT 1')
+
+def test_switching_database_replaces_pool():
+    """Pointing DATABASE at another file gives a fresh pool for that file."""
+    old_pool = database.get_connection_pool()
+    db_fd, other_path = tempfile.mkstemp()
+    try:
+        database.DATABASE = other_path
+        new_pool = database.get_connection_pool()
+        assert new_pool is not old_pool
+        assert new_pool.database == other_path
+    finally:
+        database.close_connection_pool()
+        os.close(db_fd)
+        os.remove(other_path)
+
+def test_connections_shared_across_threads():
+    """Pooled connections can be used from worker threads."""
+    database.insert_book("Book A", "Author A", "1111111111111", 1, 1)
+    results = []
+
+    def worker():
+        results.append(database.get_book_by_isbn("1111111111111")['title'])
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == ["Book A"] * 8
@@ -0,0 +1,96 @@
+import pytest
+import tempfile
+import os
+import datetime
+import database
+from app import create_app
+from http_cache import configure_response_cache, get_response_cache_stats
+from services.library_service import add_book_to_catalog, borrow_book_by_patron
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    """Set up a temp SQLite DB holding the sample books."""
+    db_fd, db_path = tempfile.mkstemp()
+    original_database = database.DATABASE
+    database.DATABASE = db_path
+    database.init_database()
+
+    yield
+
+    # Cleanup
+    configure_response_cache()
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+@pytest.fixture
+def client():
+    return create_app().test_client()
+
+def test_catalog_version_is_bumped_by_catalog_writes():
+    version, last_modified = database.get_catalog_version()
+    assert database.insert_book("Book A", "Author A", "1000000000001", 2, 2)
+    book_id = database.get_book_by_isbn("1000000000001")['id']
+    assert database.get_catalog_version()[0] == version + 1
+    assert database.get_catalog_version()[1] >= last_modified
+
+    database.update_book_availability(book_id, -1)
+    assert database.get_catalog_version()[0] == version + 2
+
+    database.get_all_books()
+    now = datetime.datetime.now()
+    database.insert_borrow_record("123456", book_id, now, now + datetime.timedelta(days=14))
+    assert database.get_catalog_version()[0] == version + 2
+
+def test_conditional_get(client):
+    first = client.get('/catalog')
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'no-cache'
+    etag = first.headers['ETag']
+
+    repeat = client.get('/catalog', headers={'If-None-Match': etag})
+    assert repeat.status_code == 304
+    assert repeat.get_data() == b''
+    assert repeat.headers['ETag'] == etag
+
+    since = client.get('/catalog', headers={'If-Modified-Since': first.headers['Last-Modified']})
+    assert since.status_code == 304
+
+def test_etag_changes_with_the_catalog(client):
+    etag = client.get('/api/search?q=gatsby&type=title').headers['ETag']
+
+    add_book_to_catalog("Gatsby Revisited", "Author B", "1000000000002", 1)
+
+    response = client.get('/api/search?q=gatsby&type=title', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()['count'] == 2
+
+def test_borrowing_invalidates_cached_search(client):
+    book_id = database.get_book_by_isbn("9780743273565")['id']
+    before = client.get('/api/search?q=9780743273565&type=isbn').get_json()
+    assert before['results'][0]['available_copies'] == 3
+
+    assert borrow_book_by_patron("654321", book_id)[0]
+
+    after = client.get('/api/search?q=9780743273565&type=isbn').get_json()
+    assert after['results'][0]['available_copies'] == 2
+
+def test_repeat_requests_are_served_from_the_cache(client):
+    configure_response_cache(16)
+    first = client.get('/search?q=orwell&type=author')
+    second = client.get('/search?type=author&q=orwell')
+
+    assert second.get_data() == first.get_data()
+    assert get_response_cache_stats()['hits'] == 1
+    assert client.get('/search?q=orwell&type=title').status_code == 200
+    assert get_response_cache_stats()['misses'] == 2
+
+def test_errors_and_flashed_pages_are_not_cached(client):
+    assert 'ETag' not in client.get('/api/search').headers
+    invalid = client.get('/catalog?cursor=garbage')
+    assert 'ETag' not in invalid.headers
+    assert b'Invalid page cursor' in invalid.get_data()
+    assert b'Invalid page cursor' not in client.get('/catalog').get_data()
+    assert get_response_cache_stats()['size'] == 1
@@ -0,0 +1,162 @@
+import pytest
+import tempfile
+import os
+import datetime
+import database
+from app import create_app
+from cache import LRUCache
+from services.idempotency import configure_idempotency_store, get_idempotency_store
+from services.library_service import pay_late_fees, pay_all_late_fees, refund_late_fee_payment
+from services.payment_queue import configure_payment_queue
+from services.resilient_gateway import configure_payment_gateway
+from tests.fake_gateway import FakePaymentGateway, FakeAsyncPaymentGateway
+
+PATRON = "123456"
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    """Set up a temp SQLite DB with two overdue loans."""
+    db_fd, db_path = tempfile.mkstemp()
+    global BOOK_IDS
+    original_database = database.DATABASE
+    database.DATABASE = db_path
+    database.init_database()
+    configure_idempotency_store()
+
+    now = datetime.datetime.now()
+    BOOK_IDS = []
+    for i in range(2):
+        isbn = f"{1000000000000 + i}"
+        database.insert_book(f"Book {i}", "Author", isbn, 1, 1)
+        book_id = database.get_book_by_isbn(isbn)['id']
+        due = now - datetime.timedelta(days=10)
+        database.insert_borrow_record(PATRON, book_id, due - datetime.timedelta(days=14), due)
+        BOOK_IDS.append(book_id)
+
+    yield
+
+    # Cleanup
+    configure_idempotency_store()
+    configure_payment_gateway()
+    configure_payment_queue()
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert cache.stats() == {'size': 2, 'maxsize': 2, 'hits': 1, 'misses': 1, 'hit_ratio': 0.5}
+
+def test_repeated_key_charges_once():
+    gateway = FakePaymentGateway()
+    first = pay_late_fees(PATRON, BOOK_IDS[0], gateway, idempotency_key="key-1")
+    second = pay_late_fees(PATRON, BOOK_IDS[0], gateway, idempotency_key="key-1")
+    assert first[0] is True
+    assert second == first
+    assert len(gateway.payments) == 1
+
+def test_result_survives_restart():
+    """A new store (empty LRU) replays from the table."""
+    gateway = FakePaymentGateway()
+    first = pay_late_fees(PATRON, BOOK_IDS[0], gateway, idempotency_key="key-1")
+    configure_idempotency_store()
+    assert pay_late_fees(PATRON, BOOK_IDS[0], gateway, idempotency_key="key-1") == first
+    assert len(gateway.payments) == 1
+
+def test_failures_are_replayed_too():
+    gateway = FakePaymentGateway(error=TimeoutError("no response"))
+    first = pay_late_fees(PATRON, BOOK_IDS[0], gateway, idempotency_key="key-1")
+    assert first[0] is False
+    gateway.error = None
+    assert pay_late_fees(PATRON, BOOK_IDS[0], gateway, idempotency_key="key-1") == first
+    assert len(gateway.payments) == 1
+
+def test_key_reused_for_different_request():
+    gateway = FakePaymentGateway()
+    pay_late_fees(PATRON, BOOK_IDS[0], gateway, idempotency_key="key-1")
+    success, msg, txn_id = pay_late_fees(PATRON, BOOK_IDS[1], gateway, idempotency_key="key-1")
+    assert (success, txn_id) == (False, None)
+    assert msg == "This idempotency key was already used for a different request."
+    assert len(gateway.payments) == 1
+
+def test_keys_are_scoped_per_operation():
+    gateway = FakePaymentGateway()
+    success, msg, txn_id = pay_all_late_fees(PATRON, gateway, idempotency_key="key-1")
+    assert success is True
+    refund = refund_late_fee_payment(txn_id, 6.5, gateway, book_id=BOOK_IDS[0], idempotency_key="key-1")
+    assert refund[0] is True
+    assert refund_late_fee_payment(txn_id, 6.5, gateway, book_id=BOOK_IDS[0], idempotency_key="key-1") == refund
+    assert len(gateway.refunds) == 1
+
+def test_no_key_means_no_dedup():
+    gateway = FakePaymentGateway(decline="Card declined")
+    pay_late_fees(PATRON, BOOK_IDS[0], gateway)
+    pay_late_fees(PATRON, BOOK_IDS[0], gateway)
+    assert len(gateway.payments) == 2
+
+def test_in_flight_key_is_rejected():
+    gateway = FakePaymentGateway()
+    store = get_idempotency_store()
+    nested = []
+    def charge():
+        nested.append(pay_late_fees(PATRON, BOOK_IDS[0], gateway, idempotency_key="key-1"))
+        return (True, "done", "txn_1")
+    store.run('pay_late_fees', "key-1", {'patron_id': PATRON, 'book_id': BOOK_IDS[0]}, charge)
+    assert nested == [(False, "A request with this idempotency key is still being processed.", None)]
+
+def test_abandoned_claim_is_reclaimed_after_lease():
+    gateway = FakePaymentGateway()
+    configure_idempotency_store(claim_lease_seconds=60)
+    # A claim left behind by a process that died mid-request
+    claimed_at = datetime.datetime.now() - datetime.timedelta(minutes=5)
+    assert database.claim_idempotency_key('pay_late_fees', "key-1", "hash", claimed_at,
+                                          claimed_at - datetime.timedelta(hours=24))
+    success, msg, txn = pay_late_fees(PATRON, BOOK_IDS[0], gateway, idempotency_key="key-1")
+    assert success is True
+    assert len(gateway.payments) == 1
+    assert pay_late_fees(PATRON, BOOK_IDS[0], gateway, idempotency_key="key-1") == (success, msg, txn)
+
+def test_retention_window():
+    gateway = FakePaymentGateway(decline="Card declined")
+    configure_idempotency_store(retention_hours=0)
+    pay_late_fees(PATRON, BOOK_IDS[0], gateway, idempotency_key="key-1")
+    pay_late_fees(PATRON, BOOK_IDS[0], gateway, idempotency_key="key-1")
+    assert len(gateway.payments) == 2
+    assert get_idempotency_store().purge_expired() == 1
+    assert database.get_idempotency_key('pay_late_fees', "key-1") is None
+
+def test_exception_releases_key():
+    store = get_idempotency_store()
+    def boom():
+        raise RuntimeError("bug")
+    with pytest.raises(RuntimeError):
+        store.run('pay_late_fees', "key-1", {}, boom)
+    assert database.get_idempotency_key('pay_late_fees', "key-1") is None
+
+def test_routes_honour_idempotency_key_header():
+    app = create_app()
+    app.config['TESTING'] = True
+    gateway = FakePaymentGateway()
+    configure_payment_gateway(gateway)
+    configure_payment_queue(FakeAsyncPaymentGateway())
+    client = app.test_client()
+
+    headers = {'Idempotency-Key': 'abc'}
+    job_a = client.post('/api/payments/late_fees', json={'patron_id': PATRON, 'book_id': BOOK_IDS[0]}, headers=headers)
+    job_b = client.post('/api/payments/late_fees', json={'patron_id': PATRON, 'book_id': BOOK_IDS[0]}, headers=headers)
+    assert job_a.get_json()['job_id'] == job_b.get_json()['job_id']
+
+    first = client.post('/api/payments/late_fees/all', json={'patron_id': PATRON}, headers=headers)
+    second = client.post('/api/payments/late_fees/all', json={'patron_id': PATRON}, headers=headers)
+    assert first.get_json()['transaction_id'] == second.get_json()['transaction_id']
+    assert len(gateway.payments) == 1
+
+    too_long = {'Idempotency-Key': 'x' * 256}
+    assert client.post('/api/payments/late_fees/all', json={'patron_id': PATRON}, headers=too_long).status_code == 400
@@ -0,0 +1,127 @@
+import pytest
+import tempfile
+import os
+import datetime
+import database
+import instrumentation
+from app import create_app
+from instrumentation import instrumented, registry, start_request, finish_request, configure_instrumentation
+from services.resilient_gateway import configure_payment_gateway, get_payment_gateway
+from tests.fake_gateway import FakePaymentGateway
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    """Set up a temp SQLite DB with one book on loan, and empty metrics."""
+    db_fd, db_path = tempfile.mkstemp()
+    global BOOK_ID
+    original_database = database.DATABASE
+    database.DATABASE = db_path
+    database.init_database()
+    database.insert_book("Book A", "Author A", "1000000000001", 2, 2)
+    BOOK_ID = database.get_book_by_isbn("1000000000001")['id']
+    now = datetime.datetime.now()
+    database.insert_borrow_record("123456", BOOK_ID, now - datetime.timedelta(days=20), now - datetime.timedelta(days=6))
+    configure_instrumentation()
+
+    yield
+
+    # Cleanup
+    configure_instrumentation()
+    configure_payment_gateway()
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+def test_helper_calls_are_recorded_per_request():
+    database.configure_book_cache()
+    token = start_request()
+    database.get_book_by_id(BOOK_ID)
+    database.get_patron_borrowed_books("123456")
+    database.get_patron_borrowed_books("654321")
+    stats = finish_request(token)
+
+    assert stats.counts('db') == {'get_book_by_id': 1, 'get_patron_borrowed_books': 2}
+    calls, seconds, rows = stats.totals('db')
+    assert (calls, rows) == (3, 2)
+    assert seconds > 0
+    assert registry.durations[('db', 'get_patron_borrowed_books')].count == 2
+    assert registry.rows[('db', 'get_patron_borrowed_books')].sum == 1
+
+def test_cache_hits_and_delegation_are_not_db_calls():
+    database.get_book_by_id(BOOK_ID)
+    token = start_request()
+    database.get_book_by_id(BOOK_ID)
+    database.get_book_by_isbn("1000000000001")
+    database.get_overdue_loans()
+    stats = finish_request(token)
+
+    assert stats.counts('db') == {'iter_overdue_loans': 1}
+    assert stats.counts('cache') == {'get_book_by_id': 2}
+    assert ('db', 'get_overdue_loans') not in registry.durations
+
+def test_streamed_rows_are_counted_when_consumed():
+    loans = database.iter_open_loans()
+    assert ('db', 'iter_open_loans') not in registry.durations
+    assert len(list(loans)) == 1
+    assert registry.rows[('db', 'iter_open_loans')].sum == 1
+
+def test_errors_are_counted():
+    @instrumented('db', 'failing_helper')
+    def failing_helper():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        failing_helper()
+    assert registry.errors[('db', 'failing_helper')] == 1
+
+def test_gateway_calls_are_recorded():
+    configure_payment_gateway(FakePaymentGateway())
+    token = start_request()
+    get_payment_gateway().process_payment("123456", 5.0, "Late fees")
+    stats = finish_request(token)
+
+    assert stats.counts('gateway') == {'process_payment': 1}
+    assert registry.durations[('gateway', 'process_payment')].count == 1
+    assert ('gateway', 'process_payment') not in registry.rows
+
+def test_debug_headers():
+    client = create_app({'METRICS_DEBUG_HEADERS': True}).test_client()
+
+    response = client.get(f'/api/late_fee/123456/{BOOK_ID}')
+
+    assert response.headers['X-DB-Calls'] == '2'
+    assert response.headers['X-DB-Helpers'] == 'get_book_by_id=1, get_patron_borrowed_books=1'
+    assert float(response.headers['X-DB-Time-Ms']) > 0
+    assert response.headers['X-Gateway-Calls'] == '0'
+    assert 'X-Cache-Hits' not in response.headers
+
+    response = client.get(f'/api/late_fee/123456/{BOOK_ID}')
+
+    assert response.headers['X-DB-Calls'] == '1'
+    assert response.headers['X-DB-Helpers'] == 'get_patron_borrowed_books=1'
+    assert response.headers['X-Cache-Hits'] == 'get_book_by_id=1'
+
+def test_no_headers_outside_debug_mode():
+    client = create_app().test_client()
+    assert 'X-DB-Calls' not in client.get('/catalog').headers
+
+def test_metrics_endpoint():
+    client = create_app().test_client()
+    client.get(f'/api/late_fee/123456/{BOOK_ID}')
+
+    response = client.get('/metrics')
+    text = response.get_data(as_text=True)
+
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    assert '# TYPE library_db_call_duration_seconds histogram' in text
+    assert 'library_db_call_duration_seconds_count{name="get_patron_borrowed_books"} 1' in text
+    assert 'library_db_call_rows_bucket{name="get_patron_borrowed_books",le="1"} 1' in text
+    assert 'library_http_request_duration_seconds_count{endpoint="api.get_late_fee",method="GET",status="200"} 1' in text
+    assert 'library_http_request_calls_bucket{endpoint="api.get_late_fee",kind="db",le="2"} 1' in text
+
+def test_disabled():
+    create_app({'METRICS_ENABLED': False})
+    database.get_book_by_id(BOOK_ID)
+    assert registry.durations == {}
+    assert not instrumentation.ENABLED
@@ -0,0 +1,144 @@
+import pytest
+import tempfile
+import os
+import time
+import datetime
+import database
+from app import create_app
+from services.billing_service import (
+    RateLimiter, run_nightly_billing, start_billing_run, calculate_all_late_fees
+)
+from services.idempotency import configure_idempotency_store
+from services.library_service import pay_all_late_fees
+from services.resilient_gateway import configure_payment_gateway
+from tests.fake_gateway import FakePaymentGateway
+
+PATRONS = [f"{100000 + i}" for i in range(6)]
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    """Set up a temp SQLite DB where six patrons owe late fees and one does not."""
+    db_fd, db_path = tempfile.mkstemp()
+    original_database = database.DATABASE
+    database.DATABASE = db_path
+    database.init_database()
+    configure_idempotency_store()
+
+    now = datetime.datetime.now()
+    for i, patron_id in enumerate(PATRONS + ["200000"]):
+        isbn = f"{1000000000000 + i}"
+        database.insert_book(f"Book {i}", "Author", isbn, 2, 2)
+        book_id = database.get_book_by_isbn(isbn)['id']
+        days_overdue = i + 1 if patron_id != "200000" else -3
+        due = now - datetime.timedelta(days=days_overdue, hours=1)
+        database.insert_borrow_record(patron_id, book_id, due - datetime.timedelta(days=14), due)
+
+    yield
+
+    # Cleanup
+    configure_idempotency_store()
+    configure_payment_gateway()
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+def test_charges_every_patron_once():
+    gateway = FakePaymentGateway()
+    expected = calculate_all_late_fees()['patron_totals']
+    summary = run_nightly_billing(concurrency=4, rate_limit=0, payment_gateway=gateway)
+
+    assert summary['success'] is True
+    assert (summary['patrons'], summary['charged'], summary['failed']) == (6, 6, 0)
+    assert {p['patron_id']: p['amount'] for p in gateway.payments} == expected
+    assert summary['total_charged'] == round(sum(expected.values()), 2)
+    assert database.get_billing_run(summary['run_id'])['status'] == 'completed'
+
+def test_total_charged_is_what_the_gateway_charged():
+    gateway = FakePaymentGateway()
+    # Fees keep growing between starting the run and charging the patrons
+    run_id, _ = start_billing_run(datetime.datetime.now() - datetime.timedelta(days=3))
+    due = sum(p['amount_due'] for p in database.get_billing_run_patrons(run_id))
+    summary = run_nightly_billing(rate_limit=0, resume_run_id=run_id, payment_gateway=gateway)
+
+    charged = round(sum(p['amount'] for p in gateway.payments), 2)
+    assert charged > due
+    assert summary['total_charged'] == charged
+
+def test_charges_run_concurrently():
+    gateway = FakePaymentGateway(latency=0.1)
+    started = time.perf_counter()
+    run_nightly_billing(concurrency=6, rate_limit=0, payment_gateway=gateway)
+    assert time.perf_counter() - started < 0.4
+    assert len(gateway.payments) == 6
+
+def test_rate_limiter_spaces_acquisitions():
+    clock = [0.0]
+    sleeps = []
+    limiter = RateLimiter(rate=5, clock=lambda: clock[0], sleep=sleeps.append)
+    for _ in range(4):
+        limiter.acquire()
+    assert sleeps == pytest.approx([0.2, 0.4, 0.6])
+
+def test_rate_limit_is_applied():
+    gateway = FakePaymentGateway()
+    started = time.perf_counter()
+    run_nightly_billing(concurrency=6, rate_limit=20, payment_gateway=gateway)
+    # First charge is free, the other five wait 1/20s each
+    assert time.perf_counter() - started >= 0.24
+
+def test_resume_retries_failed_patrons_only():
+    failing = FakePaymentGateway(error=ConnectionError("down"), fail_first=2)
+    summary = run_nightly_billing(concurrency=1, rate_limit=0, payment_gateway=failing)
+    assert summary['failed'] == 2
+    assert database.get_billing_run(summary['run_id'])['status'] == 'completed_with_failures'
+
+    gateway = FakePaymentGateway()
+    resumed = run_nightly_billing(concurrency=2, rate_limit=0, resume_run_id=summary['run_id'],
+                                  payment_gateway=gateway)
+    assert (resumed['charged'], resumed['failed']) == (6, 0)
+    assert sorted(p['patron_id'] for p in gateway.payments) == PATRONS[:2]
+
+def test_resume_does_not_recharge_unrecorded_charge():
+    """A charge made just before a crash, but not checkpointed, is replayed, not repeated."""
+    gateway = FakePaymentGateway()
+    run_id, error = start_billing_run()
+    pay_all_late_fees(PATRONS[0], gateway, idempotency_key=f"{run_id}:{PATRONS[0]}:0")
+
+    summary = run_nightly_billing(rate_limit=0, resume_run_id=run_id, payment_gateway=gateway)
+    assert summary['charged'] == 6
+    assert [p['patron_id'] for p in gateway.payments].count(PATRONS[0]) == 1
+
+def test_patrons_who_paid_meanwhile_are_skipped():
+    gateway = FakePaymentGateway()
+    run_id, error = start_billing_run()
+    pay_all_late_fees(PATRONS[0], gateway)
+    database.update_borrow_record_return_date(PATRONS[0], database.get_book_by_isbn("1000000000000")['id'],
+                                              datetime.datetime.now())
+    summary = run_nightly_billing(rate_limit=0, resume_run_id=run_id, payment_gateway=gateway)
+    assert (summary['charged'], summary['skipped']) == (5, 1)
+
+def test_second_run_charges_only_new_fees():
+    gateway = FakePaymentGateway()
+    run_nightly_billing(rate_limit=0, payment_gateway=gateway)
+
+    summary = run_nightly_billing(rate_limit=0, payment_gateway=gateway)
+    assert (summary['patrons'], summary['total_charged']) == (0, 0.0)
+    assert len(gateway.payments) == 6
+
+    # Two days later only the fees accrued since are due: 1 day ($0.50) -> 3 days ($1.50)
+    later = calculate_all_late_fees(datetime.datetime.now() + datetime.timedelta(days=2))
+    assert later['patron_totals'][PATRONS[0]] == 1.0
+    assert [loan['amount_due'] for loan in later['loans'] if loan['patron_id'] == PATRONS[0]] == [1.0]
+
+def test_unknown_run():
+    summary = run_nightly_billing(resume_run_id="billing_missing")
+    assert summary == {'success': False, 'run_id': "billing_missing", 'message': "Billing run not found."}
+
+def test_cli_command():
+    app = create_app()
+    configure_payment_gateway(FakePaymentGateway())
+    result = app.test_cli_runner().invoke(args=['bill-late-fees', '--rate-limit', '0'])
+    assert result.exit_code == 0
+    assert "Started billing run" in result.output
+    assert "charged 6 patron(s)" in result.output
@@ -0,0 +1,100 @@
+import pytest
+import tempfile
+import os
+import datetime
+import database
+from app import create_app
+from services.library_service import list_overdue_loans, calculate_late_fee_for_book
+
+NOW = datetime.datetime.now()
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    """Set up a temp SQLite DB with overdue, current and returned loans."""
+    db_fd, db_path = tempfile.mkstemp()
+    global BOOK_A, BOOK_B
+    original_database = database.DATABASE
+    database.DATABASE = db_path
+    database.init_database()
+
+    database.insert_book("Book A", "Author A", "1000000000001", 3, 3)
+    database.insert_book("Book B", "Author B", "1000000000002", 3, 3)
+    BOOK_A = database.get_book_by_isbn("1000000000001")['id']
+    BOOK_B = database.get_book_by_isbn("1000000000002")['id']
+
+    def loan(patron_id, book_id, days_overdue):
+        due = NOW - datetime.timedelta(days=days_overdue, hours=1)
+        database.insert_borrow_record(patron_id, book_id, due - datetime.timedelta(days=14), due)
+
+    loan("111111", BOOK_A, 12)
+    loan("111111", BOOK_B, -3)   # Not due yet
+    loan("222222", BOOK_A, 0)    # Overdue by an hour
+    loan("333333", BOOK_B, 30)
+    loan("444444", BOOK_A, 20)
+    database.update_borrow_record_return_date("444444", BOOK_A, NOW)  # Returned late
+
+    yield
+
+    # Cleanup
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+def summary(loans):
+    return [(loan['patron_id'], loan['book_id'], loan['days_overdue']) for loan in loans]
+
+def test_library_wide_most_overdue_first():
+    loans = database.get_overdue_loans(NOW)
+    assert summary(loans) == [("333333", BOOK_B, 30), ("111111", BOOK_A, 12), ("222222", BOOK_A, 0)]
+    assert loans[0]['title'] == "Book B"
+    assert loans[0]['due_date'] == (NOW - datetime.timedelta(days=30, hours=1)).replace(microsecond=0)
+
+def test_per_patron_and_per_book():
+    assert summary(database.get_overdue_loans(NOW, patron_id="111111")) == [("111111", BOOK_A, 12)]
+    assert summary(database.get_overdue_loans(NOW, book_id=BOOK_A)) == [("111111", BOOK_A, 12),
+                                                                       ("222222", BOOK_A, 0)]
+    assert database.get_overdue_loans(NOW, patron_id="444444") == []
+
+def test_days_overdue_matches_late_fee_calculation():
+    for loan in database.get_overdue_loans():
+        assert calculate_late_fee_for_book(loan['patron_id'], loan['book_id'])['days_overdue'] == loan['days_overdue']
+
+def test_is_overdue_computed_in_sql():
+    borrowed = database.get_patron_borrowed_books("111111")
+    assert [(book['book_id'], book['is_overdue']) for book in borrowed] == [(BOOK_A, True), (BOOK_B, False)]
+    history = database.get_patron_borrow_history("444444")
+    assert history[0]['is_overdue'] is True
+
+def test_overdue_queries_use_indexes():
+    plans = {r['query']: r for r in database.audit_query_plans() if r['query'].startswith('iter_overdue_loans')}
+    assert len(plans) == 3
+    assert not any(r['scans'] for r in plans.values())
+    assert any('idx_borrow_records_overdue' in detail for detail in plans['iter_overdue_loans']['plan'])
+
+def test_fetches_in_chunks():
+    loans = database.iter_overdue_loans(NOW, fetch_size=1)
+    assert next(loans)['patron_id'] == "333333"
+    loans.close()
+    assert summary(database.iter_overdue_loans(NOW, fetch_size=2))[-1] == ("222222", BOOK_A, 0)
+
+def test_list_overdue_loans_validation():
+    assert list_overdue_loans(patron_id="12ab")[1] == "Invalid patron ID. Must be exactly 6 digits."
+    assert list_overdue_loans(patron_id="111111", book_id=BOOK_A)[1] == "Filter by patron ID or book ID, not both."
+
+def test_overdue_endpoint_streams_json():
+    client = create_app().test_client()
+
+    response = client.get('/api/overdue')
+    assert response.status_code == 200
+    assert response.is_streamed
+    data = response.get_json()
+    assert [loan['patron_id'] for loan in data] == ["333333", "111111", "222222"]
+    assert data[0]['days_overdue'] == 30
+    datetime.datetime.fromisoformat(data[0]['due_date'])
+
+    assert [loan['book_id'] for loan in client.get(f'/api/overdue?book_id={BOOK_A}').get_json()] == [BOOK_A, BOOK_A]
+    assert client.get('/api/overdue?patron_id=111111').get_json()[0]['title'] == "Book A"
+    assert client.get('/api/overdue?patron_id=999999').get_json() == []
+    assert client.get('/api/overdue?patron_id=12').status_code == 400
+    assert client.get('/api/overdue?book_id=x').status_code == 400
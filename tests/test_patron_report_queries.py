@@ -0,0 +1,79 @@
+import pytest
+import tempfile
+import os
+import datetime
+import database
+from services.library_service import (
+    get_patron_status_report,
+    borrow_book_by_patron,
+    return_book_by_patron,
+    calculate_late_fee_for_book
+)
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    """Set up a temp SQLite DB with overdue, current and returned loans."""
+    db_fd, db_path = tempfile.mkstemp()
+    global Book_IDS
+    original_database = database.DATABASE
+    database.DATABASE = db_path
+    database.init_database()
+
+    for i in range(4):
+        database.insert_book(f"Book {i}", f"Author {i}", f"{1111111111111 * (i + 1)}", 3, 3)
+    Book_IDS = [database.get_book_by_isbn(f"{1111111111111 * (i + 1)}")['id'] for i in range(4)]
+
+    now = datetime.datetime.now()
+    for days_overdue, book_id in [(3, Book_IDS[0]), (12, Book_IDS[1]), (40, Book_IDS[2])]:
+        due = now - datetime.timedelta(days=days_overdue)
+        database.insert_borrow_record("112233", book_id, due - datetime.timedelta(days=14), due)
+    # A second open loan of the same book: its fee comes from the earliest loan
+    database.insert_borrow_record("112233", Book_IDS[0], now, now + datetime.timedelta(days=14))
+    borrow_book_by_patron("112233", Book_IDS[3])
+    borrow_book_by_patron("445566", Book_IDS[3])
+    return_book_by_patron("445566", Book_IDS[3])
+
+    yield
+
+    # Cleanup
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+def reference_report(patron_id):
+    """The report as built by the original per-book implementation."""
+    borrowed_books = database.get_patron_borrowed_books(patron_id)
+    borrowed = []
+    total = 0.0
+    for book in borrowed_books:
+        late_fee = calculate_late_fee_for_book(patron_id, book['book_id']).get('fee_amount', 0.0)
+        total += late_fee
+        borrowed.append({
+            'book_id': book['book_id'],
+            'title': book['title'],
+            'author': book['author'],
+            'borrow_date': book['borrow_date'].strftime("%Y-%m-%d"),
+            'due_date': book['due_date'].strftime("%Y-%m-%d"),
+            'is_overdue': book['is_overdue'],
+            'late_fee': late_fee
+        })
+    return {
+        'patron_id': patron_id,
+        'borrowed_books': borrowed,
+        'total_late_fees': total,
+        'books_borrowed_count': len(borrowed_books),
+        'borrowing_history': database.get_patron_borrow_history(patron_id)
+    }
+
+@pytest.mark.parametrize("patron_id", ["112233", "445566", "000000", "12ab"])
+def test_report_matches_per_book_implementation(patron_id):
+    """The set-based report is identical to the original per-book one."""
+    assert get_patron_status_report(patron_id) == reference_report(patron_id)
+
+def test_report_uses_two_queries(mocker):
+    """The report opens one connection for open loans and one for history."""
+    spy = mocker.spy(database, 'get_db_connection')
+    report = get_patron_status_report("112233")
+    assert report['total_late_fees'] == 1.5 + 8.5 + 15.0 + 1.5
+    assert spy.call_count == 2
@@ -0,0 +1,147 @@
+import pytest
+import tempfile
+import os
+import datetime
+import database
+from app import create_app
+from services.library_service import (
+    pay_all_late_fees, pay_late_fees, get_payment_breakdown, refund_late_fee_payment, calculate_late_fee_for_book
+)
+from services.resilient_gateway import configure_payment_gateway
+from tests.fake_gateway import FakePaymentGateway
+
+PATRON = "123456"
+OVERDUE_DAYS = [10, 3, 30, -2]
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    """Set up a temp SQLite DB with three overdue loans and one loan not yet due."""
+    db_fd, db_path = tempfile.mkstemp()
+    global BOOK_IDS
+    original_database = database.DATABASE
+    database.DATABASE = db_path
+    database.init_database()
+
+    now = datetime.datetime.now()
+    BOOK_IDS = []
+    for i, days in enumerate(OVERDUE_DAYS):
+        isbn = f"{1000000000000 + i}"
+        database.insert_book(f"Book {i}", "Author", isbn, 1, 1)
+        book_id = database.get_book_by_isbn(isbn)['id']
+        due = now - datetime.timedelta(days=days, hours=1)
+        database.insert_borrow_record(PATRON, book_id, due - datetime.timedelta(days=14), due)
+        BOOK_IDS.append(book_id)
+
+    yield
+
+    # Cleanup
+    configure_payment_gateway()
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+def test_single_charge_for_all_fees():
+    gateway = FakePaymentGateway()
+    success, msg, txn_id = pay_all_late_fees(PATRON, gateway)
+    assert success is True
+    assert "payment successful" in msg.lower()
+    assert len(gateway.payments) == 1
+    assert gateway.payments[0]['amount'] == 6.5 + 1.5 + 15.0
+    assert gateway.payments[0]['description'] == "Late fees for 3 book(s): 'Book 2', 'Book 0', 'Book 1'"
+
+def test_split_matches_per_book_fees():
+    success, msg, txn_id = pay_all_late_fees(PATRON, FakePaymentGateway())
+    breakdown = get_payment_breakdown(txn_id)
+    assert [item['book_id'] for item in breakdown] == BOOK_IDS[:3]
+    for item in breakdown:
+        assert item['amount'] == calculate_late_fee_for_book(PATRON, item['book_id'])['fee_amount']
+        assert item['refunded_amount'] == 0
+
+def test_refund_single_book():
+    gateway = FakePaymentGateway()
+    success, msg, txn_id = pay_all_late_fees(PATRON, gateway)
+
+    success, msg = refund_late_fee_payment(txn_id, 6.5, gateway, book_id=BOOK_IDS[0])
+    assert success is True
+    assert gateway.refunds == [{'transaction_id': txn_id, 'amount': 6.5}]
+    assert get_payment_breakdown(txn_id)[0]['refunded_amount'] == 6.5
+
+    # The book's share is used up; other books are untouched
+    success, msg = refund_late_fee_payment(txn_id, 1.0, gateway, book_id=BOOK_IDS[0])
+    assert success is False
+    assert "exceeds the unrefunded late fee" in msg
+    assert refund_late_fee_payment(txn_id, 1.5, gateway, book_id=BOOK_IDS[1])[0] is True
+
+def test_refund_more_than_book_share_rejected():
+    gateway = FakePaymentGateway()
+    success, msg, txn_id = pay_all_late_fees(PATRON, gateway)
+    success, msg = refund_late_fee_payment(txn_id, 2.0, gateway, book_id=BOOK_IDS[1])
+    assert success is False
+    assert gateway.refunds == []
+
+def test_refund_book_not_in_payment():
+    gateway = FakePaymentGateway()
+    success, msg, txn_id = pay_all_late_fees(PATRON, gateway)
+    success, msg = refund_late_fee_payment(txn_id, 1.0, gateway, book_id=BOOK_IDS[3])
+    assert success is False
+    assert msg == "This book was not paid for in that transaction."
+
+def test_failed_refund_releases_share():
+    success, msg, txn_id = pay_all_late_fees(PATRON, FakePaymentGateway())
+    success, msg = refund_late_fee_payment(txn_id, 6.5, FakePaymentGateway(error=ConnectionError("down")),
+                                           book_id=BOOK_IDS[0])
+    assert success is False
+    assert get_payment_breakdown(txn_id)[0]['refunded_amount'] == 0
+    assert refund_late_fee_payment(txn_id, 6.5, FakePaymentGateway(), book_id=BOOK_IDS[0])[0] is True
+
+def test_declined_payment_records_nothing():
+    gateway = FakePaymentGateway(decline="Card declined")
+    success, msg, txn_id = pay_all_late_fees(PATRON, gateway)
+    assert success is False
+    assert msg == "Payment failed: Card declined"
+    assert txn_id is None
+
+def test_no_fees_or_invalid_patron():
+    gateway = FakePaymentGateway()
+    assert pay_all_late_fees("654321", gateway) == (False, "No late fees to pay.", None)
+    assert pay_all_late_fees("12ab", gateway) == (False, "Invalid patron ID. Must be exactly 6 digits.", None)
+    assert gateway.payments == []
+
+def test_repeat_call_charges_nothing():
+    gateway = FakePaymentGateway()
+    assert pay_all_late_fees(PATRON, gateway)[0] is True
+    assert pay_all_late_fees(PATRON, gateway) == (False, "No late fees to pay.", None)
+    assert len(gateway.payments) == 1
+
+def test_paid_book_left_out():
+    gateway = FakePaymentGateway()
+    assert pay_late_fees(PATRON, BOOK_IDS[0], gateway)[0] is True
+    assert pay_late_fees(PATRON, BOOK_IDS[0], gateway) == (False, "No late fees to pay for this book.", None)
+
+    success, msg, txn_id = pay_all_late_fees(PATRON, gateway)
+    assert success is True
+    assert gateway.payments[-1]['amount'] == 1.5 + 15.0
+    assert [item['book_id'] for item in get_payment_breakdown(txn_id)] == BOOK_IDS[1:3]
+
+def test_refunded_fee_is_due_again():
+    gateway = FakePaymentGateway()
+    success, msg, txn_id = pay_all_late_fees(PATRON, gateway)
+    assert refund_late_fee_payment(txn_id, 6.5, gateway, book_id=BOOK_IDS[0])[0] is True
+
+    assert pay_all_late_fees(PATRON, gateway)[0] is True
+    assert gateway.payments[-1]['amount'] == 6.5
+
+def test_pay_all_route():
+    app = create_app()
+    app.config['TESTING'] = True
+    configure_payment_gateway(FakePaymentGateway())
+    client = app.test_client()
+
+    response = client.post('/api/payments/late_fees/all', json={'patron_id': PATRON})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['total'] == 23.0
+    assert [item['book_id'] for item in data['books']] == BOOK_IDS[:3]
+
+    assert client.post('/api/payments/late_fees/all', json={'patron_id': '654321'}).status_code == 400
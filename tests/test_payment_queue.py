@@ -0,0 +1,153 @@
+import pytest
+import tempfile
+import os
+import time
+import datetime
+import database
+from app import create_app
+from services.payment_queue import (
+    configure_payment_queue, enqueue_late_fee_payment, get_payment_job_status, resume_payment_jobs
+)
+from tests.fake_gateway import FakeAsyncPaymentGateway
+
+PATRON = "123456"
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    """Set up a temp SQLite DB with overdue loans for one patron."""
+    db_fd, db_path = tempfile.mkstemp()
+    global BOOK_IDS
+    original_database = database.DATABASE
+    database.DATABASE = db_path
+    database.init_database()
+
+    now = datetime.datetime.now()
+    BOOK_IDS = []
+    for i in range(5):
+        isbn = f"{1000000000000 + i}"
+        database.insert_book(f"Book {i}", "Author", isbn, 1, 1)
+        book_id = database.get_book_by_isbn(isbn)['id']
+        due = now - datetime.timedelta(days=10)
+        database.insert_borrow_record(PATRON, book_id, due - datetime.timedelta(days=14), due)
+        BOOK_IDS.append(book_id)
+
+    yield
+
+    # Cleanup
+    configure_payment_queue()
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+def wait_for_job(job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = get_payment_job_status(job_id)
+        if job['status'] in ('completed', 'failed'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+def test_enqueue_returns_pending_handle_immediately():
+    configure_payment_queue(FakeAsyncPaymentGateway(latency=0.5))
+    started = time.perf_counter()
+    success, msg, job_id = enqueue_late_fee_payment(PATRON, BOOK_IDS[0])
+    assert time.perf_counter() - started < 0.25
+    assert success is True
+    assert job_id.startswith("job_")
+    job = get_payment_job_status(job_id)
+    assert job['status'] in ('pending', 'processing')
+    assert job['amount'] == 6.5
+    assert job['description'] == "Late fees for 'Book 0'"
+
+def test_completed_job_records_transaction():
+    gateway = FakeAsyncPaymentGateway()
+    configure_payment_queue(gateway)
+    success, msg, job_id = enqueue_late_fee_payment(PATRON, BOOK_IDS[0])
+    job = wait_for_job(job_id)
+    assert job['status'] == 'completed'
+    assert job['transaction_id'].startswith(f"txn_{PATRON}_")
+    assert "payment successful" in job['message'].lower()
+    assert gateway.payments == [{'patron_id': PATRON, 'amount': 6.5, 'description': "Late fees for 'Book 0'"}]
+
+def test_paid_job_is_not_charged_again():
+    gateway = FakeAsyncPaymentGateway()
+    configure_payment_queue(gateway)
+    wait_for_job(enqueue_late_fee_payment(PATRON, BOOK_IDS[0])[2])
+    assert enqueue_late_fee_payment(PATRON, BOOK_IDS[0]) == (False, "No late fees to pay for this book.", None)
+    assert len(gateway.payments) == 1
+
+def test_declined_job_is_failed():
+    configure_payment_queue(FakeAsyncPaymentGateway(decline="Card declined"))
+    success, msg, job_id = enqueue_late_fee_payment(PATRON, BOOK_IDS[0])
+    job = wait_for_job(job_id)
+    assert job['status'] == 'failed'
+    assert job['message'] == "Payment failed: Card declined"
+    assert job['transaction_id'] is None
+
+def test_gateway_exception_is_failed():
+    configure_payment_queue(FakeAsyncPaymentGateway(error=ConnectionError("timeout")))
+    success, msg, job_id = enqueue_late_fee_payment(PATRON, BOOK_IDS[0])
+    job = wait_for_job(job_id)
+    assert job['status'] == 'failed'
+    assert job['message'] == "Payment processing error: timeout"
+
+def test_validation_errors_are_not_queued():
+    gateway = FakeAsyncPaymentGateway()
+    configure_payment_queue(gateway)
+    assert enqueue_late_fee_payment("12ab", BOOK_IDS[0]) == (
+        False, "Invalid patron ID. Must be exactly 6 digits.", None)
+    success, msg, job_id = enqueue_late_fee_payment("654321", BOOK_IDS[0])
+    assert success is False and job_id is None
+    assert gateway.payments == []
+
+def test_concurrency_is_bounded():
+    gateway = FakeAsyncPaymentGateway(latency=0.1)
+    configure_payment_queue(gateway, max_concurrency=2)
+    job_ids = [enqueue_late_fee_payment(PATRON, book_id)[2] for book_id in BOOK_IDS]
+    for job_id in job_ids:
+        assert wait_for_job(job_id)['status'] == 'completed'
+    assert gateway.max_in_flight == 2
+
+def test_unfinished_jobs_resume_on_start():
+    now = datetime.datetime.now()
+    database.insert_payment_job("job_pending", PATRON, BOOK_IDS[0], 6.5, "Late fees for 'Book 0'", now)
+    database.insert_payment_job("job_processing", PATRON, BOOK_IDS[1], 6.5, "Late fees for 'Book 1'", now)
+    database.update_payment_job("job_processing", "processing")
+    gateway = FakeAsyncPaymentGateway()
+    queue = configure_payment_queue(gateway)
+
+    assert resume_payment_jobs() is True
+    # Submitting a resumed job again does not charge it twice
+    queue.submit("job_pending", PATRON, 6.5, "Late fees for 'Book 0'").result(timeout=5)
+
+    assert wait_for_job("job_pending")['status'] == 'completed'
+    interrupted = get_payment_job_status("job_processing")
+    assert interrupted['status'] == 'failed'
+    assert interrupted['message'].startswith("Payment interrupted")
+    assert len(gateway.payments) == 1
+    assert resume_payment_jobs() is False
+
+def test_unknown_job_is_none():
+    assert get_payment_job_status("job_missing") is None
+
+def test_payment_routes():
+    app = create_app()
+    app.config['TESTING'] = True
+    configure_payment_queue(FakeAsyncPaymentGateway())
+    client = app.test_client()
+
+    response = client.post('/api/payments/late_fees', json={'patron_id': PATRON, 'book_id': BOOK_IDS[1]})
+    assert response.status_code == 202
+    data = response.get_json()
+    assert data['status'] == 'pending'
+    assert data['status_url'] == f"/api/payments/{data['job_id']}"
+
+    wait_for_job(data['job_id'])
+    status = client.get(data['status_url']).get_json()
+    assert status['status'] == 'completed'
+
+    assert client.post('/api/payments/late_fees', json={'patron_id': PATRON, 'book_id': 'x'}).status_code == 400
+    assert client.post('/api/payments/late_fees', json={'patron_id': 'bad', 'book_id': 1}).status_code == 400
+    assert client.get('/api/payments/job_missing').status_code == 404
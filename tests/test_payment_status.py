@@ -0,0 +1,107 @@
+import pytest
+import tempfile
+import os
+import time
+import database
+from app import create_app
+from services.payment_status import PaymentStatusCache, configure_payment_status_cache
+from services.resilient_gateway import configure_payment_gateway
+from tests.fake_gateway import FakePaymentGateway
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+class StatusGateway(FakePaymentGateway):
+    """Fake gateway reporting a configurable status per transaction."""
+    def __init__(self, statuses, **kwargs):
+        super().__init__(**kwargs)
+        self.statuses = statuses
+        self.lookups = []
+    def _status(self, transaction_id):
+        self.lookups.append(transaction_id)
+        self._maybe_raise()
+        return {'transaction_id': transaction_id, 'status': self.statuses.get(transaction_id, 'not_found')}
+
+def test_completed_is_cached_forever():
+    clock = FakeClock()
+    gateway = StatusGateway({'txn_1': 'completed'})
+    cache = PaymentStatusCache(ttl=30, clock=clock)
+    assert cache.verify('txn_1', gateway)['status'] == 'completed'
+    clock.now += 10 ** 6
+    assert cache.verify('txn_1', gateway)['status'] == 'completed'
+    assert gateway.lookups == ['txn_1']
+
+def test_pending_expires_after_ttl():
+    clock = FakeClock()
+    gateway = StatusGateway({'txn_1': 'pending'})
+    cache = PaymentStatusCache(ttl=30, clock=clock)
+    cache.verify('txn_1', gateway)
+    clock.now += 29
+    cache.verify('txn_1', gateway)
+    assert gateway.lookups == ['txn_1']
+
+    gateway.statuses['txn_1'] = 'completed'
+    clock.now += 1
+    assert cache.verify('txn_1', gateway)['status'] == 'completed'
+    assert gateway.lookups == ['txn_1', 'txn_1']
+
+def test_errors_are_not_cached():
+    gateway = StatusGateway({'txn_1': 'completed'}, error=ConnectionError("down"), fail_first=1)
+    cache = PaymentStatusCache()
+    result = cache.verify('txn_1', gateway)
+    assert result == {'transaction_id': 'txn_1', 'status': 'error', 'message': "Status check error: down"}
+    assert cache.verify('txn_1', gateway)['status'] == 'completed'
+
+def test_bulk_verify_is_concurrent_and_bounded():
+    statuses = {f'txn_{i}': 'completed' for i in range(8)}
+    gateway = StatusGateway(statuses, latency=0.1)
+    cache = PaymentStatusCache(max_workers=4)
+    started = time.perf_counter()
+    results = cache.verify_many(list(statuses) + ['txn_0'], gateway)
+    elapsed = time.perf_counter() - started
+    assert set(results) == set(statuses)
+    assert all(result['status'] == 'completed' for result in results.values())
+    # 8 lookups on 4 threads: two rounds, not eight
+    assert 0.15 < elapsed < 0.6
+    assert sorted(gateway.lookups) == sorted(statuses)
+
+def test_bulk_verify_uses_cache():
+    gateway = StatusGateway({'txn_1': 'completed', 'txn_2': 'completed'})
+    cache = PaymentStatusCache()
+    cache.verify('txn_1', gateway)
+    cache.verify_many(['txn_1', 'txn_2'], gateway)
+    assert gateway.lookups == ['txn_1', 'txn_2']
+
+@pytest.fixture
+def temp_database():
+    """Point DATABASE at a temp SQLite file so create_app() leaves library.db alone."""
+    db_fd, db_path = tempfile.mkstemp()
+    original_database = database.DATABASE
+    database.DATABASE = db_path
+
+    yield
+
+    # Cleanup
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+def test_status_routes(temp_database):
+    app = create_app()
+    app.config['TESTING'] = True
+    configure_payment_gateway(StatusGateway({'txn_1': 'completed'}))
+    configure_payment_status_cache()
+    client = app.test_client()
+    try:
+        assert client.get('/api/payments/transactions/txn_1/status').get_json()['status'] == 'completed'
+        data = client.post('/api/payments/transactions/status', json={'transaction_ids': ['txn_1', 'txn_9']}).get_json()
+        assert data['txn_1']['status'] == 'completed'
+        assert data['txn_9']['status'] == 'not_found'
+        assert client.post('/api/payments/transactions/status', json={'transaction_ids': 'txn_1'}).status_code == 400
+    finally:
+        configure_payment_gateway()
+        configure_payment_status_cache()
@@ -0,0 +1,93 @@
+import pytest
+import tempfile
+import os
+import cProfile
+import pstats
+import database
+from app import create_app
+from profiling import ProfileStore, SlowRequestProfiler, configure_profiler
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    """Set up a temp SQLite DB; profiling is switched off again afterwards."""
+    db_fd, db_path = tempfile.mkstemp()
+    original_database = database.DATABASE
+    database.DATABASE = db_path
+    database.init_database()
+
+    yield
+
+    # Cleanup
+    configure_profiler()
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+def profiled_client(tmp_path, **settings):
+    config = {'PROFILE_SLOW_REQUESTS': True, 'PROFILE_THRESHOLD_MS': 0, 'PROFILE_DIR': str(tmp_path)}
+    config.update(settings)
+    return create_app(config).test_client()
+
+def busy_profile():
+    profile = cProfile.Profile()
+    profile.enable()
+    sum(range(1000))
+    profile.disable()
+    return profile
+
+def test_ring_buffer_keeps_newest(tmp_path):
+    store = ProfileStore(str(tmp_path), max_profiles=3)
+    ids = [store.save(busy_profile(), {'path': f'/request/{i}'}) for i in range(5)]
+
+    assert [info['id'] for info in store.list()] == ids[:1:-1]
+    assert len(os.listdir(tmp_path)) == 6
+    assert store.get(ids[0]) is None
+    assert 'function calls' in store.summary(ids[-1])
+
+def test_only_slow_requests_are_kept(tmp_path):
+    profiler = SlowRequestProfiler(ProfileStore(str(tmp_path)), threshold_ms=100)
+    assert profiler.finish(profiler.start(), 99.0, {'path': '/fast'}) is None
+    profile_id = profiler.finish(profiler.start(), 150.0, {'path': '/slow'})
+    assert profiler.store.get(profile_id)['duration_ms'] == 150.0
+
+def test_sampling(tmp_path):
+    profiler = SlowRequestProfiler(ProfileStore(str(tmp_path)), sample_rate=0.25, rng=lambda: 0.5)
+    assert profiler.start() is None
+
+def test_slow_request_is_profiled(tmp_path):
+    client = profiled_client(tmp_path)
+
+    response = client.get('/catalog')
+    profile_id = response.headers['X-Profile-Id']
+
+    listing = client.get('/admin/profiles').get_json()
+    info = next(p for p in listing['profiles'] if p['id'] == profile_id)
+    assert info['path'] == '/catalog'
+    assert info['endpoint'] == 'catalog.catalog'
+    assert info['status'] == 200
+
+    report = client.get(f'/admin/profiles/{profile_id}?sort=tottime&limit=5')
+    assert report.mimetype == 'text/plain'
+    assert 'function calls' in report.get_data(as_text=True)
+
+    raw = client.get(f'/admin/profiles/{profile_id}?format=raw')
+    path = tmp_path / 'download.prof'
+    path.write_bytes(raw.get_data())
+    assert pstats.Stats(str(path)).total_calls > 0
+
+def test_fast_requests_are_not_kept(tmp_path):
+    client = profiled_client(tmp_path, PROFILE_THRESHOLD_MS=60000)
+    assert 'X-Profile-Id' not in client.get('/catalog').headers
+    assert client.get('/admin/profiles').get_json()['count'] == 0
+
+def test_unknown_profile(tmp_path):
+    client = profiled_client(tmp_path)
+    assert client.get('/admin/profiles/123-abcdef12').status_code == 404
+    assert client.get('/admin/profiles/..%2Fapp').status_code == 404
+    assert client.get('/admin/profiles/123-abcdef12?sort=name').status_code == 400
+
+def test_disabled_by_default():
+    client = create_app().test_client()
+    assert 'X-Profile-Id' not in client.get('/catalog').headers
+    assert client.get('/admin/profiles').status_code == 404
@@ -0,0 +1,53 @@
+import pytest
+import tempfile
+import os
+import database
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    """Set up a temp SQLite DB for index and query plan tests."""
+    db_fd, db_path = tempfile.mkstemp()
+    original_database = database.DATABASE
+    database.DATABASE = db_path
+    database.init_database()
+
+    yield
+
+    # Cleanup
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+def test_borrow_record_indexes_created():
+    """init_database creates the borrow_records secondary indexes."""
+    conn = database.get_db_connection()
+    names = {row['name'] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'borrow_records'"
+    )}
+    conn.close()
+    assert {'idx_borrow_records_patron_open', 'idx_borrow_records_patron_history',
+            'idx_borrow_records_book_open'} <= names
+
+def test_init_database_is_repeatable():
+    """Running the migration twice is harmless."""
+    database.init_database()
+    database.init_database()
+
+def test_audit_finds_no_scans():
+    """Every audited hot-path query is served by an index."""
+    results = database.audit_query_plans()
+    assert {r['query'] for r in results} == set(database.AUDITED_QUERIES)
+    assert [r['query'] for r in results if r['scans']] == []
+
+def test_audit_flags_scan_without_index():
+    """Dropping the patron indexes makes the audit flag the patron queries."""
+    conn = database.get_db_connection()
+    conn.execute('DROP INDEX idx_borrow_records_patron_open')
+    conn.execute('DROP INDEX idx_borrow_records_patron_history')
+    conn.commit()
+    conn.close()
+
+    flagged = {r['query'] for r in database.audit_query_plans() if r['scans']}
+    assert 'get_patron_borrow_history' in flagged
+    assert 'get_patron_borrow_count' in flagged
@@ -0,0 +1,167 @@
+import pytest
+import tempfile
+import os
+import asyncio
+import random
+import time
+import database
+from services.library_service import pay_late_fees
+from services.resilient_gateway import (
+    ResilientPaymentGateway, ResilientAsyncPaymentGateway, GatewayGuard, CircuitBreaker,
+    RetryBudget, CircuitOpenError, GatewayTimeoutError
+)
+from tests.fake_gateway import FakePaymentGateway, FakeAsyncPaymentGateway
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+def make_gateway(fake, clock=None, **settings):
+    breaker = CircuitBreaker(min_calls=4, window_size=4, reset_timeout=10.0, clock=clock or time.monotonic)
+    guard = GatewayGuard(breaker=breaker, backoff_base=0.0, rng=random.Random(1), **settings)
+    return ResilientPaymentGateway(fake, guard, sleep=lambda delay: None)
+
+def test_success_passes_through():
+    gateway = make_gateway(FakePaymentGateway())
+    success, txn_id, msg = gateway.process_payment("123456", 5.0, "Late fees")
+    assert success is True
+    assert gateway.metrics()['successes'] == 1
+    assert gateway.metrics()['circuit_state'] == 'closed'
+
+def test_declines_are_not_failures():
+    gateway = make_gateway(FakePaymentGateway(decline="Card declined"))
+    for _ in range(5):
+        assert gateway.process_payment("123456", 5.0)[0] is False
+    assert gateway.metrics()['failures'] == 0
+    assert gateway.metrics()['circuit_state'] == 'closed'
+
+def test_deadline():
+    gateway = make_gateway(FakePaymentGateway(latency=0.5), timeout=0.05)
+    started = time.perf_counter()
+    with pytest.raises(GatewayTimeoutError):
+        gateway.process_payment("123456", 5.0)
+    assert time.perf_counter() - started < 0.4
+    assert gateway.metrics()['timeouts'] == 1
+
+def test_payment_timeout_is_not_retried():
+    fake = FakePaymentGateway(latency=0.2)
+    gateway = make_gateway(fake, timeout=0.05)
+    with pytest.raises(GatewayTimeoutError):
+        gateway.process_payment("123456", 5.0)
+    assert gateway.metrics()['retries'] == 0
+
+def test_connection_errors_are_retried():
+    fake = FakePaymentGateway(error=ConnectionError("refused"), fail_first=2)
+    gateway = make_gateway(fake)
+    assert gateway.process_payment("123456", 5.0)[0] is True
+    assert fake.calls == 3
+    assert gateway.metrics()['retries'] == 2
+
+def test_retries_are_bounded():
+    fake = FakePaymentGateway(error=ConnectionError("refused"))
+    gateway = make_gateway(fake, max_retries=2)
+    with pytest.raises(ConnectionError):
+        gateway.process_payment("123456", 5.0)
+    assert fake.calls == 3
+
+def test_status_check_retries_timeouts():
+    fake = FakePaymentGateway(error=TimeoutError("slow"), fail_first=1)
+    gateway = make_gateway(fake)
+    assert gateway.verify_payment_status("txn_1")['status'] == 'completed'
+
+def test_retry_budget_limits_retries():
+    fake = FakePaymentGateway(error=ConnectionError("refused"))
+    budget = RetryBudget(ratio=0.0, max_tokens=1)
+    breaker = CircuitBreaker(min_calls=100)
+    gateway = ResilientPaymentGateway(fake, GatewayGuard(breaker=breaker, retry_budget=budget, backoff_base=0.0),
+                                      sleep=lambda delay: None)
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            gateway.process_payment("123456", 5.0)
+    assert gateway.metrics()['retries'] == 1
+
+def test_backoff_has_jitter():
+    guard = GatewayGuard(backoff_base=1.0, backoff_max=10.0, rng=random.Random(7))
+    delays = {guard.record_failure(ConnectionError(), 1, (ConnectionError,)) for _ in range(5)}
+    assert len(delays) == 5
+    assert all(0 <= delay <= 2.0 for delay in delays)
+
+def test_circuit_opens_and_fails_fast():
+    clock = FakeClock()
+    fake = FakePaymentGateway(error=RuntimeError("500"))
+    gateway = make_gateway(fake, clock=clock)
+    for _ in range(4):
+        with pytest.raises(RuntimeError):
+            gateway.process_payment("123456", 5.0)
+    assert gateway.metrics()['circuit_state'] == 'open'
+
+    with pytest.raises(CircuitOpenError):
+        gateway.process_payment("123456", 5.0)
+    assert fake.calls == 4
+    assert gateway.metrics()['rejected'] == 1
+
+def test_circuit_half_open_trial():
+    clock = FakeClock()
+    fake = FakePaymentGateway(error=RuntimeError("500"), fail_first=5)
+    gateway = make_gateway(fake, clock=clock)
+    for _ in range(4):
+        with pytest.raises(RuntimeError):
+            gateway.process_payment("123456", 5.0)
+
+    # Failed trial reopens the circuit
+    clock.now += 10
+    assert gateway.metrics()['circuit_state'] == 'half_open'
+    with pytest.raises(RuntimeError):
+        gateway.process_payment("123456", 5.0)
+    assert gateway.metrics()['circuit_state'] == 'open'
+
+    # Successful trial closes it
+    clock.now += 10
+    assert gateway.process_payment("123456", 5.0)[0] is True
+    assert gateway.metrics()['circuit_state'] == 'closed'
+    assert gateway.metrics()['circuit_opened'] == 2
+
+def test_pay_late_fees_reports_open_circuit(mocker):
+    mocker.patch('services.library_service.calculate_late_fee_for_book', return_value={'fee_amount': 5.5})
+    mocker.patch('services.library_service.get_book_by_id', return_value={'title': 'Book A'})
+    gateway = make_gateway(FakePaymentGateway(error=RuntimeError("500")))
+    for _ in range(4):
+        pay_late_fees("123456", 1, gateway)
+    success, msg, txn_id = pay_late_fees("123456", 1, gateway)
+    assert success is False
+    assert msg == "Payment processing error: Payment gateway temporarily unavailable (circuit open)."
+
+def test_async_gateway_deadline_and_retry():
+    guard = GatewayGuard(timeout=0.05, backoff_base=0.0)
+    slow = ResilientAsyncPaymentGateway(FakeAsyncPaymentGateway(latency=0.5), guard)
+    with pytest.raises(GatewayTimeoutError):
+        asyncio.run(slow.process_payment("123456", 5.0))
+
+    fake = FakeAsyncPaymentGateway(error=ConnectionError("refused"), fail_first=1)
+    flaky = ResilientAsyncPaymentGateway(fake, GatewayGuard(backoff_base=0.0))
+    assert asyncio.run(flaky.process_payment("123456", 5.0))[0] is True
+    assert fake.calls == 2
+
+@pytest.fixture
+def temp_database():
+    """Point DATABASE at a temp SQLite file so create_app() leaves library.db alone."""
+    db_fd, db_path = tempfile.mkstemp()
+    original_database = database.DATABASE
+    database.DATABASE = db_path
+
+    yield
+
+    # Cleanup
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+def test_metrics_route(temp_database):
+    from app import create_app
+    client = create_app().test_client()
+    data = client.get('/api/payments/gateway/metrics').get_json()
+    assert data['circuit_state'] == 'closed'
+    assert {'calls', 'failures', 'timeouts', 'retries', 'rejected', 'retry_budget'} <= set(data)
@@ -0,0 +1,102 @@
+import pytest
+import tempfile
+import os
+import database
+from app import create_app
+from cache import LRUCache
+from instrumentation import start_request, finish_request
+from services.library_service import search_books_in_catalog, add_book_to_catalog, borrow_book_by_patron
+from services.search_cache import configure_search_cache, get_search_cache_stats, estimate_results_size
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    """Set up a temp SQLite DB with three books by two authors, and an empty search cache."""
+    db_fd, db_path = tempfile.mkstemp()
+    global BOOK_ID
+    original_database = database.DATABASE
+    database.DATABASE = db_path
+    database.init_database()
+    database.insert_book("Animal Farm", "George Orwell", "1000000000001", 2, 2)
+    database.insert_book("1984", "George Orwell", "1000000000002", 1, 1)
+    database.insert_book("Emma", "Jane Austen", "1000000000003", 1, 1)
+    BOOK_ID = database.get_book_by_isbn("1000000000001")['id']
+    configure_search_cache()
+
+    yield
+
+    # Cleanup
+    configure_search_cache()
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+def test_repeat_searches_skip_the_database():
+    first = search_books_in_catalog("orwell", "author")
+
+    token = start_request()
+    repeat = search_books_in_catalog("  ORWELL ", "author")
+    stats = finish_request(token)
+
+    assert repeat == first
+    assert len(repeat) == 2
+    assert stats.totals('db')[0] == 0
+    assert get_search_cache_stats()['hits'] == 1
+    assert get_search_cache_stats()['hit_ratio'] == 0.5
+
+def test_search_type_is_part_of_the_key():
+    assert len(search_books_in_catalog("orwell", "author")) == 2
+    assert search_books_in_catalog("orwell", "title") == []
+    assert get_search_cache_stats()['size'] == 2
+
+def test_cached_results_are_copies():
+    search_books_in_catalog("orwell", "author")[0]['title'] = 'Changed'
+    assert search_books_in_catalog("orwell", "author")[0]['title'] != 'Changed'
+
+def test_new_book_invalidates():
+    assert len(search_books_in_catalog("austen", "author")) == 1
+    assert add_book_to_catalog("Persuasion", "Jane Austen", "1000000000004", 1)[0]
+
+    assert len(search_books_in_catalog("austen", "author")) == 2
+    assert get_search_cache_stats()['invalidations'] == 1
+
+def test_availability_change_invalidates():
+    assert search_books_in_catalog("animal", "title")[0]['available_copies'] == 2
+    assert borrow_book_by_patron("123456", BOOK_ID)[0]
+    assert search_books_in_catalog("animal", "title")[0]['available_copies'] == 1
+
+def test_memory_budget():
+    results = search_books_in_catalog("orwell", "author")
+    budget = estimate_results_size(results) + 100
+    configure_search_cache(max_bytes=budget)
+
+    search_books_in_catalog("orwell", "author")
+    search_books_in_catalog("emma", "title")
+    stats = get_search_cache_stats()
+    assert stats['size'] == 1
+    assert 0 < stats['bytes'] <= budget
+
+def test_lru_byte_budget_rejects_oversized_values():
+    cache = LRUCache(10, max_bytes=10, sizeof=len)
+    cache.put('a', 'x' * 6)
+    cache.put('b', 'x' * 11)
+    assert 'b' not in cache
+    cache.put('c', 'x' * 6)
+    assert 'a' not in cache
+    assert cache.stats()['bytes'] == 6
+
+def test_disabled():
+    configure_search_cache(0)
+    search_books_in_catalog("orwell", "author")
+    search_books_in_catalog("orwell", "author")
+    assert get_search_cache_stats()['size'] == 0
+
+def test_metrics_endpoint():
+    client = create_app().test_client()
+    client.get('/api/search?q=orwell&type=author')
+    search_books_in_catalog("orwell", "author")
+
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'library_cache_hits_total{cache="search"} 1' in text
+    assert 'library_cache_misses_total{cache="search"} 1' in text
+    assert 'library_cache_bytes{cache="search"}' in text
@@ -0,0 +1,79 @@
+import pytest
+import tempfile
+import os
+import random
+import database
+from services.library_service import add_book_to_catalog, search_books_in_catalog, _search_books_linear
+from services.search_index import build_search_index, get_search_index, disable_search_index
+
+WORDS = ["great", "gatsby", "kill", "mockingbird", "orwell", "farm", "Éclair", "the", "of", "a",
+         "night", "NIGHTS", "war", "peace", "garden", "river", "o'brien", "smith", "lee"]
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    """Set up a temp SQLite DB with a random catalog and the in-memory index enabled."""
+    db_fd, db_path = tempfile.mkstemp()
+    original_database = database.DATABASE
+    database.DATABASE = db_path
+    database.init_database()
+
+    rng = random.Random(327)
+    for i in range(200):
+        title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+        author = " ".join(rng.choice(WORDS).capitalize() for _ in range(2))
+        database.insert_book(title, author, f"{9780000000000 + i}", 1, 1)
+    build_search_index()
+
+    yield
+
+    # Cleanup
+    disable_search_index()
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+def test_index_parity_with_linear_scan():
+    """The in-memory index returns the same books, in the same order, as the catalog scan."""
+    rng = random.Random(7)
+    terms = ["a", "e", "th", "ar", "war", "night", "nights", "gatsby the", "ÉCLAIR", "é", "o'b", "zzz", " "]
+    for word in WORDS:
+        start = rng.randint(0, len(word) - 1)
+        terms.append(word[start:start + rng.randint(1, 5)])
+
+    for search_type in ("title", "author"):
+        for term in terms:
+            if not term.strip():
+                continue
+            expected = _search_books_linear(term.strip().lower(), search_type)
+            assert search_books_in_catalog(term, search_type) == expected, (term, search_type)
+
+def test_add_book_updates_index():
+    """Books added through add_book_to_catalog are searchable immediately."""
+    index = get_search_index()
+    before = len(index)
+    success, _ = add_book_to_catalog("Zebra Crossing Tales", "Quinn Xavier", "9781111111111", 2)
+
+    assert success is True
+    assert len(index) == before + 1
+    results = search_books_in_catalog("zebra cross", "title")
+    assert [b["title"] for b in results] == ["Zebra Crossing Tales"]
+
+def test_results_reflect_current_availability():
+    """Index hits are loaded from books, so availability is current."""
+    book_id = database.get_all_books()[0]["id"]
+    title = database.get_book_by_id(book_id)["title"]
+    database.update_book_availability(book_id, -1)
+
+    results = search_books_in_catalog(title, "title")
+    assert next(b for b in results if b["id"] == book_id)["available_copies"] == 0
+
+def test_index_ignored_for_other_database():
+    """An index built for another database file is not used."""
+    db_fd, other_path = tempfile.mkstemp()
+    try:
+        database.DATABASE = other_path
+        assert get_search_index() is None
+    finally:
+        os.close(db_fd)
+        os.remove(other_path)
@@ -0,0 +1,79 @@
+import pytest
+import tempfile
+import os
+import database
+from services.library_service import search_books_in_catalog, _search_books_linear
+
+BOOKS = [
+    ("The Great Gatsby", "F. Scott Fitzgerald", "9780743273565", 3),
+    ("To Kill a Mockingbird", "Harper Lee", "9780061120084", 2),
+    ("1984", "George Orwell", "9780451524935", 1),
+    ("Animal Farm", "George Orwell", "9780451526342", 2),
+    ("Great Expectations", "Charles Dickens", "9780141439563", 1),
+    ("Les Misérables", "Victor Hugo", "9780451419439", 1),
+]
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    """Set up a temp SQLite DB for search index tests."""
+    db_fd, db_path = tempfile.mkstemp()
+    original_database = database.DATABASE
+    database.DATABASE = db_path
+    database.init_database()
+
+    for title, author, isbn, copies in BOOKS:
+        database.insert_book(title, author, isbn, copies, copies)
+
+    yield
+
+    # Cleanup
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+@pytest.mark.parametrize("term,search_type", [
+    ("great", "title"), ("GREAT", "title"), ("eat g", "title"), ("mis", "title"),
+    ("MISÉR", "title"), ("orwell", "author"), ("george", "author"), ("ge", "author"),
+    ("a", "title"), ("nonexistent", "title"), ('"quoted"', "title"),
+])
+def test_search_matches_linear_scan(term, search_type):
+    """Indexed search returns exactly what the catalog scan returns, in the same order."""
+    expected = _search_books_linear(term.lower(), search_type)
+    assert search_books_in_catalog(term, search_type) == expected
+
+def test_search_index_is_used():
+    """Terms of 3+ characters are answered by the FTS index."""
+    results = database.search_books_fts("title", "great")
+    assert [b["title"] for b in results] == ["Great Expectations", "The Great Gatsby"]
+    assert database.search_books_fts("title", "gr") is None
+
+def test_new_books_are_searchable():
+    """The insert trigger keeps the index in sync with books."""
+    database.insert_book("Brave New World", "Aldous Huxley", "9780060850524", 1, 1)
+    results = search_books_in_catalog("huxley", "author")
+    assert [b["title"] for b in results] == ["Brave New World"]
+
+def test_availability_changes_are_reflected():
+    """Results are read from books, so availability is always current."""
+    book_id = database.get_book_by_isbn("9780451524935")["id"]
+    database.update_book_availability(book_id, -1)
+    results = search_books_in_catalog("1984", "title")
+    assert results[0]["available_copies"] == 0
+
+def test_isbn_search_uses_exact_match():
+    """ISBN search is an exact lookup, not a substring match."""
+    assert [b["title"] for b in search_books_in_catalog("9780451524935", "isbn")] == ["1984"]
+    assert search_books_in_catalog("978045152493", "isbn") == []
+
+def test_existing_books_indexed_on_migration():
+    """Creating the index on an existing database indexes the rows already there."""
+    conn = database.get_db_connection()
+    for trigger in ("books_fts_insert", "books_fts_delete", "books_fts_update"):
+        conn.execute(f"DROP TRIGGER {trigger}")
+    conn.execute("DROP TABLE books_fts")
+    conn.commit()
+    conn.close()
+
+    database.init_database()
+    assert len(database.search_books_fts("author", "orwell")) == 2
@@ -0,0 +1,160 @@
+import pytest
+import tempfile
+import os
+import threading
+import time
+import database
+from app import create_app
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    """Set up a temp SQLite DB with the default storage settings."""
+    db_fd, db_path = tempfile.mkstemp()
+    original_database = database.DATABASE
+    original_pragmas = dict(database.CONNECTION_PRAGMAS)
+    original_write_queue = database.WRITE_QUEUE
+    database.DATABASE = db_path
+    database.init_database()
+
+    yield
+
+    # Cleanup
+    database.CONNECTION_PRAGMAS.clear()
+    database.CONNECTION_PRAGMAS.update(original_pragmas)
+    database.WRITE_QUEUE = original_write_queue
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+def pragma(name):
+    conn = database.get_db_connection()
+    value = conn.execute(f'PRAGMA {name}').fetchone()[0]
+    conn.close()
+    return value
+
+def test_default_pragmas():
+    assert pragma('journal_mode') == 'wal'
+    assert pragma('synchronous') == 1  # NORMAL
+    assert pragma('busy_timeout') == 5000
+    assert pragma('cache_size') == -20000
+
+def test_configure_storage():
+    database.configure_storage(journal_mode='DELETE', synchronous='FULL', busy_timeout_ms=250,
+                               cache_size_kb=4000, write_queue=False)
+    assert pragma('journal_mode') == 'delete'
+    assert pragma('synchronous') == 2  # FULL
+    assert pragma('busy_timeout') == 250
+    assert database.get_connection_pool().writer is None
+
+def test_app_config_applies_storage_settings():
+    create_app({'SQLITE_BUSY_TIMEOUT_MS': 1234})
+    assert pragma('busy_timeout') == 1234
+
+def test_writes_share_one_connection():
+    first = database.get_db_connection(write=True)
+    raw = first._conn
+    first.close()
+    second = database.get_db_connection(write=True)
+    assert second._conn is raw
+    second.close()
+
+def test_writers_wait_in_line_without_blocking_readers():
+    holder = database.get_db_connection(write=True)
+    holder.execute('BEGIN IMMEDIATE')
+    holder.execute("INSERT INTO books (title, author, isbn, total_copies, available_copies) "
+                   "VALUES ('Queued', 'A', '1111111111111', 1, 1)")
+
+    order = []
+    def writer(n):
+        database.insert_book(f"Book {n}", "Author", f"{2000000000000 + n}", 1, 1)
+        order.append(n)
+    threads = []
+    for n in range(3):
+        thread = threading.Thread(target=writer, args=(n,))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.05)
+
+    # Readers are not blocked by the open write transaction (and don't see it yet)
+    assert database.get_all_books() == []
+    assert order == []
+
+    holder.commit()
+    holder.close()
+    for thread in threads:
+        thread.join()
+    assert order == [0, 1, 2]
+    assert len(database.get_all_books()) == 4
+
+def test_concurrent_writes_do_not_fail():
+    results = []
+    def borrow_and_return(n):
+        for i in range(10):
+            results.append(database.insert_borrow_record(f"{100000 + n}", 1, database.datetime.now(),
+                                                         database.datetime.now()))
+            results.append(database.update_borrow_record_return_date(f"{100000 + n}", 1, database.datetime.now()))
+    threads = [threading.Thread(target=borrow_and_return, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(results) and len(results) == 160
+
+def test_reentrant_write_is_an_error():
+    conn = database.get_db_connection(write=True)
+    try:
+        with pytest.raises(RuntimeError):
+            database.get_db_connection(write=True)
+    finally:
+        conn.close()
+
+def test_uncommitted_write_rolled_back_on_release():
+    conn = database.get_db_connection(write=True)
+    conn.execute("INSERT INTO books (title, author, isbn, total_copies, available_copies) "
+                 "VALUES ('Lost', 'A', '1111111111111', 1, 1)")
+    conn.close()
+    assert database.get_book_by_isbn('1111111111111') is None
+
+def test_failed_writer_connect_passes_the_turn_on(monkeypatch):
+    pool = database.get_connection_pool()
+    pool.writer.close()
+    pool.writer = database.WriteQueue(pool)
+    connect = pool._connect
+    calls = []
+
+    def failing_connect():
+        calls.append(1)
+        if len(calls) == 1:
+            raise database.sqlite3.OperationalError('unable to open database file')
+        return connect()
+
+    monkeypatch.setattr(pool, '_connect', failing_connect)
+    with pytest.raises(database.sqlite3.OperationalError):
+        database.insert_book('First', 'A', '2222222222222', 1, 1)
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(
+        database.insert_book('Second', 'A', '3333333333333', 1, 1)))
+    thread.start()
+    thread.join(timeout=5)
+    assert not thread.is_alive() and results == [True]
+
+def test_writer_wait_times_out_with_busy_timeout():
+    database.configure_storage(busy_timeout_ms=100)
+    held = database.get_db_connection(write=True)
+    errors = []
+
+    def wait_for_writer():
+        try:
+            database.get_db_connection(write=True).close()
+        except database.sqlite3.OperationalError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=wait_for_writer)
+    thread.start()
+    thread.join(timeout=5)
+    held.close()
+    assert not thread.is_alive() and len(errors) == 1
+    # The timed-out waiter left the line, so the writer is free again
+    database.get_db_connection(write=True).close()
@@ -0,0 +1,155 @@
+import pytest
+import tempfile
+import os
+import sqlite3
+import datetime
+import database
+from app import create_app
+from services.billing_service import calculate_all_late_fees
+
+# borrow_records as created before epoch timestamps (schema version 0)
+OLD_SCHEMA = '''
+    CREATE TABLE borrow_records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patron_id TEXT NOT NULL,
+        book_id INTEGER NOT NULL,
+        borrow_date TEXT NOT NULL,
+        due_date TEXT NOT NULL,
+        return_date TEXT,
+        FOREIGN KEY (book_id) REFERENCES books (id)
+    )
+'''
+
+NOW = datetime.datetime(2025, 3, 1, 12, 0, 0)
+
+@pytest.fixture
+def db_path():
+    """A temp database path, cleaned up afterwards."""
+    db_fd, db_path = tempfile.mkstemp()
+    original_database = database.DATABASE
+    database.DATABASE = db_path
+
+    yield db_path
+
+    # Cleanup
+    database.close_connection_pool()
+    database.DATABASE = original_database
+    os.close(db_fd)
+    os.remove(db_path)
+
+@pytest.fixture
+def old_database(db_path):
+    """A version 0 database with ISO text dates: one returned loan and two open ones."""
+    conn = sqlite3.connect(db_path)
+    conn.execute(OLD_SCHEMA)
+    rows = [
+        ('123456', 1, NOW - datetime.timedelta(days=30), NOW - datetime.timedelta(days=16),
+         NOW - datetime.timedelta(days=10)),
+        ('123456', 2, NOW - datetime.timedelta(days=20), NOW - datetime.timedelta(days=6), None),
+        ('654321', 1, NOW - datetime.timedelta(days=3), NOW + datetime.timedelta(days=11), None),
+    ]
+    conn.executemany(
+        'INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date) VALUES (?, ?, ?, ?, ?)',
+        [(p, b, bd.isoformat(), dd.isoformat(), rd.isoformat() if rd else None) for p, b, bd, dd, rd in rows]
+    )
+    conn.commit()
+    conn.close()
+    database.init_database(migrate=False)
+    for title, isbn in (('Book A', '1000000000001'), ('Book B', '1000000000002')):
+        database.insert_book(title, 'Author', isbn, 3, 2)
+    return db_path
+
+def stored_types():
+    conn = database.get_db_connection()
+    types = conn.execute(
+        'SELECT typeof(borrow_date), typeof(due_date), typeof(return_date) FROM borrow_records ORDER BY id'
+    ).fetchall()
+    conn.close()
+    return [tuple(row) for row in types]
+
+def test_new_database_stores_epoch_seconds(db_path):
+    database.init_database()
+    assert database.get_schema_version() == database.SCHEMA_VERSION
+
+    due_date = datetime.datetime(2025, 3, 15, 12, 0, 0)
+    assert database.insert_borrow_record('123456', 1, NOW, due_date)
+    assert stored_types() == [('integer', 'integer', 'null')]
+
+    conn = database.get_db_connection()
+    row = conn.execute('SELECT borrow_date, due_date FROM borrow_records').fetchone()
+    conn.close()
+    assert tuple(row) == (database.to_epoch(NOW), database.to_epoch(due_date))
+    assert database.get_open_loans() == [(1, '123456', 1, database.to_epoch(due_date))]
+
+def test_old_database_keeps_working_before_migration(old_database):
+    assert database.get_schema_version() == 0
+
+    # New rows follow the old format until the migration runs
+    assert database.insert_borrow_record('654321', 2, NOW, NOW + datetime.timedelta(days=14))
+    assert stored_types()[-1] == ('text', 'text', 'null')
+
+    books = database.get_patron_borrowed_books('123456')
+    assert [book['due_date'] for book in books] == [NOW - datetime.timedelta(days=6)]
+    fees = calculate_all_late_fees(now=NOW)
+    assert fees['loans'][0]['days_overdue'] == 6
+
+def test_migration_converts_rows_and_keeps_dict_shapes(old_database):
+    history_before = database.get_patron_borrow_history('123456')
+    borrowed_before = database.get_patron_borrowed_books('123456')
+    fees_before = calculate_all_late_fees(now=NOW)
+
+    progress = []
+    assert database.migrate_timestamps(batch_size=2, progress=lambda *p: progress.append(p)) == 3
+    assert progress == [(2, 3), (3, 3)]
+
+    assert database.get_schema_version() == database.SCHEMA_VERSION
+    assert stored_types() == [('integer', 'integer', 'integer'), ('integer', 'integer', 'null'),
+                              ('integer', 'integer', 'null')]
+    assert database.get_patron_borrow_history('123456') == history_before
+    assert database.get_patron_borrowed_books('123456') == borrowed_before
+    assert calculate_all_late_fees(now=NOW) == fees_before
+
+    # Indexes are rebuilt and new loans continue the ID sequence
+    assert not [r for r in database.audit_query_plans() if r['scans']]
+    assert database.insert_borrow_record('654321', 2, NOW, NOW + datetime.timedelta(days=14))
+    assert [loan[0] for loan in database.get_open_loans()] == [2, 3, 4]
+
+def test_migration_mirrors_writes_made_while_it_runs(old_database):
+    def write_between_batches(copied, total):
+        if copied == 1:
+            database.insert_borrow_record('777777', 1, NOW, NOW + datetime.timedelta(days=14))
+            database.update_borrow_record_return_date('654321', 1, NOW)
+
+    assert database.migrate_timestamps(batch_size=1, progress=write_between_batches) == 4
+
+    assert stored_types()[-1] == ('integer', 'integer', 'null')
+    history = database.get_patron_borrow_history('654321')
+    assert history[0]['return_date'] == NOW
+    assert [book['book_id'] for book in database.get_patron_borrowed_books('777777')] == [1]
+
+def test_migration_is_a_no_op_when_up_to_date(db_path):
+    database.init_database()
+    assert database.migrate_timestamps() == 0
+
+def test_text_dates_written_after_migration_are_still_read(db_path):
+    database.init_database()
+    database.insert_borrow_record('123456', 1, NOW - datetime.timedelta(days=20), NOW - datetime.timedelta(days=6))
+
+    # e.g. written by an older process, or by hand
+    conn = database.get_db_connection(write=True)
+    conn.execute('UPDATE borrow_records SET due_date = ?', ((NOW - datetime.timedelta(days=8)).isoformat(),))
+    conn.commit()
+    conn.close()
+
+    assert database.get_open_loans()[0][3] == database.to_epoch(NOW - datetime.timedelta(days=8))
+    assert calculate_all_late_fees(now=NOW)['loans'][0]['days_overdue'] == 8
+
+def test_migrate_db_command(old_database):
+    app = create_app({'SCHEMA_AUTO_MIGRATE': False})
+    assert database.get_schema_version() == 0
+
+    result = app.test_cli_runner().invoke(args=['migrate-db', '--batch-size', '10'])
+
+    assert result.exit_code == 0
+    assert 'Migrated 3 borrow record(s). Schema version 2.' in result.output
+    assert database.get_schema_version() == database.SCHEMA_VERSION